@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import NewHotel, HotelSummary, HotelRatingReview
+from .models import DeadLetter, NewHotel, HotelSummary, HotelRatingReview
 
 
 @admin.register(NewHotel)
@@ -19,3 +19,10 @@ class HotelSummaryAdmin(admin.ModelAdmin):
 class HotelRatingReviewAdmin(admin.ModelAdmin):
     list_display = ("property_id", "rating", "review")
     search_fields = ("property_id", "review")
+
+
+@admin.register(DeadLetter)
+class DeadLetterAdmin(admin.ModelAdmin):
+    list_display = ("command", "property_id", "error", "updated_at")
+    search_fields = ("property_id", "error")
+    list_filter = ("command",)
@@ -0,0 +1,100 @@
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Subquery
+from django.utils import timezone
+
+from management_app.models import LLMResponseCache
+
+
+class ResponseCache:
+    """
+    Persistent cache of parsed Gemini responses, keyed by prompt content.
+
+    Entries expire ``ttl`` seconds after they were stored, and ``prune``
+    evicts the least recently used entries beyond ``max_entries``. Hits and
+    misses are counted for the end-of-command report.
+    """
+
+    # New entries and hits are written in batches instead of one query each
+    WRITE_BATCH_SIZE = 500
+
+    def __init__(self, ttl=None, max_entries=None):
+        self.ttl = timedelta(
+            seconds=settings.LLM_CACHE_TTL if ttl is None else ttl
+        )
+        self.max_entries = (
+            settings.LLM_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        )
+        self.hits = 0
+        self.misses = 0
+        self._touched = []
+        self._pending = {}
+
+    @staticmethod
+    def make_key(model, prompt_version, prompt):
+        content = "\x1f".join([model, str(prompt_version), prompt])
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        entry = (
+            LLMResponseCache.objects.filter(
+                key=key, created_at__gte=timezone.now() - self.ttl
+            )
+            .only("response")
+            .first()
+        )
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._touched.append(key)
+        if len(self._touched) >= self.WRITE_BATCH_SIZE:
+            self.flush()
+        return entry.response
+
+    def set(self, key, response):
+        self._pending[key] = response
+        if len(self._pending) >= self.WRITE_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Write pending entries and mark buffered hits as recently used."""
+        now = timezone.now()
+        if self._pending:
+            LLMResponseCache.objects.bulk_create(
+                [
+                    LLMResponseCache(
+                        key=key, response=response, created_at=now, last_used_at=now
+                    )
+                    for key, response in self._pending.items()
+                ],
+                update_conflicts=True,
+                unique_fields=["key"],
+                update_fields=["response", "created_at", "last_used_at"],
+            )
+            self._pending = {}
+        if self._touched:
+            LLMResponseCache.objects.filter(key__in=self._touched).update(
+                last_used_at=now
+            )
+            self._touched = []
+
+    def prune(self):
+        """Drop expired entries, then the least recently used beyond ``max_entries``."""
+        self.flush()
+        LLMResponseCache.objects.filter(
+            created_at__lt=timezone.now() - self.ttl
+        ).delete()
+
+        overflow = LLMResponseCache.objects.order_by("-last_used_at").values("key")[
+            self.max_entries:
+        ]
+        LLMResponseCache.objects.filter(key__in=Subquery(overflow)).delete()
+
+    def report(self):
+        total = self.hits + self.misses
+        rate = (self.hits / total * 100) if total else 0.0
+        return f"Response cache: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate)"
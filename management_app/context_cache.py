@@ -0,0 +1,57 @@
+import threading
+import time
+
+
+class ContextCache:
+    """
+    Names of the Gemini ``cachedContents`` that hold each shared system
+    instruction, one per endpoint (cached contents belong to one API key and
+    one model).
+
+    An entry is created on first use through the ``create`` callable given
+    to ``get`` and created again ``refresh_margin`` seconds before its
+    ``ttl`` runs out. If creation fails (``create`` returns None, e.g. the
+    instruction is below the API's minimum size for caching) the
+    instruction is sent inline until the ``ttl`` has passed.
+    """
+
+    def __init__(self, ttl=3600, refresh_margin=60, clock=time.monotonic):
+        self.ttl = ttl
+        self.refresh_margin = min(refresh_margin, ttl / 2)
+        self._clock = clock
+        self._entries = {}
+        self._creating = {}  # One lock per key, held while its entry is created
+        self._lock = threading.Lock()
+
+    def get(self, key, create):
+        """Return the cached content name for ``key``, or None to send the instruction inline."""
+        with self._lock:
+            name = self._fresh(key)
+            if name is not False:
+                return name
+            creating = self._creating.setdefault(key, threading.Lock())
+
+        # Other threads needing this key wait for this one instead of creating
+        # duplicates; threads using other keys are not held up
+        with creating:
+            with self._lock:
+                name = self._fresh(key)
+            if name is not False:
+                return name
+
+            name = create()
+            with self._lock:
+                self._entries[key] = (name, self._clock() + self.ttl - self.refresh_margin)
+            return name
+
+    def _fresh(self, key):
+        # The entry's name (None if creation failed), or False if missing or expired
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] > self._clock():
+            return entry[0]
+        return False
+
+    def invalidate(self, key):
+        # The API no longer knows the entry (deleted or expired early)
+        with self._lock:
+            self._entries.pop(key, None)
@@ -0,0 +1,80 @@
+import threading
+import time
+
+
+class Endpoint:
+    """One API key and model, with its own rate limiter (i.e. its own quota)."""
+
+    def __init__(self, api_key, model, weight=1.0, rate_limiter=None):
+        self.api_key = api_key
+        self.model = model
+        self.weight = weight
+        self.rate_limiter = rate_limiter
+        self.in_flight = 0
+        self.failures = 0
+        self.unavailable_until = 0.0
+
+    def __repr__(self):
+        return f"<Endpoint {self.model} weight={self.weight}>"
+
+    def url(self, base_url):
+        return f"{base_url}/models/{self.model}:generateContent"
+
+    def load(self):
+        # Requests in flight per unit of capacity; a throttled limiter has less capacity
+        capacity = self.weight
+        if self.rate_limiter:
+            capacity *= self.rate_limiter.scale
+        return (self.in_flight + 1) / capacity
+
+
+class EndpointPool:
+    """
+    Routes each request to the least-loaded available endpoint.
+
+    An endpoint that answers 429, a server error or not at all is skipped
+    for ``failover_seconds`` (doubling with each failure in a row, up to
+    ``max_failover_seconds``), so its traffic fails over to the others.
+    When every endpoint is failing, the one that recovers first is used.
+    """
+
+    def __init__(
+        self,
+        endpoints,
+        failover_seconds=5.0,
+        max_failover_seconds=60.0,
+        clock=time.monotonic,
+    ):
+        if not endpoints:
+            raise ValueError("EndpointPool needs at least one endpoint")
+        self.endpoints = list(endpoints)
+        self.failover_seconds = failover_seconds
+        self.max_failover_seconds = max_failover_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Pick an endpoint for one request; pass it to ``release`` afterwards."""
+        with self._lock:
+            now = self._clock()
+            available = [
+                endpoint for endpoint in self.endpoints if endpoint.unavailable_until <= now
+            ]
+            if not available:
+                available = [min(self.endpoints, key=lambda endpoint: endpoint.unavailable_until)]
+            endpoint = min(available, key=Endpoint.load)
+            endpoint.in_flight += 1
+            return endpoint
+
+    def release(self, endpoint, failed=False):
+        with self._lock:
+            endpoint.in_flight -= 1
+            if failed:
+                endpoint.failures += 1
+                endpoint.unavailable_until = self._clock() + min(
+                    self.max_failover_seconds,
+                    self.failover_seconds * 2 ** (endpoint.failures - 1),
+                )
+            else:
+                endpoint.failures = 0
+                endpoint.unavailable_until = 0.0
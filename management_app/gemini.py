@@ -0,0 +1,494 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from requests.adapters import HTTPAdapter
+
+from management_app.context_cache import ContextCache
+from management_app.endpoints import Endpoint, EndpointPool
+from management_app.hedging import HedgePolicy
+from management_app.instrumentation import get_run_stats
+from management_app.metrics import (
+    LLM_CALL_SECONDS,
+    LLM_CALLS,
+    LLM_TOKENS,
+    RATE_LIMIT_WAIT_SECONDS,
+)
+from management_app.rate_limit import (
+    AdaptiveRateLimiter,
+    estimate_tokens,
+    get_rate_limiter,
+    parse_retry_after,
+)
+from management_app.retry import RETRYABLE_STATUSES, CircuitBreaker, RetryPolicy
+from management_app.profiling import phase
+from management_app.schemas import MalformedResponse
+
+logger = logging.getLogger(__name__)
+
+# Follow-up message for a reply that did not match the response schema
+REASK_PROMPT = (
+    "Your reply could not be used: {error}. "
+    "Reply again with only the corrected JSON."
+)
+
+
+def names_cached_content(response):
+    # Whether an error response is about the cachedContent the request referenced
+    try:
+        message = response.json().get("error", {}).get("message", "")
+    except ValueError:
+        return False
+    return "cachedcontent" in str(message).lower().replace(" ", "")
+
+
+def extract_text(data):
+    # Text of the first candidate in a generateContent response
+    return data.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
+
+
+class GeminiClient:
+    """
+    Gemini ``generateContent`` client built on one pooled, keep-alive session.
+
+    Each task passes its own ``parser``, which turns the response text into
+    the dict the management commands store. The client is safe to share
+    between worker threads.
+
+    Requests are spread over ``endpoints`` (API key and model pairs, each
+    with its own rate limiter), or go to the single ``api_key``/``model``
+    endpoint when none are given. An endpoint that fails is skipped for a
+    while, so retries fail over to the others.
+
+    Timeouts, connection errors and retryable statuses (429, 5xx) are
+    retried according to ``retry_policy``. Server errors and connection
+    failures also feed ``circuit_breaker``, which pauses every thread using
+    the client while the API is down.
+
+    With a ``hedge_policy``, a request that is still unanswered after the
+    tracked latency percentile is sent a second time and the first good
+    reply wins.
+
+    A ``system_instruction`` passed to ``generate`` is sent with every
+    request. With a ``context_cache`` it is registered once per endpoint as
+    cached content and later requests only reference it.
+
+    Every HTTP call and retry is recorded in the run stats (instrumentation.py)
+    and the metrics (metrics.py), labelled with the ``task`` passed to
+    ``generate``.
+    A ``debug_sample_rate`` fraction of the full responses is logged at
+    DEBUG level.
+    """
+
+    BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+
+    def __init__(
+        self,
+        api_key=None,
+        model=None,
+        base_url=BASE_URL,
+        connect_timeout=5.0,
+        read_timeout=60.0,
+        pool_size=10,
+        rate_limiter=None,
+        endpoints=None,
+        retry_policy=None,
+        circuit_breaker=None,
+        hedge_policy=None,
+        context_cache=None,
+        max_repairs=1,
+        debug_sample_rate=0.0,
+        sleep=time.sleep,
+        random=random.random,
+    ):
+        if endpoints is None:
+            endpoints = [Endpoint(api_key, model, rate_limiter=rate_limiter)]
+        self.endpoints = EndpointPool(endpoints)
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=1)
+        self.circuit_breaker = circuit_breaker
+        self.hedge_policy = hedge_policy
+        self.context_cache = context_cache
+        self.max_repairs = max_repairs
+        self.debug_sample_rate = debug_sample_rate
+        self._sleep = sleep
+        self._random = random
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._pool_size = pool_size
+
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def post(self, payload, prompt, task=None):
+        """Send one request (hedged if enabled) and return the raw response."""
+        if self.hedge_policy is None:
+            return self.send(payload, prompt, task)
+
+        self.hedge_policy.record_request()
+        delay = self.hedge_policy.delay()
+        if delay is None:
+            return self.send(payload, prompt, task)
+
+        executor = self.get_executor()
+        primary = executor.submit(self.send, payload, prompt, task)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self.hedge_policy.try_hedge():
+            return primary.result()
+
+        # The slower request is left to finish in the background
+        pending = {primary, executor.submit(self.send, payload, prompt, task)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and future.result().status_code == 200:
+                    return future.result()
+        return primary.result()
+
+    def get_executor(self):
+        # Threads for hedged calls, created on first use
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._pool_size * 2)
+            return self._executor
+
+    def send(self, payload, prompt, task=None, use_cache=True):
+        """Send one request to the least-loaded endpoint and return the raw response."""
+        endpoint = self.endpoints.acquire()
+        body = payload
+        cache_key = None
+        try:
+            instruction = payload.get("systemInstruction")
+            if use_cache and self.context_cache and instruction:
+                cache_key = (endpoint.api_key, endpoint.model, instruction["parts"][0]["text"])
+                name = self.context_cache.get(
+                    cache_key, lambda: self.create_cached_content(endpoint, instruction)
+                )
+                if name:
+                    body = {
+                        key: value
+                        for key, value in payload.items()
+                        if key != "systemInstruction"
+                    }
+                    body["cachedContent"] = name
+                else:
+                    cache_key = None
+
+            response, latency = self.call(
+                endpoint, endpoint.url(self.base_url), body, task, estimate_tokens(prompt)
+            )
+        except requests.exceptions.RequestException:
+            self.endpoints.release(endpoint, failed=True)
+            raise
+        except BaseException:
+            self.endpoints.release(endpoint)
+            raise
+        self.endpoints.release(
+            endpoint,
+            failed=response.status_code == 429 or response.status_code >= 500,
+        )
+
+        if self.hedge_policy and response.status_code == 200:
+            self.hedge_policy.record_latency(latency)
+
+        if cache_key and response.status_code in (400, 403, 404) and names_cached_content(response):
+            # The cached content expired or was deleted: send the instruction inline
+            self.context_cache.invalidate(cache_key)
+            return self.send(payload, prompt, task, use_cache=False)
+        return response
+
+    def call(self, endpoint, url, body, task=None, reserved_tokens=0):
+        """
+        POST ``body`` to ``url`` with ``endpoint``'s key once its rate limiter
+        allows it, record the call, and return the response and its latency.
+        """
+        rate_limiter = endpoint.rate_limiter
+        if rate_limiter:
+            waited = rate_limiter.acquire(reserved_tokens)
+            RATE_LIMIT_WAIT_SECONDS.observe(waited, model=endpoint.model)
+
+        started = time.monotonic()
+        try:
+            with phase("http"):
+                response = self.session.post(
+                    url,
+                    json=body,
+                    headers={"x-goog-api-key": endpoint.api_key},
+                    timeout=self.timeout,
+                )
+        except requests.exceptions.RequestException:
+            self.record_call(task, endpoint.model, "error", time.monotonic() - started)
+            raise
+        latency = time.monotonic() - started
+
+        usage = {}
+        if response.status_code == 200:
+            usage = response.json().get("usageMetadata", {})
+        self.record_call(task, endpoint.model, response.status_code, latency, usage)
+
+        if rate_limiter:
+            rate_limiter.record_response(
+                response.status_code,
+                retry_after=parse_retry_after(response.headers.get("Retry-After")),
+                reserved_tokens=reserved_tokens,
+                used_tokens=usage.get("totalTokenCount"),
+            )
+        return response, latency
+
+    def record_call(self, task, model, status, latency, usage=None):
+        usage = usage or {}
+        prompt_tokens = usage.get("promptTokenCount") or 0
+        output_tokens = usage.get("candidatesTokenCount") or 0
+        get_run_stats().record_call(latency, status, prompt_tokens, output_tokens)
+
+        task = task or "other"
+        LLM_CALLS.inc(task=task, model=model, status=status)
+        LLM_CALL_SECONDS.observe(latency, task=task, model=model)
+        if prompt_tokens:
+            LLM_TOKENS.inc(prompt_tokens, task=task, model=model, kind="prompt")
+        if output_tokens:
+            LLM_TOKENS.inc(output_tokens, task=task, model=model, kind="output")
+
+    def create_cached_content(self, endpoint, instruction):
+        """Register ``instruction`` as cached content for ``endpoint``; return its name or None."""
+        body = {
+            "model": f"models/{endpoint.model}",
+            "systemInstruction": instruction,
+            "ttl": f"{self.context_cache.ttl:g}s",
+        }
+        response = self.call_with_retries(
+            lambda: self.call(
+                endpoint,
+                f"{self.base_url}/cachedContents",
+                body,
+                task="cached_content",
+                reserved_tokens=estimate_tokens(instruction["parts"][0]["text"]),
+            )[0],
+            use_breaker=False,
+        )
+        if response is None:
+            logger.warning("Could not cache the system instruction; sending it inline")
+            return None
+        return response.json().get("name")
+
+    def generate(
+        self,
+        prompt,
+        parser,
+        response_mime_type=None,
+        response_schema=None,
+        system_instruction=None,
+        task=None,
+    ):
+        """
+        Return ``parser(text)`` for the model's answer, or None if the call failed.
+
+        Pass ``response_mime_type="application/json"`` to ask for JSON output,
+        and ``response_schema`` to have it follow a schema. If ``parser``
+        raises ``MalformedResponse``, the model is asked to correct its reply,
+        with the reason in the follow-up message, up to ``max_repairs`` times;
+        after that the last ``MalformedResponse`` is raised.
+
+        ``system_instruction`` holds the instructions shared by every prompt
+        of a task, so that only ``prompt`` changes from call to call.
+        ``task`` names the task in the metrics.
+        """
+        generation_config = {}
+        if response_mime_type:
+            generation_config["responseMimeType"] = response_mime_type
+        if response_schema:
+            generation_config["responseSchema"] = response_schema
+
+        contents = [{"role": "user", "parts": [{"text": prompt}]}]
+        for repair in range(self.max_repairs + 1):
+            text = self.request(
+                contents, generation_config, prompt, system_instruction, task
+            )
+            if text is None:
+                return None
+            try:
+                with phase("parse"):
+                    return parser(text)
+            except MalformedResponse as e:
+                error = e
+                logger.warning("Malformed response (%s)", e)
+                contents = contents + [
+                    {"role": "model", "parts": [{"text": text}]},
+                    {"role": "user", "parts": [{"text": REASK_PROMPT.format(error=e)}]},
+                ]
+        raise error
+
+    def request(
+        self, contents, generation_config, prompt, system_instruction=None, task=None
+    ):
+        """Return the text of the model's answer, retrying failed calls, or None."""
+        payload = {"contents": contents}
+        if system_instruction:
+            payload["systemInstruction"] = {"parts": [{"text": system_instruction}]}
+        if generation_config:
+            payload["generationConfig"] = generation_config
+
+        response = self.call_with_retries(lambda: self.post(payload, prompt, task))
+        if response is None:
+            return None
+        return extract_text(response.json())
+
+    def call_with_retries(self, call, use_breaker=True):
+        """
+        Return the response of ``call()`` once it is a 200, or None if it
+        failed for good, retrying and feeding the circuit breaker as needed.
+
+        Pass ``use_breaker=False`` for a call made on behalf of a request
+        that already went through the breaker: it may run on another thread
+        (hedging) while that request is the half-open probe.
+        """
+        breaker = self.circuit_breaker if use_breaker else None
+        for attempt in range(self.retry_policy.max_attempts):
+            if attempt:
+                get_run_stats().record_retry()
+            if breaker:
+                breaker.before_call()
+
+            retry_after = None
+            try:
+                response = call()
+            except requests.exceptions.RequestException as e:
+                logger.warning("Request failed: %s", e)
+                if breaker:
+                    breaker.record_failure()
+            except BaseException:
+                # An unexpected error must not leave a probe in flight forever
+                if breaker:
+                    breaker.release_probe()
+                raise
+            else:
+                self.log_response(response)
+                if response.status_code == 200:
+                    if breaker:
+                        breaker.record_success()
+                    return response
+
+                logger.warning("Error: %s - %s", response.status_code, response.text)
+                if breaker:
+                    if response.status_code >= 500:
+                        breaker.record_failure()
+                    elif response.status_code == 429:
+                        # Handled by the rate limiter; only settles a probe
+                        breaker.record_throttled()
+                    else:
+                        # The API is up
+                        breaker.record_success()
+                if response.status_code not in RETRYABLE_STATUSES:
+                    return None
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+
+            if attempt + 1 < self.retry_policy.max_attempts:
+                self._sleep(self.retry_policy.delay(attempt, retry_after))
+
+        return None
+
+    def log_response(self, response):
+        # Opt-in sample of full responses (GEMINI_DEBUG_SAMPLE_RATE)
+        if self.debug_sample_rate and self._random() < self.debug_sample_rate:
+            logger.debug("Gemini response %s: %s", response.status_code, response.text)
+
+
+def get_endpoints():
+    """Endpoints from GEMINI_ENDPOINTS, or the single GEMINI_API_KEY/GEMINI_MODEL one."""
+    # Stop before the first call rather than failing every hotel with a 400/403
+    if not settings.GEMINI_ENDPOINTS:
+        if not settings.GEMINI_API_KEY:
+            raise ImproperlyConfigured(
+                "Set the GEMINI_API_KEY (or GEMINI_ENDPOINTS) environment variable"
+            )
+        return [
+            Endpoint(
+                settings.GEMINI_API_KEY,
+                settings.GEMINI_MODEL,
+                rate_limiter=get_rate_limiter(),
+            )
+        ]
+    if not all(config.get("api_key") for config in settings.GEMINI_ENDPOINTS):
+        raise ImproperlyConfigured("Every GEMINI_ENDPOINTS entry needs an api_key")
+    return [
+        Endpoint(
+            config["api_key"],
+            config.get("model", settings.GEMINI_MODEL),
+            weight=config.get("weight", 1.0),
+            rate_limiter=AdaptiveRateLimiter(
+                config.get("requests_per_minute", settings.GEMINI_REQUESTS_PER_MINUTE),
+                config.get("tokens_per_minute", settings.GEMINI_TOKENS_PER_MINUTE),
+            ),
+        )
+        for config in settings.GEMINI_ENDPOINTS
+    ]
+
+
+def get_models():
+    """Sorted names of the models that requests can be sent to."""
+    if not settings.GEMINI_ENDPOINTS:
+        return [settings.GEMINI_MODEL]
+    return sorted(
+        {config.get("model", settings.GEMINI_MODEL) for config in settings.GEMINI_ENDPOINTS}
+    )
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_gemini_client():
+    """Return the client shared by every command in this process."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = GeminiClient(
+                endpoints=get_endpoints(),
+                connect_timeout=settings.GEMINI_CONNECT_TIMEOUT,
+                read_timeout=settings.GEMINI_READ_TIMEOUT,
+                pool_size=settings.GEMINI_POOL_SIZE,
+                retry_policy=RetryPolicy(
+                    max_attempts=settings.GEMINI_MAX_ATTEMPTS,
+                    base_delay=settings.GEMINI_RETRY_BASE_DELAY,
+                    max_delay=settings.GEMINI_RETRY_MAX_DELAY,
+                ),
+                circuit_breaker=CircuitBreaker(
+                    failure_threshold=settings.GEMINI_CIRCUIT_FAILURE_THRESHOLD,
+                    reset_timeout=settings.GEMINI_CIRCUIT_RESET_TIMEOUT,
+                ),
+                hedge_policy=(
+                    HedgePolicy(
+                        percentile=settings.GEMINI_HEDGE_PERCENTILE,
+                        budget=settings.GEMINI_HEDGE_BUDGET,
+                    )
+                    if settings.GEMINI_HEDGE_PERCENTILE
+                    else None
+                ),
+                context_cache=(
+                    ContextCache(ttl=settings.GEMINI_CONTEXT_CACHE_TTL)
+                    if settings.GEMINI_CONTEXT_CACHE_TTL
+                    else None
+                ),
+                max_repairs=settings.GEMINI_MAX_REPAIRS,
+                debug_sample_rate=settings.GEMINI_DEBUG_SAMPLE_RATE,
+            )
+        return _client
+
+
+@receiver(setting_changed)
+def reset_gemini_client(setting, **kwargs):
+    global _client
+    if setting.startswith("GEMINI_"):
+        with _client_lock:
+            _client = None
@@ -0,0 +1,549 @@
+import operator
+import signal
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from functools import reduce
+from itertools import islice
+
+from django.core.management import load_command_class
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from management_app.cache import ResponseCache
+from management_app.gemini import get_models
+from management_app.instrumentation import get_run_stats, recording_run
+from management_app.metrics import exporting_metrics
+from management_app.models import DeadLetter, GenerationRun, NewHotel
+from management_app.profiling import ProfiledCommand, phase
+from management_app.prompts import render_batch_prompt
+from management_app.runs import RunTracker
+from management_app.schemas import MalformedResponse
+from management_app.singleflight import SingleFlight
+from management_app.write_buffer import WriteBuffer
+
+
+def run_concurrently(func, items, concurrency=1):
+    """
+    Yield ``(item, func(item))`` pairs in the same order as ``items``.
+
+    With ``concurrency`` > 1 the calls run on a bounded thread pool; at most
+    ``2 * concurrency`` calls are queued ahead of the consumer, so results are
+    handed back (and written to the database) on the calling thread only.
+    """
+    if concurrency <= 1:
+        for item in items:
+            yield item, func(item)
+        return
+
+    pending = deque()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        for item in items:
+            pending.append((item, executor.submit(func, item)))
+            if len(pending) >= concurrency * 2:
+                done_item, future = pending.popleft()
+                yield done_item, future.result()
+
+        while pending:
+            done_item, future = pending.popleft()
+            yield done_item, future.result()
+    finally:
+        # Drop queued calls if the consumer stops early (error or Ctrl+C)
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+@contextmanager
+def interrupt_on_sigterm():
+    """
+    Turn SIGTERM (``docker stop``) into a KeyboardInterrupt while the block
+    runs, so a stopped container flushes its buffers and checkpoints like
+    Ctrl+C does.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        # Signal handlers can only be installed from the main thread
+        yield
+        return
+
+    def interrupt(signum, frame):
+        raise KeyboardInterrupt
+
+    previous = signal.signal(signal.SIGTERM, interrupt)
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+
+
+def chunked(items, size):
+    # Split an iterable into lists of at most ``size`` items
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def load_generation_command(name, stdout, stderr, **options):
+    """
+    Load generation command ``name`` to be driven by another command, set up
+    with its default options updated with ``options``.
+    """
+    command = load_command_class("management_app", name)
+    command.stdout = stdout
+    command.stderr = stderr
+    parser = command.create_parser("manage.py", name)
+    command.setup({**vars(parser.parse_args([])), **options})
+    return command
+
+
+# One hotel's request; ``cached`` holds the response when the cache had it
+Job = namedtuple("Job", ["hotel", "prompt", "cache_key", "cached"])
+
+# Answer that still failed validation after the repair attempts
+Rejected = namedtuple("Rejected", ["reason"])
+
+
+class GenerationCommand(ProfiledCommand):
+    """
+    Base class for the commands that send one Gemini request per hotel.
+
+    Subclasses implement ``build_prompt``, ``query`` and ``save_result``;
+    ``save_result`` returns None on success or the error message (see
+    ``fail``) when the hotel could not be processed. API calls may run on
+    worker threads; everything touching the database (including the
+    response cache) runs on the command's own thread.
+
+    Every run is checkpointed in ``GenerationRun``/``GenerationTask``: the
+    hotels to process are recorded when the run starts, and ``--resume``
+    continues a run with only the hotels that are not done yet. With
+    ``--enqueue`` the run is only recorded, and ``generation_worker``
+    processes shared by several containers work through it. Hotels that
+    fail are kept in the ``DeadLetter`` table until a later run succeeds
+    (``--only-failed`` processes just those).
+
+    Answers that still fail validation after the client's repair attempts
+    arrive as ``Rejected`` and are never passed to ``save_result``.
+
+    Hotels with identical prompts share one request (``SingleFlight``):
+    duplicates wait for the call already in flight, or reuse its answer
+    later in the run, unless ``--no-coalesce`` is given.
+
+    Commands that set ``cache_responses`` reuse stored responses for prompts
+    they have already sent; ``prompt_version`` is part of the cache key and
+    ``is_complete`` decides which responses are worth storing.
+
+    Commands that set ``batch_prompt`` also accept ``--batch-size``: several
+    hotels are sent in one JSON prompt (``query_batch``), each answer is
+    turned into a normal response by ``parse_batch_item``, and hotels missing
+    from the reply fall back to a single-hotel call.
+
+    ``output_models`` lists the tables a command writes per hotel. Each row
+    records the hotel fingerprint and prompt version it was made from, and
+    ``--only-stale`` skips hotels whose rows are all still current.
+
+    Hotels are streamed in chunks of ``chunk_size`` (through a server-side
+    cursor on PostgreSQL), loading only ``hotel_fields``, so memory stays
+    flat however large the table is.
+
+    Commands that set ``buffered_model`` pass their rows to ``self.buffer``,
+    a ``WriteBuffer`` that writes them in bulk every ``--flush-rows`` hotels
+    or ``--flush-seconds`` seconds.
+
+    Each run ends with a performance report (API call and query latencies,
+    tokens, throughput), also saved as JSON with ``--stats-json``. The same
+    figures feed the Prometheus metrics (metrics.py), served during the run
+    with ``--metrics-port``.
+    """
+
+    cache_responses = False
+    prompt_version = None
+    batch_prompt = None
+    output_models = ()
+    buffered_model = None
+    hotel_fields = (
+        "id",
+        "property_id",
+        "name",
+        "city_name",
+        "description",
+        "content_fingerprint",
+    )
+    chunk_size = 2000
+    # Options a queued run passes on to the workers that process it
+    queued_options = (
+        "batch_size",
+        "no_cache",
+        "no_coalesce",
+        "flush_rows",
+        "flush_seconds",
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=1,
+            help="Number of Gemini requests to run in parallel (default: 1)",
+        )
+        parser.add_argument(
+            "--resume",
+            type=int,
+            metavar="RUN_ID",
+            help="Continue an earlier run, skipping the hotels it already finished",
+        )
+        parser.add_argument(
+            "--no-coalesce",
+            action="store_true",
+            help="Send one request per hotel even when several hotels have the same prompt",
+        )
+        parser.add_argument(
+            "--only-failed",
+            action="store_true",
+            help="Only process the hotels in the dead-letter table (see replay_failed)",
+        )
+        parser.add_argument(
+            "--enqueue",
+            action="store_true",
+            help=(
+                "Only record the hotels to process as a queued run, to be "
+                "processed by generation_worker"
+            ),
+        )
+        parser.add_argument(
+            "--stats-json",
+            metavar="PATH",
+            help="Also write the end-of-run performance report to this JSON file",
+        )
+        parser.add_argument(
+            "--metrics-port",
+            type=int,
+            metavar="PORT",
+            help="Serve Prometheus metrics on this port at /metrics while running",
+        )
+        if self.batch_prompt:
+            parser.add_argument(
+                "--batch-size",
+                type=int,
+                default=1,
+                help="Number of hotels to send in one Gemini request (default: 1)",
+            )
+        if self.cache_responses:
+            parser.add_argument(
+                "--no-cache",
+                action="store_true",
+                help="Ignore cached responses and query the API for every hotel",
+            )
+        if self.buffered_model:
+            parser.add_argument(
+                "--flush-rows",
+                type=int,
+                default=500,
+                help="Write buffered results every N hotels (default: 500)",
+            )
+            parser.add_argument(
+                "--flush-seconds",
+                type=float,
+                default=5.0,
+                help="Write buffered results at least every N seconds (default: 5)",
+            )
+        if self.output_models:
+            parser.add_argument(
+                "--only-stale",
+                action="store_true",
+                help=(
+                    "Only process hotels that changed, or whose output was made "
+                    "with an older prompt version"
+                ),
+            )
+
+    @property
+    def command_name(self):
+        return self.__module__.rsplit(".", 1)[-1]
+
+    def get_hotels(self):
+        hotels = NewHotel.objects.only(*self.hotel_fields).order_by("id")
+        if self.options.get("only_stale"):
+            hotels = hotels.filter(self.stale_condition())
+        if self.options.get("only_failed"):
+            hotels = hotels.filter(
+                Exists(
+                    DeadLetter.objects.filter(
+                        command=self.command_name, property_id=OuterRef("property_id")
+                    )
+                )
+            )
+        return hotels
+
+    def run_hotels(self):
+        # Hotels of the current run that still have to be processed
+        return (
+            NewHotel.objects.only(*self.hotel_fields)
+            .filter(self.tracker.open_condition())
+            .order_by("id")
+        )
+
+    def stale_condition(self):
+        # A hotel is stale if any of its outputs is missing or out of date
+        return reduce(
+            operator.or_,
+            [
+                ~Exists(
+                    model.objects.filter(
+                        property_id=OuterRef("property_id"),
+                        source_fingerprint=OuterRef("content_fingerprint"),
+                        prompt_version=self.prompt_version,
+                    )
+                )
+                for model in self.output_models
+            ],
+        )
+
+    def build_prompt(self, hotel):
+        raise NotImplementedError
+
+    def query(self, prompt):
+        raise NotImplementedError
+
+    def query_batch(self, prompt):
+        raise NotImplementedError
+
+    def parse_batch_item(self, item):
+        raise NotImplementedError
+
+    def is_complete(self, response):
+        return bool(response)
+
+    def save_result(self, hotel, response):
+        raise NotImplementedError
+
+    def fail(self, message):
+        # Report a hotel that could not be processed; save_result returns this
+        self.stderr.write(message)
+        return message
+
+    def report_write_error(self, label, error):
+        self.stderr.write(f"Error saving result for hotel: {label}. Error: {error}")
+
+    def write_failed(self, obj, label, error):
+        self.report_write_error(label, error)
+        self.tracker.record(obj.property_id, str(error))
+
+    def finish(self):
+        pass
+
+    def prepare(self, hotel):
+        with phase("prompt"):
+            prompt = self.build_prompt(hotel)
+        cache_key = cached = None
+        if self.cache is not None:
+            # Keyed on every configured model: any of them may answer the prompt
+            cache_key = ResponseCache.make_key(
+                ",".join(get_models()), self.prompt_version, prompt
+            )
+            cached = self.cache.get(cache_key)
+        return Job(hotel, prompt, cache_key, cached)
+
+    def ask(self, prompt):
+        if self.flights is None:
+            return self.query_checked(prompt)
+        return self.flights.do(prompt, self.query_checked, prompt)
+
+    def query_checked(self, prompt):
+        try:
+            return self.query(prompt)
+        except MalformedResponse as e:
+            return Rejected(str(e))
+
+    def is_reusable(self, response):
+        return not isinstance(response, Rejected) and self.is_complete(response)
+
+    def fetch(self, job):
+        if job.cached is not None:
+            return job.cached
+        return self.ask(job.prompt)
+
+    def fetch_batch(self, jobs):
+        # Hotels with the same prompt are sent once and share the answer
+        pending = {}
+        for job in jobs:
+            if job.cached is None:
+                pending.setdefault(job.prompt, job.hotel)
+        answers = {}
+        if len(pending) > 1:
+            prompt = render_batch_prompt(self.batch_prompt, list(pending.values()))
+            answers = self.query_batch(prompt) or {}
+
+        responses = []
+        for job in jobs:
+            if job.cached is not None:
+                responses.append(job.cached)
+                continue
+
+            response = None
+            property_id = pending[job.prompt].property_id
+            if property_id in answers:
+                response = self.parse_batch_item(answers[property_id])
+            if not self.is_complete(response):
+                # Missing or unusable in the batch reply: ask for this hotel alone
+                response = self.ask(job.prompt)
+            responses.append(response)
+        return responses
+
+    def start_run(self, options):
+        if options.get("resume"):
+            return RunTracker.resume(
+                options["resume"], self.command_name, **self.tracker_options()
+            )
+        return RunTracker.start(
+            self.command_name,
+            self.get_hotels(),
+            chunk_size=self.chunk_size,
+            **self.tracker_options(),
+        )
+
+    def tracker_options(self):
+        # Outcomes of buffered rows are only recorded once the rows are written
+        return {"auto_flush": not self.buffered_model}
+
+    def setup(self, options):
+        self.options = options
+        self.cache = None
+        if self.cache_responses and not options["no_cache"]:
+            self.cache = ResponseCache()
+        self.flights = None
+        if not options.get("no_coalesce"):
+            self.flights = SingleFlight(keep=self.is_reusable)
+
+    def enqueue(self, options):
+        run_options = {
+            name: options[name] for name in self.queued_options if name in options
+        }
+        tracker = RunTracker.start(
+            self.command_name,
+            self.get_hotels(),
+            chunk_size=self.chunk_size,
+            status=GenerationRun.Status.QUEUED,
+            options=run_options,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Generation run {tracker.run.pk} queued with "
+                f"{tracker.run.tasks.count()} hotels"
+            )
+        )
+
+    def handle(self, *args, **options):
+        if options["enqueue"]:
+            if options["resume"]:
+                raise CommandError("--enqueue and --resume cannot be used together")
+            self.setup(options)
+            self.enqueue(options)
+            return
+
+        self.setup(options)
+        with interrupt_on_sigterm(), exporting_metrics(
+            self.command_name, options["metrics_port"]
+        ), recording_run(self.stdout.write, options["stats_json"], [self.cache]):
+            self.tracker = self.start_run(options)
+            self.stdout.write(f"Generation run {self.tracker.run.pk}")
+
+            status = GenerationRun.Status.FAILED
+            try:
+                self.process_hotels(self.run_hotels())
+                status = GenerationRun.Status.COMPLETED
+            except KeyboardInterrupt:
+                status = GenerationRun.Status.INTERRUPTED
+                raise
+            finally:
+                self.tracker.finish(status)
+
+            self.stdout.write(self.tracker.report())
+            self.end()
+
+    def end(self):
+        if self.flights is not None and self.flights.coalesced:
+            self.stdout.write(
+                f"Duplicate prompts: {self.flights.coalesced} hotels reused another hotel's answer"
+            )
+        if self.cache is not None:
+            self.cache.prune()
+            self.stdout.write(self.cache.report())
+
+        self.finish()
+
+    def process_hotels(self, hotels):
+        """Generate and save results for ``hotels``, recording each outcome in ``self.tracker``."""
+        with ExitStack() as stack:
+            self.open_writes(stack)
+            self.process(hotels)
+
+    def open_writes(self, stack):
+        # Buffered rows, outcomes and cache entries are written when ``stack``
+        # closes, even if the run is interrupted; outcomes last, once the rows are in
+        self.buffer = None
+        if self.buffered_model:
+            self.buffer = WriteBuffer(
+                self.buffered_model,
+                max_rows=self.options["flush_rows"],
+                max_seconds=self.options["flush_seconds"],
+                on_error=self.write_failed,
+                on_flush=self.tracker.flush,
+            )
+
+        stack.callback(self.tracker.flush)
+        if self.buffer is not None:
+            stack.enter_context(self.buffer)
+        if self.cache is not None:
+            stack.callback(self.cache.flush)
+
+    def process(self, hotels):
+        hotels = hotels.iterator(chunk_size=self.chunk_size)
+        work = (self.prepare(hotel) for hotel in hotels)
+        batch_size = self.options.get("batch_size", 1)
+        concurrency = self.options["concurrency"]
+        if batch_size > 1:
+            batches = run_concurrently(
+                self.fetch_batch, chunked(work, batch_size), concurrency
+            )
+            results = (
+                (job, response)
+                for jobs, responses in batches
+                for job, response in zip(jobs, responses)
+            )
+        else:
+            results = run_concurrently(self.fetch, work, concurrency)
+        for job, response in results:
+            self.handle_response(job, response)
+
+    def handle_response(self, job, response):
+        """Save one hotel's response and record the outcome; return the error message, if any."""
+        property_id = job.hotel.property_id
+        if self.buffer is not None:
+            # Record the hotel before its row is queued: if adding the row
+            # flushes the buffer and the write fails, write_failed replaces
+            # this outcome with the error instead of the other way round
+            self.tracker.record(property_id, None)
+            error = self.save_response(job, response)
+            if error is not None:
+                self.tracker.record(property_id, error)
+        else:
+            # The output and the outcome are committed together, so a
+            # restarted run never sends a hotel whose output is already saved
+            with transaction.atomic():
+                error = self.save_response(job, response)
+                self.tracker.record(property_id, error)
+                self.tracker.flush()
+        get_run_stats().record_hotel(error)
+        return error
+
+    def save_response(self, job, response):
+        if isinstance(response, Rejected):
+            return self.fail(
+                f"Invalid output for hotel: {job.hotel.name}. Reason: {response.reason}"
+            )
+        if job.cache_key and job.cached is None and self.is_complete(response):
+            self.cache.set(job.cache_key, response)
+        return self.save_result(job.hotel, response)
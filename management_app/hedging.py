@@ -0,0 +1,48 @@
+import threading
+from collections import deque
+
+from management_app.instrumentation import percentile
+
+
+class HedgePolicy:
+    """
+    Decides when a slow Gemini call gets a duplicate ("hedged") request.
+
+    Latencies of recent successful calls are kept in a sliding window. A
+    call still unanswered after the ``percentile`` latency (e.g. p95) may be
+    sent again, as long as hedges stay within ``budget`` (a fraction of all
+    requests), so the extra load on the quota is bounded.
+    """
+
+    def __init__(self, percentile=95, budget=0.05, window=500, min_samples=20):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.requests = 0
+        self.hedges = 0
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record_latency(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def delay(self):
+        """Seconds to wait before hedging, or None until enough calls were timed."""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            latencies = sorted(self._latencies)
+        return percentile(latencies, self.percentile)
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def try_hedge(self):
+        """Reserve one hedge if the budget allows it."""
+        with self._lock:
+            if self.hedges + 1 > self.budget * self.requests:
+                return False
+            self.hedges += 1
+            return True
@@ -0,0 +1,186 @@
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import connection
+from management_app.metrics import db_query_wrapper, query_kind
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of sorted ``values`` (None if empty)."""
+    if not values:
+        return None
+    rank = math.ceil(pct / 100 * len(values))
+    return values[max(0, rank - 1)]
+
+
+class Reservoir:
+    """
+    Uniform random sample of at most ``size`` latencies (reservoir sampling),
+    and the count of all of them, so a long run keeps a flat memory.
+    """
+
+    def __init__(self, size=10000, random=random.random):
+        self.size = size
+        self.count = 0
+        self.values = []
+        self._random = random
+
+    def add(self, value):
+        self.count += 1
+        if len(self.values) < self.size:
+            self.values.append(value)
+            return
+        index = int(self._random() * self.count)
+        if index < self.size:
+            self.values[index] = value
+
+
+def latency_summary(reservoir):
+    latencies = sorted(reservoir.values)
+    return {
+        "count": reservoir.count,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+    }
+
+
+def format_latency(summary):
+    if not summary["count"]:
+        return "none"
+    return (
+        f"{summary['count']} (p50 {summary['p50']:.3f}s, "
+        f"p95 {summary['p95']:.3f}s, p99 {summary['p99']:.3f}s)"
+    )
+
+
+class RunStats:
+    """
+    Performance figures of the current run, shared by every thread.
+
+    ``GeminiClient`` records each HTTP call (latency, status and the token
+    counts of ``usageMetadata``) and each retry; ``db_wrapper``, installed
+    with ``connection.execute_wrapper``, times every query; the generation
+    commands count the hotels they handle. ``report`` and ``as_dict``
+    summarize everything recorded since ``reset`` (see ``recording_run``).
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = self._clock()
+            self.call_latencies = Reservoir()
+            self.statuses = Counter()
+            self.retries = 0
+            self.prompt_tokens = 0
+            self.output_tokens = 0
+            self.read_latencies = Reservoir()
+            self.write_latencies = Reservoir()
+            self.hotels = 0
+            self.failures = 0
+
+    def record_call(self, seconds, status, prompt_tokens=0, output_tokens=0):
+        # ``status`` is the HTTP status, or "error" for a failed connection
+        with self._lock:
+            self.call_latencies.add(seconds)
+            self.statuses[str(status)] += 1
+            self.prompt_tokens += prompt_tokens or 0
+            self.output_tokens += output_tokens or 0
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def record_query(self, sql, seconds):
+        is_write = query_kind(sql) == "write"
+        with self._lock:
+            (self.write_latencies if is_write else self.read_latencies).add(seconds)
+
+    def record_hotel(self, error=None):
+        with self._lock:
+            self.hotels += 1
+            if error:
+                self.failures += 1
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        started = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record_query(sql, time.monotonic() - started)
+
+    def as_dict(self, caches=()):
+        with self._lock:
+            elapsed = self._clock() - self.started
+            data = {
+                "elapsed_seconds": round(elapsed, 3),
+                "hotels": self.hotels,
+                "failures": self.failures,
+                "hotels_per_second": round(self.hotels / elapsed, 3) if elapsed else None,
+                "api_calls": latency_summary(self.call_latencies),
+                "statuses": dict(sorted(self.statuses.items())),
+                "retries": self.retries,
+                "prompt_tokens": self.prompt_tokens,
+                "output_tokens": self.output_tokens,
+                "db_reads": latency_summary(self.read_latencies),
+                "db_writes": latency_summary(self.write_latencies),
+            }
+        if caches:
+            data["cache_hits"] = sum(cache.hits for cache in caches)
+            data["cache_misses"] = sum(cache.misses for cache in caches)
+        return data
+
+    def report(self):
+        data = self.as_dict()
+        statuses = ", ".join(f"{status}: {count}" for status, count in data["statuses"].items())
+        lines = [
+            f"Performance: {data['hotels']} hotels in {data['elapsed_seconds']:.1f}s "
+            f"({data['hotels_per_second'] or 0:.2f} hotels/s), {data['failures']} failed",
+            f"API calls: {format_latency(data['api_calls'])}, "
+            f"{data['retries']} retries, statuses: {statuses or 'none'}",
+            f"Tokens: {data['prompt_tokens']} prompt, {data['output_tokens']} output",
+            f"DB reads: {format_latency(data['db_reads'])}",
+            f"DB writes: {format_latency(data['db_writes'])}",
+        ]
+        return "\n".join(lines)
+
+    def write_json(self, path, caches=()):
+        with open(path, "w") as f:
+            json.dump(self.as_dict(caches), f, indent=2)
+
+
+_stats = RunStats()
+
+
+def get_run_stats():
+    """Return the stats shared by the client and the commands in this process."""
+    return _stats
+
+
+@contextmanager
+def recording_run(write, json_path=None, caches=()):
+    """
+    Reset the run stats and time every query made on this thread, for the
+    report and for the metrics; when the block ends (even on error), pass
+    the report to ``write`` and save it as JSON to ``json_path`` if given,
+    with the hits of ``caches``.
+    """
+    stats = get_run_stats()
+    stats.reset()
+    try:
+        with connection.execute_wrapper(stats.db_wrapper):
+            with connection.execute_wrapper(db_query_wrapper):
+                yield stats
+    finally:
+        write(stats.report())
+        if json_path:
+            stats.write_json(json_path, [cache for cache in caches if cache is not None])
@@ -1,32 +1,238 @@
-from django.core.management.base import BaseCommand
-from management_app.models import Hotel, NewHotel
+from collections import defaultdict
 
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from management_app.generation import chunked
+from management_app.models import (
+    Hotel,
+    HotelRatingReview,
+    HotelSummary,
+    NewHotel,
+    hotel_fingerprint,
+)
+from management_app.profiling import ProfiledCommand
 
-class Command(BaseCommand):
+
+class Command(ProfiledCommand):
     help = "Replace data in new_hotels with data from hotels"
 
-    def handle(self, *args, **kwargs):
-        # Clear the new_hotels table
-        NewHotel.objects.all().delete()
-
-        # Copy data from hotels to new_hotels
-        hotels = Hotel.objects.all()
-        for hotel in hotels:
-            NewHotel.objects.create(
-                property_id=hotel.property_id,
-                name=hotel.name,
-                description="",  # Initialize with an empty description
-                rating=hotel.rating,
-                location=hotel.location,
-                latitude=hotel.latitude,
-                longitude=hotel.longitude,
-                room_type=hotel.room_type,
-                price=hotel.price,
-                image_path=hotel.image_path,
-                city_id=hotel.city_id,
-                city_name=hotel.city_name,
-            )
+    # Columns owned by the hotels table. The name is only copied for new
+    # hotels, since rewrite_hotels replaces it with a generated one, and the
+    # description is always generated.
+    SOURCE_FIELDS = [
+        "rating",
+        "location",
+        "latitude",
+        "longitude",
+        "room_type",
+        "price",
+        "image_path",
+        "city_id",
+        "city_name",
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fast",
+            action="store_true",
+            help=(
+                "Rebuild new_hotels inside PostgreSQL with one INSERT ... SELECT "
+                "(PostgreSQL only)"
+            ),
+        )
+        parser.add_argument(
+            "--sync",
+            action="store_true",
+            help=(
+                "Insert new hotels and update changed ones by property_id, "
+                "keeping generated names and descriptions"
+            ),
+        )
+        parser.add_argument(
+            "--delete-missing",
+            action="store_true",
+            help="With --sync, also delete hotels that are no longer in hotels",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of rows written per query (default: 1000)",
+        )
+
+    def handle(self, *args, **options):
+        if options["fast"] and options["sync"]:
+            raise CommandError("--fast and --sync cannot be used together")
+
+        if options["fast"]:
+            self.fast_replace()
+        elif options["sync"]:
+            self.sync(options["batch_size"], options["delete_missing"])
+        else:
+            self.replace(options["batch_size"])
+
+    def new_hotel(self, hotel):
+        new_hotel = NewHotel(
+            property_id=hotel.property_id,
+            name=hotel.name,
+            description="",  # Initialize with an empty description
+            **{field: getattr(hotel, field) for field in self.SOURCE_FIELDS},
+        )
+        # bulk_create() skips save(), so set the fingerprint here
+        new_hotel.content_fingerprint = hotel_fingerprint(
+            new_hotel.name, new_hotel.city_name, new_hotel.description
+        )
+        return new_hotel
+
+    def source_hotels(self):
+        return (
+            Hotel.objects.only("property_id", "name", *self.SOURCE_FIELDS)
+            .order_by("property_id")
+        )
+
+    def replace(self, batch_size):
+        with transaction.atomic():
+            # Clear the new_hotels table
+            NewHotel.objects.all().delete()
+
+            # Copy data from hotels to new_hotels
+            hotels = self.source_hotels().iterator(chunk_size=batch_size)
+            for batch in chunked(hotels, batch_size):
+                NewHotel.objects.bulk_create(
+                    [self.new_hotel(hotel) for hotel in batch]
+                )
 
         self.stdout.write(
             self.style.SUCCESS("Data replaced successfully in new_hotels!")
         )
+
+    def fast_replace(self):
+        """
+        Full rebuild that never moves rows through Python.
+
+        Secondary indexes are dropped for the load and rebuilt afterwards,
+        all inside one transaction, so a failed load leaves the old data in
+        place. Fingerprints are computed in SQL with the same hash as
+        ``hotel_fingerprint``.
+        """
+        if connection.vendor != "postgresql":
+            raise CommandError("--fast is only supported on PostgreSQL")
+
+        qn = connection.ops.quote_name
+        source = qn(Hotel._meta.db_table)
+        target = qn(NewHotel._meta.db_table)
+        columns = ["property_id", "name", *self.SOURCE_FIELDS]
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Secondary indexes of new_hotels (constraints such as the primary key stay)
+            cursor.execute(
+                """
+                SELECT indexname, indexdef FROM pg_indexes
+                WHERE schemaname = current_schema() AND tablename = %s
+                AND indexname NOT IN (
+                    SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass
+                )
+                """,
+                [NewHotel._meta.db_table, NewHotel._meta.db_table],
+            )
+            indexes = cursor.fetchall()
+            for name, _definition in indexes:
+                cursor.execute(f"DROP INDEX {qn(name)}")
+
+            cursor.execute(f"TRUNCATE {target}")
+            cursor.execute(
+                f"""
+                INSERT INTO {target} ({", ".join(map(qn, columns))}, description, content_fingerprint)
+                SELECT {", ".join(map(qn, columns))}, '',
+                    encode(sha256(convert_to(
+                        coalesce(name, '') || E'\\x1f' || coalesce(city_name, '') || E'\\x1f',
+                        'UTF8'
+                    )), 'hex')
+                FROM {source}
+                ORDER BY property_id
+                """
+            )
+            copied = cursor.rowcount
+
+            for _name, definition in indexes:
+                cursor.execute(definition)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {target}")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Data replaced successfully in new_hotels! ({copied} rows)")
+        )
+
+    def sync(self, batch_size, delete_missing):
+        created = updated = 0
+        hotels = self.source_hotels().iterator(chunk_size=batch_size)
+        for batch in chunked(hotels, batch_size):
+            batch_created, batch_updated = self.sync_batch(batch)
+            created += batch_created
+            updated += batch_updated
+
+        deleted = 0
+        if delete_missing:
+            deleted = self.delete_missing()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"new_hotels synced: {created} created, {updated} updated, "
+                f"{deleted} deleted"
+            )
+        )
+
+    def sync_batch(self, batch):
+        existing = defaultdict(list)
+        for new_hotel in NewHotel.objects.filter(
+            property_id__in=[hotel.property_id for hotel in batch]
+        ).only("id", "property_id", "name", "description", *self.SOURCE_FIELDS):
+            existing[new_hotel.property_id].append(new_hotel)
+
+        to_create = []
+        to_update = []
+        changed_fields = set()
+        for hotel in batch:
+            if hotel.property_id not in existing:
+                to_create.append(self.new_hotel(hotel))
+                continue
+
+            for new_hotel in existing[hotel.property_id]:
+                changed = [
+                    field
+                    for field in self.SOURCE_FIELDS
+                    if getattr(new_hotel, field) != getattr(hotel, field)
+                ]
+                if not changed:
+                    continue
+
+                for field in changed:
+                    setattr(new_hotel, field, getattr(hotel, field))
+                if "city_name" in changed:
+                    new_hotel.content_fingerprint = hotel_fingerprint(
+                        new_hotel.name, new_hotel.city_name, new_hotel.description
+                    )
+                    changed.append("content_fingerprint")
+                changed_fields.update(changed)
+                to_update.append(new_hotel)
+
+        # Only the columns that changed somewhere in the batch are written
+        with transaction.atomic():
+            NewHotel.objects.bulk_create(to_create)
+            if to_update:
+                NewHotel.objects.bulk_update(to_update, sorted(changed_fields))
+
+        return len(to_create), len(to_update)
+
+    def delete_missing(self):
+        missing = NewHotel.objects.exclude(
+            property_id__in=Hotel.objects.values("property_id")
+        )
+        missing_ids = missing.values("property_id")
+        with transaction.atomic():
+            # Generated rows are keyed by property_id, so remove them manually
+            HotelSummary.objects.filter(property_id__in=missing_ids).delete()
+            HotelRatingReview.objects.filter(property_id__in=missing_ids).delete()
+            deleted, _ = missing.delete()
+        return deleted
@@ -0,0 +1,69 @@
+from django.db import transaction
+from management_app.generation import GenerationCommand
+from management_app.models import HotelRatingReview, HotelSummary
+from management_app.prompts import ENRICH_PROMPT, ENRICH_PROMPT_VERSION, render_prompt
+from management_app.utils import query_gemini_enrichment
+
+
+class Command(GenerationCommand):
+    help = (
+        "Rewrite name and description and generate summary, rating and review "
+        "with one Gemini request per hotel"
+    )
+    prompt_version = ENRICH_PROMPT_VERSION
+    output_models = (HotelSummary, HotelRatingReview)
+
+    def build_prompt(self, hotel):
+        return render_prompt(ENRICH_PROMPT, hotel)
+
+    def query(self, prompt):
+        return query_gemini_enrichment(prompt)
+
+    def is_complete(self, response):
+        return bool(
+            response
+            and response.get("name")
+            and response.get("description")
+            and response.get("summary")
+            and response.get("rating") is not None
+            and response.get("review")
+        )
+
+    def save_result(self, hotel, response):
+        if not self.is_complete(response):
+            return self.fail(f"Failed to enrich hotel: {hotel.name}")
+
+        try:
+            # Write all outputs for the hotel together, or none of them
+            with transaction.atomic():
+                hotel.name = response["name"]
+                hotel.description = response["description"]
+                hotel.save(update_fields=["name", "description"])
+
+                HotelSummary.objects.upsert(
+                    [
+                        HotelSummary(
+                            property_id=hotel.property_id,
+                            summary=response["summary"],
+                            source_fingerprint=hotel.content_fingerprint,
+                            prompt_version=self.prompt_version,
+                        )
+                    ]
+                )
+                HotelRatingReview.objects.upsert(
+                    [
+                        HotelRatingReview(
+                            property_id=hotel.property_id,
+                            rating=response["rating"],
+                            review=response["review"],
+                            source_fingerprint=hotel.content_fingerprint,
+                            prompt_version=self.prompt_version,
+                        )
+                    ]
+                )
+            self.stdout.write(self.style.SUCCESS(f"Hotel enriched: {hotel.name}"))
+        except Exception as e:
+            return self.fail(f"Error saving enrichment for hotel: {hotel.name}. Error: {e}")
+
+    def finish(self):
+        self.stdout.write(self.style.SUCCESS("Hotels enriched!"))
@@ -1,50 +1,69 @@
-from django.core.management.base import BaseCommand
-from management_app.models import NewHotel, HotelRatingReview
-from management_app.utils import query_gemini_ratings_reviews
+from management_app.generation import GenerationCommand
+from management_app.models import HotelRatingReview
+from management_app.prompts import (
+    RATING_REVIEW_BATCH_PROMPT,
+    RATING_REVIEW_PROMPT,
+    RATING_REVIEW_PROMPT_VERSION,
+    render_prompt,
+)
+from management_app.schemas import RATING_REVIEW_SCHEMA, MalformedResponse
+from management_app.utils import query_gemini_batch, query_gemini_ratings_reviews, rating_review_result
 
 
-class Command(BaseCommand):
+class Command(GenerationCommand):
     help = "Generate ratings and reviews for hotels"
+    cache_responses = True
+    prompt_version = RATING_REVIEW_PROMPT_VERSION
+    batch_prompt = RATING_REVIEW_BATCH_PROMPT
+    output_models = (HotelRatingReview,)
+    buffered_model = HotelRatingReview
 
-    def handle(self, *args, **kwargs):
-        hotels = NewHotel.objects.all()
-        for hotel in hotels:
-            # Remove old ratings and reviews if they exist
-            HotelRatingReview.objects.filter(property_id=hotel.property_id).delete()
-
-            # Create the prompt for the API
-            prompt = (
-                f"Generate a numerical rating (0-5) and a review within 100 words for the following hotel:\n"
-                f"Name: {hotel.name}\n"
-                f"Location: {hotel.city_name}\n"
-                f"Details: {hotel.description}\n"
-            )
+    def build_prompt(self, hotel):
+        return render_prompt(RATING_REVIEW_PROMPT, hotel)
+
+    def query(self, prompt):
+        return query_gemini_ratings_reviews(prompt)
+
+    def query_batch(self, prompt):
+        return query_gemini_batch(prompt, RATING_REVIEW_SCHEMA)
+
+    def parse_batch_item(self, item):
+        try:
+            return rating_review_result(item)
+        except MalformedResponse:
+            return None  # Retried as a single-hotel call
+
+    def is_complete(self, response):
+        return bool(
+            response
+            and response.get("rating") is not None
+            and response.get("review")
+        )
 
-            # Query the Gemini API
-            response = query_gemini_ratings_reviews(prompt)
-
-            if (
-                response
-                and response.get("rating") is not None
-                and response.get("review")
-            ):
-                try:
-                    # Save the new rating and review in the database
-                    HotelRatingReview.objects.create(
-                        property_id=hotel.property_id,
-                        rating=response["rating"],
-                        review=response["review"],
-                    )
-                    self.stdout.write(
-                        self.style.SUCCESS(
-                            f"Rating and review generated for hotel: {hotel.name}"
-                        )
-                    )
-                except Exception as e:
-                    self.stderr.write(
-                        f"Error saving rating/review for hotel: {hotel.name}. Error: {e}"
-                    )
-            else:
-                self.stderr.write(
-                    f"Failed to generate rating/review for hotel: {hotel.name}"
+    def save_result(self, hotel, response):
+        # Queue the new rating and review; they replace the old ones when the buffer is flushed
+        if self.is_complete(response):
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Rating and review generated for hotel: {hotel.name}"
                 )
+            )
+            self.buffer.add(
+                HotelRatingReview(
+                    property_id=hotel.property_id,
+                    rating=response["rating"],
+                    review=response["review"],
+                    source_fingerprint=hotel.content_fingerprint,
+                    prompt_version=self.prompt_version,
+                ),
+                label=hotel.name,
+            )
+        else:
+            return self.fail(
+                f"Failed to generate rating/review for hotel: {hotel.name}"
+            )
+
+    def report_write_error(self, label, error):
+        self.stderr.write(
+            f"Error saving rating/review for hotel: {label}. Error: {error}"
+        )
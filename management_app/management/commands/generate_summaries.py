@@ -1,41 +1,58 @@
-from django.core.management.base import BaseCommand
-from management_app.models import NewHotel, HotelSummary
-from management_app.utils import query_gemini_summary
+from management_app.generation import GenerationCommand
+from management_app.models import HotelSummary
+from management_app.prompts import (
+    SUMMARY_BATCH_PROMPT,
+    SUMMARY_PROMPT,
+    SUMMARY_PROMPT_VERSION,
+    render_prompt,
+)
+from management_app.schemas import SUMMARY_SCHEMA, MalformedResponse
+from management_app.utils import query_gemini_batch, query_gemini_summary, summary_result
 
 
-class Command(BaseCommand):
+class Command(GenerationCommand):
     help = "Generate summaries for hotels"
+    cache_responses = True
+    prompt_version = SUMMARY_PROMPT_VERSION
+    batch_prompt = SUMMARY_BATCH_PROMPT
+    output_models = (HotelSummary,)
+    buffered_model = HotelSummary
 
-    def handle(self, *args, **kwargs):
-        hotels = NewHotel.objects.all()
-        for hotel in hotels:
-            # Remove old summary if it exists
-            HotelSummary.objects.filter(property_id=hotel.property_id).delete()
-
-            # Create the prompt for the API
-            prompt = (
-                f"Write a summary for the following hotel:\n"
-                f"Name: {hotel.name}\n"
-                f"Location: {hotel.city_name}\n"
-                f"Details: {hotel.description}\n"
+    def build_prompt(self, hotel):
+        return render_prompt(SUMMARY_PROMPT, hotel)
+
+    def query(self, prompt):
+        return query_gemini_summary(prompt)
+
+    def query_batch(self, prompt):
+        return query_gemini_batch(prompt, SUMMARY_SCHEMA)
+
+    def parse_batch_item(self, item):
+        try:
+            return summary_result(item)
+        except MalformedResponse:
+            return None  # Retried as a single-hotel call
+
+    def is_complete(self, response):
+        return bool(response and response.get("summary"))
+
+    def save_result(self, hotel, response):
+        # Queue the new summary; it replaces the old one when the buffer is flushed
+        if self.is_complete(response):
+            self.stdout.write(
+                self.style.SUCCESS(f"Summary generated for hotel: {hotel.name}")
+            )
+            self.buffer.add(
+                HotelSummary(
+                    property_id=hotel.property_id,
+                    summary=response["summary"],
+                    source_fingerprint=hotel.content_fingerprint,
+                    prompt_version=self.prompt_version,
+                ),
+                label=hotel.name,
             )
+        else:
+            return self.fail(f"Failed to generate summary for hotel: {hotel.name}")
 
-            # Query the Gemini API
-            response = query_gemini_summary(prompt)
-
-            if response and response.get("summary"):
-                try:
-                    # Save the new summary in the database
-                    HotelSummary.objects.create(
-                        property_id=hotel.property_id,
-                        summary=response["summary"],
-                    )
-                    self.stdout.write(
-                        self.style.SUCCESS(f"Summary generated for hotel: {hotel.name}")
-                    )
-                except Exception as e:
-                    self.stderr.write(
-                        f"Error saving summary for hotel: {hotel.name}. Error: {e}"
-                    )
-            else:
-                self.stderr.write(f"Failed to generate summary for hotel: {hotel.name}")
+    def report_write_error(self, label, error):
+        self.stderr.write(f"Error saving summary for hotel: {label}. Error: {error}")
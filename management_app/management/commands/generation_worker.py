@@ -0,0 +1,179 @@
+import os
+import socket
+import time
+
+from django.core.management.base import CommandError
+from django.db.models import Exists, OuterRef
+from management_app.generation import interrupt_on_sigterm, load_generation_command
+from management_app.instrumentation import recording_run
+from management_app.metrics import exporting_metrics
+from management_app.models import GenerationRun, GenerationTask, NewHotel
+from management_app.profiling import ProfiledCommand
+from management_app.runs import RunTracker, record_pending_tasks
+
+
+class CacheTotals:
+    """Response cache hits and misses of the runs this worker has finished."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, cache):
+        self.hits += cache.hits
+        self.misses += cache.misses
+
+
+class Command(ProfiledCommand):
+    help = (
+        "Process queued generation runs (see --enqueue). Any number of workers "
+        "can share a run: each claims a few hotels at a time under a lease"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--run",
+            type=int,
+            metavar="RUN_ID",
+            help="Only process this run (default: every queued run, oldest first)",
+        )
+        parser.add_argument(
+            "--claim-size",
+            type=int,
+            default=10,
+            help="Number of hotels claimed at a time (default: 10)",
+        )
+        parser.add_argument(
+            "--lease-seconds",
+            type=int,
+            default=600,
+            help=(
+                "Seconds before the hotels claimed by a dead worker can be "
+                "claimed again; must exceed the time to process one claim "
+                "(default: 600)"
+            ),
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=1,
+            help="Number of Gemini requests to run in parallel (default: 1)",
+        )
+        parser.add_argument(
+            "--poll-seconds",
+            type=float,
+            default=5.0,
+            help="Seconds to wait when there is nothing to claim (default: 5)",
+        )
+        parser.add_argument(
+            "--exit-when-empty",
+            action="store_true",
+            help="Exit when there is nothing left to claim instead of waiting",
+        )
+        parser.add_argument(
+            "--stats-json",
+            metavar="PATH",
+            help="Also write the performance report to this JSON file on exit",
+        )
+        parser.add_argument(
+            "--metrics-port",
+            type=int,
+            metavar="PORT",
+            help="Serve Prometheus metrics on this port at /metrics while running",
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        # Only the command of the run being processed is kept, so a worker
+        # that runs indefinitely does not hold on to every run it has seen
+        self.command = None
+        self.cache_totals = CacheTotals()
+
+        if options["run"] and not GenerationRun.objects.filter(pk=options["run"]).exists():
+            raise CommandError(f"Generation run {options['run']} does not exist")
+
+        self.stdout.write(f"Worker {self.owner} started")
+        with interrupt_on_sigterm(), exporting_metrics(
+            "generation_worker", options["metrics_port"]
+        ), recording_run(self.stdout.write, options["stats_json"], [self.cache_totals]):
+            try:
+                while True:
+                    run = self.next_run()
+                    if run is None:
+                        # Let go of the last run's command while idle
+                        self.end_command()
+                    if run is None or not self.work(run):
+                        if options["exit_when_empty"]:
+                            break
+                        time.sleep(options["poll_seconds"])
+            finally:
+                self.end_command()
+
+    def next_run(self):
+        # Oldest queued run that still has pending hotels
+        runs = GenerationRun.objects.filter(status=GenerationRun.Status.QUEUED).filter(
+            Exists(
+                GenerationTask.objects.filter(
+                    run=OuterRef("pk"), status=GenerationTask.Status.PENDING
+                )
+            )
+        )
+        if self.options["run"]:
+            runs = runs.filter(pk=self.options["run"])
+        return runs.order_by("id").first()
+
+    def get_command(self, run):
+        """The generation command that processes ``run``, set up with the run's options."""
+        if self.command is not None and self.command.tracker.run.pk != run.pk:
+            self.end_command()
+        if self.command is None:
+            self.command = load_generation_command(
+                run.command,
+                self.stdout,
+                self.stderr,
+                **{**run.options, "concurrency": self.options["concurrency"]},
+            )
+            self.command.tracker = RunTracker(run, **self.command.tracker_options())
+        return self.command
+
+    def end_command(self):
+        # Report and prune the cache of the run, and drop its responses
+        if self.command is None:
+            return
+        self.command.end()
+        if self.command.cache is not None:
+            self.cache_totals.add(self.command.cache)
+        self.command = None
+
+    def work(self, run):
+        """Process one claim of ``run``; return False if nothing could be claimed."""
+        command = self.get_command(run)
+        tracker = command.tracker
+        property_ids = tracker.claim(
+            self.owner, self.options["claim_size"], self.options["lease_seconds"]
+        )
+        if not property_ids:
+            # Everything left is leased by other workers
+            return False
+
+        hotels = (
+            NewHotel.objects.only(*command.hotel_fields)
+            .filter(property_id__in=property_ids)
+            .order_by("id")
+        )
+        found = set(hotels.values_list("property_id", flat=True))
+        for property_id in set(property_ids) - found:
+            tracker.record(property_id, "Hotel no longer in new_hotels")
+
+        try:
+            command.process_hotels(hotels)
+        finally:
+            # Hand back anything not finished (error or Ctrl+C) right away
+            tracker.release(self.owner)
+
+        record_pending_tasks()
+        if tracker.complete_if_drained():
+            self.stdout.write(self.style.SUCCESS(f"Generation run {run.pk} completed"))
+            self.end_command()
+        return True
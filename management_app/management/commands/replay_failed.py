@@ -0,0 +1,50 @@
+from django.core.management import call_command
+from management_app.models import DeadLetter
+from management_app.profiling import ProfiledCommand
+
+
+class Command(ProfiledCommand):
+    help = (
+        "Reprocess only the hotels in the dead-letter table, each with the "
+        "generation command that failed on it"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--command",
+            help="Only replay the hotels that failed in this command",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=1,
+            help="Number of Gemini requests to run in parallel (default: 1)",
+        )
+
+    def handle(self, *args, **options):
+        dead_letters = DeadLetter.objects.all()
+        if options["command"]:
+            dead_letters = dead_letters.filter(command=options["command"])
+
+        commands = list(
+            dead_letters.values_list("command", flat=True).distinct().order_by("command")
+        )
+        if not commands:
+            self.stdout.write(self.style.SUCCESS("No failed hotels to replay"))
+            return
+
+        for command in commands:
+            count = dead_letters.filter(command=command).count()
+            self.stdout.write(f"Replaying {count} failed hotels with {command}")
+            call_command(
+                command,
+                only_failed=True,
+                concurrency=options["concurrency"],
+                stdout=self.stdout,
+                stderr=self.stderr,
+            )
+
+        remaining = dead_letters.count()
+        self.stdout.write(
+            self.style.SUCCESS(f"Replay finished: {remaining} hotels still failing")
+        )
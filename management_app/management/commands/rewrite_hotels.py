@@ -1,32 +1,40 @@
-from django.core.management.base import BaseCommand
-from management_app.models import NewHotel
+from django.db import transaction
+from management_app.generation import GenerationCommand
+from management_app.prompts import (
+    REWRITE_PROMPT,
+    REWRITE_PROMPT_VERSION,
+    render_prompt,
+)
 from management_app.utils import query_gemini_api
 
 
-class Command(BaseCommand):
+class Command(GenerationCommand):
     help = "Rewrite name and description using Google AI Studio API"
+    prompt_version = REWRITE_PROMPT_VERSION
 
-    def handle(self, *args, **kwargs):
-        new_hotels = NewHotel.objects.all()
-        for hotel in new_hotels:
-            prompt = (
-                f"Rewrite the name in a unique way and generate a unique description within 100 words for a hotel named "
-                f"'{hotel.name}' located at: '{hotel.city_name}'."
-            )
-            response = query_gemini_api(prompt)
+    def build_prompt(self, hotel):
+        return render_prompt(REWRITE_PROMPT, hotel)
+
+    def query(self, prompt):
+        return query_gemini_api(prompt)
+
+    def save_result(self, hotel, response):
+        if not response:
+            return self.fail(f"Failed to rewrite hotel: {hotel.name}")
 
-            if response:
-                try:
-                    hotel.name = response.get("name", hotel.name)
-                    hotel.description = response.get("description", hotel.description)
-                    hotel.save()
-                    self.stdout.write(
-                        self.style.SUCCESS(f"Name and Description generated for hotel: {hotel.name}")
-                    )
-                except Exception as e:
-                    self.stderr.write(
-                        f"Error saving name and description for hotel: {hotel.name}. Error: {e}"
-                    )
+        try:
+            hotel.name = response.get("name", hotel.name)
+            hotel.description = response.get("description", hotel.description)
+            # Savepoint: a failed save must not break the run's transaction
+            with transaction.atomic():
+                hotel.save(update_fields=["name", "description"])
+            self.stdout.write(
+                self.style.SUCCESS(f"Name and Description generated for hotel: {hotel.name}")
+            )
+        except Exception as e:
+            return self.fail(
+                f"Error saving name and description for hotel: {hotel.name}. Error: {e}"
+            )
 
+    def finish(self):
         self.stdout.write(self.style.SUCCESS("Hotel names and descriptions updated!"))
-        # time.sleep(5)
@@ -0,0 +1,183 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import ExitStack
+
+from django.core.management.base import CommandError
+from management_app.generation import interrupt_on_sigterm, load_generation_command
+from management_app.instrumentation import recording_run
+from management_app.metrics import PIPELINE_QUEUE_DEPTH, exporting_metrics
+from management_app.models import GenerationRun
+from management_app.profiling import ProfiledCommand
+from management_app.runs import RunTracker
+
+
+class Stage:
+    """One generation command of the pipeline, with its own thread pool."""
+
+    def __init__(self, command, concurrency):
+        self.command = command
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.waiting = deque()  # Hotels ready for this stage
+        self.running = 0
+
+    def has_room(self):
+        # At most 2 * concurrency calls are queued ahead, as in run_concurrently
+        return self.running < self.concurrency * 2
+
+
+class Command(ProfiledCommand):
+    help = (
+        "Rewrite, summarize and review hotels in one pass: the summary and "
+        "review of each hotel are generated as soon as its description is rewritten"
+    )
+
+    # (command, option prefix) of each stage; the first one feeds the others
+    stage_commands = (
+        ("rewrite_hotels", "rewrite"),
+        ("generate_summaries", "summary"),
+        ("generate_ratings_reviews", "review"),
+    )
+
+    def add_arguments(self, parser):
+        for _, prefix in self.stage_commands:
+            parser.add_argument(
+                f"--{prefix}-concurrency",
+                type=int,
+                default=1,
+                help=f"Number of {prefix} requests to run in parallel (default: 1)",
+            )
+        parser.add_argument(
+            "--queue-size",
+            type=int,
+            default=100,
+            help=(
+                "Number of rewritten hotels that may wait for a summary or "
+                "review before rewriting pauses (default: 100)"
+            ),
+        )
+        parser.add_argument(
+            "--no-cache",
+            action="store_true",
+            help="Ignore cached responses and query the API for every hotel",
+        )
+        parser.add_argument(
+            "--stats-json",
+            metavar="PATH",
+            help="Also write the end-of-run performance report to this JSON file",
+        )
+        parser.add_argument(
+            "--metrics-port",
+            type=int,
+            metavar="PORT",
+            help="Serve Prometheus metrics on this port at /metrics while running",
+        )
+
+    def handle(self, *args, **options):
+        if options["queue_size"] < 1:
+            raise CommandError("--queue-size must be at least 1")
+        self.options = options
+
+        stages = []
+        for name, prefix in self.stage_commands:
+            concurrency = options[f"{prefix}_concurrency"]
+            command = load_generation_command(
+                name,
+                self.stdout,
+                self.stderr,
+                concurrency=concurrency,
+                no_cache=options["no_cache"],
+            )
+            stages.append(Stage(command, concurrency))
+
+        caches = [stage.command.cache for stage in stages]
+        with interrupt_on_sigterm(), exporting_metrics(
+            "run_pipeline", options["metrics_port"]
+        ), recording_run(self.stdout.write, options["stats_json"], caches):
+            self.run_pipeline(stages)
+
+    def run_pipeline(self, stages):
+        # Each stage is checkpointed in its own run, so hotels a stage did not
+        # finish can be completed later with that command's --resume
+        hotels = stages[0].command.get_hotels()
+        for stage in stages:
+            command = stage.command
+            command.tracker = RunTracker.start(
+                command.command_name,
+                hotels,
+                chunk_size=command.chunk_size,
+                **command.tracker_options(),
+            )
+            self.stdout.write(
+                f"Generation run {command.tracker.run.pk} ({command.command_name})"
+            )
+
+        status = GenerationRun.Status.FAILED
+        try:
+            with ExitStack() as stack:
+                for stage in stages:
+                    stage.command.open_writes(stack)
+                for stage in stages:
+                    # Drop queued calls first on error or Ctrl+C
+                    stack.callback(stage.executor.shutdown, wait=True, cancel_futures=True)
+                self.run_stages(stages, hotels)
+            status = GenerationRun.Status.COMPLETED
+        except KeyboardInterrupt:
+            status = GenerationRun.Status.INTERRUPTED
+            raise
+        finally:
+            for stage in stages:
+                stage.command.tracker.finish(status)
+
+        for stage in stages:
+            self.stdout.write(stage.command.tracker.report())
+            stage.command.end()
+
+    def run_stages(self, stages, hotels):
+        """
+        Send every hotel through the first stage, then the hotels it saved
+        through the others. Responses are handled here, on the command's
+        thread, as soon as they arrive.
+        """
+        first, *rest = stages
+        hotels = hotels.iterator(chunk_size=first.command.chunk_size)
+        queue_size = self.options["queue_size"]
+        futures = {}
+        exhausted = False
+
+        while True:
+            for stage in rest:
+                while stage.waiting and stage.has_room():
+                    self.submit(futures, stage, stage.waiting.popleft())
+
+            # New hotels only start while every later stage has room for them
+            while (
+                not exhausted
+                and first.has_room()
+                and all(len(stage.waiting) + first.running < queue_size for stage in rest)
+            ):
+                hotel = next(hotels, None)
+                if hotel is None:
+                    exhausted = True
+                else:
+                    self.submit(futures, first, hotel)
+
+            for stage in rest:
+                PIPELINE_QUEUE_DEPTH.set(len(stage.waiting), stage=stage.command.command_name)
+
+            if not futures:
+                return
+
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, job = futures.pop(future)
+                stage.running -= 1
+                error = stage.command.handle_response(job, future.result())
+                if stage is first and error is None:
+                    for later in rest:
+                        later.waiting.append(job.hotel)
+
+    def submit(self, futures, stage, hotel):
+        job = stage.command.prepare(hotel)
+        futures[stage.executor.submit(stage.command.fetch, job)] = stage, job
+        stage.running += 1
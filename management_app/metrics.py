@@ -0,0 +1,257 @@
+# Process-wide metrics in the Prometheus text exposition format.
+#
+# The web app serves them at /metrics; management commands can serve them
+# with --metrics-port, or push them to a Pushgateway at METRICS_PUSHGATEWAY_URL
+# when they end (see exporting_metrics).
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE")
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """One metric family; each combination of label values is a series."""
+
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} needs the labels {', '.join(self.label_names)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = sorted(self._series.items())
+            lines.extend(self.samples(series))
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._series.get(self._key(labels), 0)
+
+    def samples(self, series):
+        for key, value in series:
+            yield f"{self.name}{format_labels(self.label_names, key)} {format_value(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._series.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._series[key] = (counts, total + value, count + 1)
+
+    def samples(self, series):
+        for key, (counts, total, count) in series:
+            for bound, bucket_count in zip(self.buckets, counts):
+                le = format_value(float(bound))
+                labels = format_labels(self.label_names, key, [("le", le)])
+                yield f"{self.name}_bucket{labels} {bucket_count}"
+            labels = format_labels(self.label_names, key, [("le", "+Inf")])
+            yield f"{self.name}_bucket{labels} {count}"
+            labels = format_labels(self.label_names, key)
+            yield f"{self.name}_sum{labels} {format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+LLM_CALLS = REGISTRY.register(
+    Counter("llm_calls_total", "Gemini API calls", ("task", "model", "status"))
+)
+LLM_CALL_SECONDS = REGISTRY.register(
+    Histogram("llm_call_duration_seconds", "Latency of Gemini API calls", ("task", "model"))
+)
+LLM_TOKENS = REGISTRY.register(
+    Counter(
+        "llm_tokens_total",
+        "Tokens reported in usageMetadata (kind is prompt or output)",
+        ("task", "model", "kind"),
+    )
+)
+RATE_LIMIT_WAIT_SECONDS = REGISTRY.register(
+    Histogram(
+        "llm_rate_limit_wait_seconds",
+        "Time a Gemini call waited for the rate limiter",
+        ("model",),
+    )
+)
+PENDING_TASKS = REGISTRY.register(
+    Gauge(
+        "generation_pending_tasks",
+        "Hotels still pending in unfinished generation runs",
+        ("command",),
+    )
+)
+PIPELINE_QUEUE_DEPTH = REGISTRY.register(
+    Gauge(
+        "pipeline_queue_depth",
+        "Rewritten hotels waiting for a run_pipeline stage",
+        ("stage",),
+    )
+)
+DB_QUERY_SECONDS = REGISTRY.register(
+    Histogram(
+        "db_query_duration_seconds",
+        "Latency of database queries (kind is read or write)",
+        ("kind",),
+    )
+)
+HTTP_REQUEST_SECONDS = REGISTRY.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "Latency of requests to the web app",
+        ("method", "route", "status"),
+    )
+)
+
+
+def query_kind(sql):
+    return "write" if sql.lstrip().upper().startswith(WRITE_STATEMENTS) else "read"
+
+
+def db_query_wrapper(execute, sql, params, many, context):
+    """``connection.execute_wrapper`` that times every query in DB_QUERY_SECONDS."""
+    started = time.monotonic()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        DB_QUERY_SECONDS.observe(time.monotonic() - started, kind=query_kind(sql))
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port, host="0.0.0.0"):
+    """Serve /metrics on ``port`` from a background thread; return the server."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def push(url, job):
+    """Send the current metrics to the Pushgateway at ``url`` under ``job``."""
+    try:
+        response = requests.put(
+            f"{url.rstrip('/')}/metrics/job/{job}",
+            data=REGISTRY.render().encode(),
+            headers={"Content-Type": CONTENT_TYPE},
+            timeout=10,
+        )
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logger.warning("Could not push metrics to %s: %s", url, e)
+
+
+@contextmanager
+def exporting_metrics(job, port=None):
+    """
+    Serve the metrics on ``port`` (if given) while the block runs, and push
+    them to METRICS_PUSHGATEWAY_URL (if set) when it ends.
+    """
+    server = serve(port) if port else None
+    try:
+        yield
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        if settings.METRICS_PUSHGATEWAY_URL:
+            push(settings.METRICS_PUSHGATEWAY_URL, job)
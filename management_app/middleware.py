@@ -0,0 +1,25 @@
+import time
+
+from django.db import connection
+from management_app.metrics import HTTP_REQUEST_SECONDS, db_query_wrapper
+
+
+class MetricsMiddleware:
+    """Times every request, and the database queries it makes, for /metrics."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.monotonic()
+        with connection.execute_wrapper(db_query_wrapper):
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        HTTP_REQUEST_SECONDS.observe(
+            time.monotonic() - started,
+            method=request.method,
+            route=match.route if match else "unmatched",
+            status=response.status_code,
+        )
+        return response
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:05
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def fill_content_fingerprints(apps, schema_editor):
+    # Same hash as management_app.models.hotel_fingerprint
+    NewHotel = apps.get_model('management_app', 'NewHotel')
+    hotels = NewHotel.objects.only('id', 'name', 'city_name', 'description')
+    batch = []
+    for hotel in hotels.iterator(chunk_size=2000):
+        content = '\x1f'.join([hotel.name or '', hotel.city_name or '', hotel.description or ''])
+        hotel.content_fingerprint = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        batch.append(hotel)
+        if len(batch) >= 2000:
+            NewHotel.objects.bulk_update(batch, ['content_fingerprint'])
+            batch = []
+    NewHotel.objects.bulk_update(batch, ['content_fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management_app', '0004_llmresponsecache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hotelratingreview',
+            name='prompt_version',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='hotelratingreview',
+            name='source_fingerprint',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='hotelsummary',
+            name='prompt_version',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='hotelsummary',
+            name='source_fingerprint',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='newhotel',
+            name='content_fingerprint',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='hotelratingreview',
+            index=models.Index(fields=['property_id', 'source_fingerprint', 'prompt_version'], name='hotel_reviews_freshness_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hotelsummary',
+            index=models.Index(fields=['property_id', 'source_fingerprint', 'prompt_version'], name='hotel_summaries_freshness_idx'),
+        ),
+        migrations.RunPython(fill_content_fingerprints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:14
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def remove_duplicate_outputs(apps, schema_editor):
+    # Keep only the newest row of each property_id before adding the unique index
+    for model_name in ('HotelSummary', 'HotelRatingReview'):
+        model = apps.get_model('management_app', model_name)
+        latest_ids = model.objects.values('property_id').annotate(latest_id=Max('id')).values('latest_id')
+        model.objects.exclude(id__in=latest_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management_app', '0005_content_fingerprints'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_outputs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='hotelratingreview',
+            name='property_id',
+            field=models.IntegerField(unique=True),
+        ),
+        migrations.AlterField(
+            model_name='hotelsummary',
+            name='property_id',
+            field=models.IntegerField(unique=True),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management_app', '0006_unique_output_property_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationRun',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('command', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('interrupted', 'Interrupted'), ('failed', 'Failed')], default='running', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'generation_runs',
+            },
+        ),
+        migrations.CreateModel(
+            name='GenerationTask',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('property_id', models.IntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tasks', to='management_app.generationrun')),
+            ],
+            options={
+                'db_table': 'generation_tasks',
+                'indexes': [models.Index(fields=['run', 'status'], name='generation_tasks_status_idx')],
+                'constraints': [models.UniqueConstraint(fields=('run', 'property_id'), name='generation_tasks_run_property_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management_app', '0008_generation_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeadLetter',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('command', models.CharField(max_length=100)),
+                ('property_id', models.IntegerField()),
+                ('error', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('run', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='management_app.generationrun')),
+            ],
+            options={
+                'db_table': 'generation_dead_letters',
+                'constraints': [models.UniqueConstraint(fields=('command', 'property_id'), name='dead_letters_command_property_uniq')],
+            },
+        ),
+    ]
@@ -1,6 +1,14 @@
+import hashlib
+
 from django.db import models
 
 
+def hotel_fingerprint(name, city_name, description):
+    # Hash of the hotel fields the generation prompts are built from
+    content = "\x1f".join([name or "", city_name or "", description or ""])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
 class City(models.Model):
     id = models.IntegerField(primary_key=True)
     name = models.CharField(max_length=255)
@@ -43,28 +51,165 @@ class NewHotel(models.Model):
     image_path = models.CharField(max_length=255, null=True, blank=True)
     city_id = models.IntegerField(null=True, blank=True)
     city_name = models.CharField(max_length=255, null=True, blank=True)
+    # Fingerprint of name, city_name and description, kept up to date by save()
+    content_fingerprint = models.CharField(max_length=64, blank=True, default="")
 
     class Meta:
         db_table = "new_hotels"  # Specify the new table name
         managed = True  # Let Django manage this table
 
+    FINGERPRINT_FIELDS = ("name", "city_name", "description")
+
+    def save(self, *args, **kwargs):
+        self.content_fingerprint = hotel_fingerprint(
+            self.name, self.city_name, self.description
+        )
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and set(update_fields) & set(self.FINGERPRINT_FIELDS):
+            kwargs["update_fields"] = {*update_fields, "content_fingerprint"}
+        super().save(*args, **kwargs)
+
+
+class GeneratedOutputManager(models.Manager):
+    def upsert(self, objs):
+        """Insert rows, replacing the existing row of each property_id (ON CONFLICT DO UPDATE)."""
+        update_fields = [
+            field.name
+            for field in self.model._meta.concrete_fields
+            if not field.primary_key and field.name != "property_id"
+        ]
+        return self.bulk_create(
+            objs,
+            update_conflicts=True,
+            unique_fields=["property_id"],
+            update_fields=update_fields,
+        )
+
 
 class HotelSummary(models.Model):
     id = models.AutoField(primary_key=True)  # Auto-incremented primary key
-    property_id = models.IntegerField()  # Stores the ID of the related property
+    property_id = models.IntegerField(unique=True)  # Stores the ID of the related property
     summary = models.TextField()  # Stores the summary of the hotel
+    # NewHotel.content_fingerprint and prompt version the summary was made from
+    source_fingerprint = models.CharField(max_length=64, blank=True, default="")
+    prompt_version = models.CharField(max_length=64, blank=True, default="")
+
+    objects = GeneratedOutputManager()
 
     class Meta:
         db_table = "hotel_summaries"
+        indexes = [
+            models.Index(
+                fields=["property_id", "source_fingerprint", "prompt_version"],
+                name="hotel_summaries_freshness_idx",
+            ),
+        ]
 
 
 class HotelRatingReview(models.Model):
     id = models.AutoField(primary_key=True)  # Auto-incremented primary key
-    property_id = models.IntegerField()  # Stores the ID of the related property
+    property_id = models.IntegerField(unique=True)  # Stores the ID of the related property
     rating = models.DecimalField(
         max_digits=3, decimal_places=2
     )  # Stores the rating (0.00 to 999.99)
     review = models.TextField()  # Stores the review text
+    # NewHotel.content_fingerprint and prompt version the review was made from
+    source_fingerprint = models.CharField(max_length=64, blank=True, default="")
+    prompt_version = models.CharField(max_length=64, blank=True, default="")
+
+    objects = GeneratedOutputManager()
 
     class Meta:
         db_table = "hotel_ratings_reviews"
+        indexes = [
+            models.Index(
+                fields=["property_id", "source_fingerprint", "prompt_version"],
+                name="hotel_reviews_freshness_idx",
+            ),
+        ]
+
+
+class LLMResponseCache(models.Model):
+    # sha256 of (model, prompt template version, rendered prompt)
+    key = models.CharField(max_length=64, primary_key=True)
+    response = models.JSONField()  # Parsed response returned by the API
+    created_at = models.DateTimeField()  # Used for the TTL
+    last_used_at = models.DateTimeField(db_index=True)  # Used for LRU eviction
+
+    class Meta:
+        db_table = "llm_response_cache"
+
+
+class GenerationRun(models.Model):
+    class Status(models.TextChoices):
+        QUEUED = "queued"  # Processed by generation_worker
+        RUNNING = "running"
+        COMPLETED = "completed"
+        INTERRUPTED = "interrupted"
+        FAILED = "failed"
+
+    id = models.AutoField(primary_key=True)
+    command = models.CharField(max_length=100)  # Management command that owns the run
+    status = models.CharField(
+        max_length=20, choices=Status.choices, default=Status.RUNNING
+    )
+    options = models.JSONField(default=dict, blank=True)  # Command options for workers
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "generation_runs"
+
+
+class GenerationTask(models.Model):
+    class Status(models.TextChoices):
+        PENDING = "pending"
+        DONE = "done"
+        FAILED = "failed"
+
+    id = models.AutoField(primary_key=True)
+    run = models.ForeignKey(
+        GenerationRun, on_delete=models.CASCADE, related_name="tasks"
+    )
+    property_id = models.IntegerField()  # Hotel processed by this task
+    status = models.CharField(
+        max_length=20, choices=Status.choices, default=Status.PENDING
+    )
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    # Worker holding the task; the claim lapses at lease_expires_at if it dies
+    lease_owner = models.CharField(max_length=100, blank=True, default="")
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "generation_tasks"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["run", "property_id"], name="generation_tasks_run_property_uniq"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["run", "status"], name="generation_tasks_status_idx"),
+        ]
+
+
+class DeadLetter(models.Model):
+    # Hotel a generation command could not process; replayed by replay_failed
+    id = models.AutoField(primary_key=True)
+    command = models.CharField(max_length=100)
+    property_id = models.IntegerField()
+    run = models.ForeignKey(
+        GenerationRun, null=True, blank=True, on_delete=models.SET_NULL
+    )  # Last run the hotel failed in
+    error = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "generation_dead_letters"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["command", "property_id"], name="dead_letters_command_property_uniq"
+            ),
+        ]
@@ -0,0 +1,180 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from management_app.metrics import query_kind
+
+# Phases timed by ``phase``, in report order
+PHASES = {
+    "prompt": "Prompt build",
+    "http": "HTTP",
+    "parse": "Parse",
+    "db_read": "DB read",
+    "db_write": "DB write",
+}
+
+_profiler = None
+
+
+@contextmanager
+def phase(name):
+    """Add the wall-clock time of the block to ``name`` while a profile runs."""
+    profiler = _profiler
+    if profiler is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.add_phase(name, time.perf_counter() - started)
+
+
+def frame_name(frame):
+    code = frame.f_code
+    name = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+    # ";" separates frames and " " the count in the collapsed format
+    return name.replace(";", ":").replace(" ", "_")
+
+
+class Profiler:
+    """
+    Profiles a block three ways:
+
+    - cProfile on the calling thread, saved to ``<path>.pstats``;
+    - a sampler reading every thread's stack (``sys._current_frames``) each
+      ``interval`` seconds, saved to ``<path>.collapsed`` in the collapsed
+      format of flamegraph.pl and speedscope;
+    - the wall-clock time of each phase (see ``phase``). Queries on the
+      calling thread are timed as DB reads and writes.
+    """
+
+    def __init__(self, path, interval=0.005):
+        self.path = path
+        self.interval = interval
+        self.phases = defaultdict(lambda: [0.0, 0])
+        self.stacks = Counter()
+        self.elapsed = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        global _profiler
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._queries = connection.execute_wrapper(self.time_query)
+        self._queries.__enter__()
+        self._sampler = threading.Thread(target=self.sample, name="profile-sampler", daemon=True)
+        _profiler = self
+        self._started = time.perf_counter()
+        self._sampler.start()
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _profiler
+        self.profile.disable()
+        self.elapsed = time.perf_counter() - self._started
+        self._stop.set()
+        self._sampler.join()
+        _profiler = None
+        self._queries.__exit__(exc_type, exc, tb)
+
+        self.profile.dump_stats(f"{self.path}.pstats")
+        with open(f"{self.path}.collapsed", "w") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+    def add_phase(self, name, seconds):
+        with self._lock:
+            totals = self.phases[name]
+            totals[0] += seconds
+            totals[1] += 1
+
+    def time_query(self, execute, sql, params, many, context):
+        with phase(f"db_{query_kind(sql)}"):
+            return execute(sql, params, many, context)
+
+    def sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_name(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)).replace(" ", "_"))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def report(self, top=20):
+        lines = [
+            f"Profile written to {self.path}.pstats and {self.path}.collapsed "
+            f"({sum(self.stacks.values())} stack samples)",
+            f"Wall clock: {self.elapsed:.3f}s. Time per phase "
+            "(summed over threads, so it can exceed the wall clock):",
+        ]
+        for name, label in PHASES.items():
+            seconds, count = self.phases.get(name, (0.0, 0))
+            share = seconds / self.elapsed * 100 if self.elapsed else 0.0
+            lines.append(f"  {label:<13}{seconds:10.3f}s {share:6.1f}%  ({count} calls)")
+
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=stream)
+        stats.sort_stats("cumulative").print_stats(top)
+        lines.append(f"Top {top} functions by cumulative time (calling thread only):")
+        lines.append(stream.getvalue().strip("\n"))
+        return "\n".join(lines)
+
+
+class ProfiledCommand(BaseCommand):
+    """
+    Base class of this app's management commands: ``--profile`` runs the
+    command under a ``Profiler`` and prints its report when it ends.
+    """
+
+    def create_parser(self, prog_name, subcommand, **kwargs):
+        parser = super().create_parser(prog_name, subcommand, **kwargs)
+        parser.add_argument(
+            "--profile",
+            action="store_true",
+            help=(
+                "Profile the command: write cProfile stats and a flamegraph "
+                "collapsed-stack file, and print the time spent per phase"
+            ),
+        )
+        parser.add_argument(
+            "--profile-dir",
+            default=".",
+            help="Directory for the --profile files (default: current directory)",
+        )
+        return parser
+
+    def execute(self, *args, **options):
+        if not options.get("profile"):
+            return super().execute(*args, **options)
+
+        name = self.__module__.rsplit(".", 1)[-1]
+        path = os.path.join(
+            options["profile_dir"], f"{name}-{time.strftime('%Y%m%d-%H%M%S')}"
+        )
+        profiler = Profiler(path)
+        try:
+            with profiler:
+                return super().execute(*args, **options)
+        finally:
+            # Also reported when the run fails or is interrupted
+            self.stdout.write(profiler.report())
@@ -0,0 +1,106 @@
+# Prompt templates for the generation commands. Every reply is JSON that must
+# match the response schema of its task (schemas.py).
+#
+# Bump a template's version whenever its wording (or the parser that reads
+# the answer) changes: cached responses made from the old one are ignored, and
+# summaries/reviews stored with the old version count as stale (--only-stale).
+#
+# Each task is split into a fixed instruction, sent as the request's system
+# instruction (and cached by the API with GEMINI_CONTEXT_CACHE), and a
+# per-hotel prompt holding only that hotel's fields.
+
+REWRITE_PROMPT_VERSION = "rewrite-v3"
+REWRITE_INSTRUCTION = (
+    "Rewrite the name of the hotel you are given in a unique way and generate "
+    "a unique description within 100 words for it.\n"
+    "Reply with a JSON object with the keys \"name\" and \"description\"."
+)
+REWRITE_PROMPT = (
+    "Name: {name}\n"
+    "Location: {city_name}\n"
+)
+
+HOTEL_DETAILS_PROMPT = (
+    "Name: {name}\n"
+    "Location: {city_name}\n"
+    "Details: {description}\n"
+)
+
+SUMMARY_PROMPT_VERSION = "summary-v3"
+SUMMARY_INSTRUCTION = (
+    "Write a summary for the hotel you are given.\n"
+    "Reply with a JSON object with the key \"summary\"."
+)
+SUMMARY_PROMPT = HOTEL_DETAILS_PROMPT
+
+RATING_REVIEW_PROMPT_VERSION = "rating-review-v3"
+RATING_REVIEW_INSTRUCTION = (
+    "Generate a numerical rating (0-5) and a review within 100 words for the hotel you are given.\n"
+    "Reply with a JSON object with the keys \"rating\" (number) and \"review\"."
+)
+RATING_REVIEW_PROMPT = HOTEL_DETAILS_PROMPT
+
+# Used by enrich_hotels: every generated field for one hotel in one request
+ENRICH_PROMPT_VERSION = "enrich-v2"
+ENRICH_INSTRUCTION = (
+    "For the hotel you are given:\n"
+    "1. Rewrite the name in a unique way.\n"
+    "2. Generate a unique description within 100 words.\n"
+    "3. Write a summary of the hotel.\n"
+    "4. Generate a numerical rating (0-5) and a review within 100 words.\n"
+    "Base the summary, rating and review on the new name and description.\n"
+    "Reply with a JSON object with the keys \"name\", \"description\", "
+    "\"summary\" (strings), \"rating\" (number) and \"review\" (string)."
+)
+ENRICH_PROMPT = (
+    "Name: {name}\n"
+    "Location: {city_name}\n"
+    "Current details: {description}\n"
+)
+
+# Batch variants used by --batch-size: one prompt for several hotels, answered
+# with a JSON array holding one object per property_id. Their instructions are
+# sent once per batch, so they stay in the prompt.
+
+BATCH_HOTEL = (
+    "property_id: {property_id}\n"
+    "Name: {name}\n"
+    "Location: {city_name}\n"
+    "Details: {description}\n"
+)
+
+SUMMARY_BATCH_PROMPT = (
+    "Write a summary for each of the following hotels.\n"
+    "Reply with a JSON array containing one object per hotel, with the keys "
+    '"property_id" (integer) and "summary" (string).\n\n'
+    "{hotels}"
+)
+
+RATING_REVIEW_BATCH_PROMPT = (
+    "Generate a numerical rating (0-5) and a review within 100 words for each of the following hotels.\n"
+    "Reply with a JSON array containing one object per hotel, with the keys "
+    '"property_id" (integer), "rating" (number) and "review" (string).\n\n'
+    "{hotels}"
+)
+
+
+def render_prompt(template, hotel):
+    return template.format(
+        name=hotel.name,
+        city_name=hotel.city_name,
+        description=hotel.description,
+    )
+
+
+def render_batch_prompt(template, hotels):
+    return template.format(
+        hotels="\n".join(
+            BATCH_HOTEL.format(
+                property_id=hotel.property_id,
+                name=hotel.name,
+                city_name=hotel.city_name,
+                description=hotel.description,
+            )
+            for hotel in hotels
+        )
+    )
@@ -0,0 +1,162 @@
+import threading
+import time
+from datetime import timezone as dt_timezone
+from email.utils import parsedate_to_datetime
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+
+class AdaptiveRateLimiter:
+    """
+    Token-bucket limiter for requests/minute and (optionally) tokens/minute.
+
+    Both buckets hold at most one second of quota, so calls are paced evenly
+    instead of bursting. The effective rate adapts to the API (AIMD): it is
+    halved on every HTTP 429 and grows back in small steps on each success.
+    A ``Retry-After`` header pauses every caller until it has passed.
+    """
+
+    BACKOFF_FACTOR = 0.5
+    RECOVERY_STEP = 0.05
+    MIN_SCALE = 0.05
+
+    def __init__(
+        self,
+        requests_per_minute,
+        tokens_per_minute=None,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.scale = 1.0
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+
+        now = clock()
+        self._updated = now
+        self._blocked_until = now
+        self._requests = self._request_capacity()
+        self._tokens = self._token_capacity()
+
+    def _request_capacity(self):
+        return max(1.0, self.requests_per_minute / 60.0)
+
+    def _token_capacity(self):
+        if not self.tokens_per_minute:
+            return None
+        return max(1.0, self.tokens_per_minute / 60.0)
+
+    def _refill(self, now):
+        elapsed = max(0.0, now - self._updated)
+        self._updated = now
+
+        request_rate = self.requests_per_minute * self.scale / 60.0
+        self._requests = min(
+            self._request_capacity(), self._requests + elapsed * request_rate
+        )
+        if self.tokens_per_minute:
+            token_rate = self.tokens_per_minute * self.scale / 60.0
+            self._tokens = min(self._token_capacity(), self._tokens + elapsed * token_rate)
+
+    def acquire(self, tokens=1):
+        """Block until one request of ``tokens`` tokens fits; return seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                delay = self._blocked_until - now
+
+                if delay <= 0:
+                    # A request larger than the bucket may run once the bucket is full
+                    token_cost = tokens
+                    if self.tokens_per_minute:
+                        token_cost = min(tokens, self._token_capacity())
+
+                    delay = 0.0
+                    if self._requests < 1:
+                        request_rate = self.requests_per_minute * self.scale / 60.0
+                        delay = (1 - self._requests) / request_rate
+                    if self.tokens_per_minute and self._tokens < token_cost:
+                        token_rate = self.tokens_per_minute * self.scale / 60.0
+                        delay = max(delay, (token_cost - self._tokens) / token_rate)
+
+                    if delay <= 0:
+                        self._requests -= 1
+                        if self.tokens_per_minute:
+                            self._tokens -= tokens
+                        return waited
+
+            self._sleep(delay)
+            waited += delay
+
+    def record_response(
+        self, status_code, retry_after=None, reserved_tokens=0, used_tokens=None
+    ):
+        """Adjust the limiter after a response to a call made through ``acquire``."""
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+
+            # Settle the token estimate against the real usage reported by the API
+            if self.tokens_per_minute and used_tokens is not None:
+                self._tokens -= used_tokens - reserved_tokens
+
+            if status_code == 429:
+                self.scale = max(self.MIN_SCALE, self.scale * self.BACKOFF_FACTOR)
+                self._requests = min(self._requests, 0.0)
+                if retry_after is not None:
+                    self._blocked_until = max(self._blocked_until, now + retry_after)
+            elif status_code < 400:
+                self.scale = min(1.0, self.scale + self.RECOVERY_STEP)
+
+
+def parse_retry_after(value):
+    """Return the ``Retry-After`` header as seconds, or None if missing or invalid."""
+    if not isinstance(value, str) or not value.strip():
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if timezone.is_naive(retry_at):
+        retry_at = retry_at.replace(tzinfo=dt_timezone.utc)
+    return max(0.0, (retry_at - timezone.now()).total_seconds())
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text
+    return max(1, len(text) // 4)
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Return the process-wide limiter shared by every Gemini call."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = AdaptiveRateLimiter(
+                settings.GEMINI_REQUESTS_PER_MINUTE,
+                settings.GEMINI_TOKENS_PER_MINUTE,
+            )
+        return _rate_limiter
+
+
+@receiver(setting_changed)
+def reset_rate_limiter(setting, **kwargs):
+    global _rate_limiter
+    if setting.startswith("GEMINI_"):
+        with _rate_limiter_lock:
+            _rate_limiter = None
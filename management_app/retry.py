@@ -0,0 +1,117 @@
+import random
+import threading
+import time
+
+# Responses worth another attempt: timeouts, throttling and server errors
+RETRYABLE_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter.
+
+    Attempt ``n`` (0-based) waits a random time between 0 and
+    ``min(max_delay, base_delay * 2 ** n)`` seconds, so callers that failed
+    together do not retry together. A ``Retry-After`` from the API is
+    always respected.
+    """
+
+    def __init__(self, max_attempts=4, base_delay=1.0, max_delay=30.0, random=random.random):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._random = random
+
+    def delay(self, attempt, retry_after=None):
+        backoff = min(self.max_delay, self.base_delay * 2 ** attempt) * self._random()
+        if retry_after is not None:
+            backoff = max(backoff, retry_after)
+        return backoff
+
+
+class CircuitBreaker:
+    """
+    Stops every caller from sending requests while the API keeps failing.
+
+    After ``failure_threshold`` failures in a row the circuit opens and
+    ``before_call`` blocks all threads for ``reset_timeout`` seconds. Then a
+    single probe request is let through: if it succeeds the circuit closes,
+    otherwise (including a 429, see ``record_throttled``) it opens again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(
+        self,
+        failure_threshold=5,
+        reset_timeout=30.0,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_until = 0.0
+        self._probing = False
+        self._probe_thread = None
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Block while the circuit is open; return seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self._clock()
+                if self.state == self.OPEN and now >= self._opened_until:
+                    self.state = self.HALF_OPEN
+                if self.state == self.CLOSED:
+                    return waited
+                if self.state == self.HALF_OPEN and not self._probing:
+                    self._probing = True
+                    self._probe_thread = threading.get_ident()
+                    return waited
+
+                if self.state == self.OPEN:
+                    delay = self._opened_until - now
+                else:
+                    # Wait for the probe of another thread to settle the state
+                    delay = min(1.0, self.reset_timeout)
+
+            self._sleep(delay)
+            waited += delay
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._open()
+            self._probing = False
+
+    def record_throttled(self):
+        # A 429 says nothing about the API's health, but it still settles a
+        # probe: the circuit opens again without counting a failure
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._open()
+                self._probing = False
+
+    def release_probe(self):
+        """Let another thread probe if this one's probe ended without a result."""
+        with self._lock:
+            if self._probing and self._probe_thread == threading.get_ident():
+                self._probing = False
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_until = self._clock() + self.reset_timeout
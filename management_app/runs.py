@@ -0,0 +1,204 @@
+from collections import defaultdict
+from datetime import timedelta
+from itertools import islice
+
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Q
+from django.utils import timezone
+from management_app.metrics import PENDING_TASKS
+from management_app.models import DeadLetter, GenerationRun, GenerationTask
+
+
+def record_pending_tasks():
+    """Set the pending-tasks gauge from the runs that are still queued or running."""
+    counts = (
+        GenerationTask.objects.filter(
+            status=GenerationTask.Status.PENDING,
+            run__status__in=[GenerationRun.Status.QUEUED, GenerationRun.Status.RUNNING],
+        )
+        .values_list("run__command")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+    PENDING_TASKS.clear()
+    for command, count in counts:
+        PENDING_TASKS.set(count, command=command)
+
+
+class RunTracker:
+    """
+    Checkpoint of one generation run, one ``GenerationTask`` row per hotel.
+
+    ``record`` queues a hotel's outcome and ``flush`` writes the queued
+    outcomes with a few bulk UPDATEs. Commands that buffer their own writes
+    flush the tracker right after each buffer flush (``auto_flush=False``),
+    so a hotel is only marked done once its output is in the database; the
+    others record and flush each outcome in the transaction that saves the
+    hotel's output.
+    Failed hotels are also written to the ``DeadLetter`` table, and removed
+    from it once they succeed.
+
+    Queued runs are shared by ``generation_worker`` processes: each worker
+    ``claim``s a few pending tasks at a time with ``SELECT ... FOR UPDATE
+    SKIP LOCKED`` and holds them under a lease, so no two workers send the
+    same hotel, and the tasks of a worker that dies are claimed again once
+    its lease expires.
+    """
+
+    def __init__(self, run, flush_rows=100, auto_flush=True):
+        self.run = run
+        self.flush_rows = flush_rows
+        self.auto_flush = auto_flush
+        self._outcomes = {}
+
+    @classmethod
+    def start(
+        cls,
+        command,
+        hotels,
+        chunk_size=2000,
+        status=GenerationRun.Status.RUNNING,
+        options=None,
+        **kwargs,
+    ):
+        """Create a run with a pending task for every hotel in ``hotels``."""
+        run = GenerationRun.objects.create(
+            command=command, status=status, options=options or {}
+        )
+        property_ids = hotels.values_list("property_id", flat=True).iterator(
+            chunk_size=chunk_size
+        )
+        while batch := list(islice(property_ids, chunk_size)):
+            GenerationTask.objects.bulk_create(
+                [GenerationTask(run=run, property_id=property_id) for property_id in batch],
+                ignore_conflicts=True,  # new_hotels may repeat a property_id
+            )
+        return cls(run, **kwargs)
+
+    @classmethod
+    def resume(cls, run_id, command, **kwargs):
+        try:
+            run = GenerationRun.objects.get(pk=run_id)
+        except GenerationRun.DoesNotExist:
+            raise CommandError(f"Generation run {run_id} does not exist")
+        if run.command != command:
+            raise CommandError(
+                f"Generation run {run_id} belongs to {run.command}, not {command}"
+            )
+        run.status = GenerationRun.Status.RUNNING
+        run.finished_at = None
+        run.save(update_fields=["status", "finished_at"])
+        return cls(run, **kwargs)
+
+    def open_condition(self):
+        # Hotels of this run that are not done yet (uses the (run, property_id) index)
+        return Exists(
+            GenerationTask.objects.filter(
+                run=self.run, property_id=OuterRef("property_id")
+            ).exclude(status=GenerationTask.Status.DONE)
+        )
+
+    def record(self, property_id, error=None):
+        # A later outcome for the same hotel (e.g. a failed write) replaces the earlier one
+        self._outcomes[property_id] = error
+        if self.auto_flush and len(self._outcomes) >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        outcomes, self._outcomes = self._outcomes, {}
+        if not outcomes:
+            return
+
+        by_error = defaultdict(list)
+        for property_id, error in outcomes.items():
+            by_error[error].append(property_id)
+
+        now = timezone.now()
+        with transaction.atomic():
+            for error, property_ids in by_error.items():
+                GenerationTask.objects.filter(
+                    run=self.run, property_id__in=property_ids
+                ).update(
+                    status=(
+                        GenerationTask.Status.DONE
+                        if error is None
+                        else GenerationTask.Status.FAILED
+                    ),
+                    attempts=F("attempts") + 1,
+                    last_error=error or "",
+                    lease_owner="",
+                    lease_expires_at=None,
+                    updated_at=now,
+                )
+
+            DeadLetter.objects.filter(
+                command=self.run.command, property_id__in=by_error.get(None, [])
+            ).delete()
+            DeadLetter.objects.bulk_create(
+                [
+                    DeadLetter(
+                        command=self.run.command,
+                        property_id=property_id,
+                        run=self.run,
+                        error=error,
+                        updated_at=now,
+                    )
+                    for property_id, error in outcomes.items()
+                    if error is not None
+                ],
+                update_conflicts=True,
+                unique_fields=["command", "property_id"],
+                update_fields=["run", "error", "updated_at"],
+            )
+
+    def claim(self, owner, limit, lease_seconds):
+        """Lease up to ``limit`` pending tasks to ``owner`` and return their property_ids."""
+        now = timezone.now()
+        with transaction.atomic():
+            # Rows locked by another worker's claim are skipped, not waited for
+            property_ids = list(
+                GenerationTask.objects.select_for_update(skip_locked=True)
+                .filter(run=self.run, status=GenerationTask.Status.PENDING)
+                .filter(Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lt=now))
+                .order_by("id")
+                .values_list("property_id", flat=True)[:limit]
+            )
+            GenerationTask.objects.filter(
+                run=self.run, property_id__in=property_ids
+            ).update(
+                lease_owner=owner,
+                lease_expires_at=now + timedelta(seconds=lease_seconds),
+                updated_at=now,
+            )
+        return property_ids
+
+    def release(self, owner):
+        # Give back pending tasks this worker claimed but did not finish
+        GenerationTask.objects.filter(
+            run=self.run, status=GenerationTask.Status.PENDING, lease_owner=owner
+        ).update(lease_owner="", lease_expires_at=None, updated_at=timezone.now())
+
+    def complete_if_drained(self):
+        """Mark a queued run completed once no task is pending; return True if it was."""
+        if self.run.tasks.filter(status=GenerationTask.Status.PENDING).exists():
+            return False
+        GenerationRun.objects.filter(
+            pk=self.run.pk, status=GenerationRun.Status.QUEUED
+        ).update(status=GenerationRun.Status.COMPLETED, finished_at=timezone.now())
+        return True
+
+    def finish(self, status):
+        self.flush()
+        self.run.status = status
+        self.run.finished_at = timezone.now()
+        self.run.save(update_fields=["status", "finished_at"])
+
+    def report(self):
+        counts = dict.fromkeys(GenerationTask.Status.values, 0)
+        for row in self.run.tasks.values("status").annotate(count=Count("id")):
+            counts[row["status"]] = row["count"]
+        return (
+            f"Generation run {self.run.pk}: {counts['done']} done, "
+            f"{counts['failed']} failed, {counts['pending']} pending"
+        )
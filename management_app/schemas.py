@@ -0,0 +1,93 @@
+# Response schemas sent with each Gemini request (generationConfig.responseSchema)
+# and the validator the parsers in utils.py check replies against.
+#
+# The schemas use the OpenAPI subset Gemini understands. Strings listed in
+# "required" must also be non-empty.
+
+REWRITE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "name": {"type": "STRING"},
+        "description": {"type": "STRING"},
+    },
+    "required": ["name", "description"],
+}
+
+SUMMARY_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "summary": {"type": "STRING"},
+    },
+    "required": ["summary"],
+}
+
+RATING_REVIEW_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "rating": {"type": "NUMBER"},
+        "review": {"type": "STRING"},
+    },
+    "required": ["rating", "review"],
+}
+
+ENRICH_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "name": {"type": "STRING"},
+        "description": {"type": "STRING"},
+        "summary": {"type": "STRING"},
+        "rating": {"type": "NUMBER"},
+        "review": {"type": "STRING"},
+    },
+    "required": ["name", "description", "summary", "rating", "review"],
+}
+
+
+def batch_schema(item_schema):
+    # A JSON array with one item_schema object per hotel, tagged with its property_id
+    return {
+        "type": "ARRAY",
+        "items": {
+            "type": "OBJECT",
+            "properties": {
+                "property_id": {"type": "INTEGER"},
+                **item_schema["properties"],
+            },
+            "required": ["property_id", *item_schema["required"]],
+        },
+    }
+
+
+class MalformedResponse(ValueError):
+    """
+    A reply that does not match the response schema or the task's content
+    rules (validators.py); the message says why.
+    """
+
+
+def validate(value, schema, path="reply"):
+    """Raise MalformedResponse if ``value`` does not match ``schema``."""
+    kind = schema["type"]
+    if kind == "OBJECT":
+        if not isinstance(value, dict):
+            raise MalformedResponse(f"{path} must be a JSON object")
+        for key in schema.get("required", []):
+            if value.get(key) in (None, ""):
+                raise MalformedResponse(f'{path} is missing "{key}"')
+        for key, field_schema in schema.get("properties", {}).items():
+            if key in value:
+                validate(value[key], field_schema, f"{path}.{key}")
+    elif kind == "ARRAY":
+        if not isinstance(value, list):
+            raise MalformedResponse(f"{path} must be a JSON array")
+        for index, item in enumerate(value):
+            validate(item, schema["items"], f"{path}[{index}]")
+    elif kind == "STRING":
+        if not isinstance(value, str):
+            raise MalformedResponse(f"{path} must be a string")
+    elif kind == "NUMBER":
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise MalformedResponse(f"{path} must be a number")
+    elif kind == "INTEGER":
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise MalformedResponse(f"{path} must be an integer")
@@ -0,0 +1,65 @@
+import threading
+from collections import OrderedDict
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces identical calls: one call per key is in flight at a time, and
+    every thread asking for the same key while it runs gets its result.
+
+    Results accepted by ``keep`` are also remembered (the ``max_results``
+    most recent, in memory only), so later duplicates in the same run are
+    answered without a call. Failed results are shared with the callers
+    already waiting but not remembered, so later duplicates try again.
+    """
+
+    def __init__(self, max_results=10000, keep=bool):
+        self.max_results = max_results
+        self.keep = keep
+        self.coalesced = 0
+        self._calls = {}
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args):
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.coalesced += 1
+                return self._results[key]
+
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                if call.error is None and self.max_results and self.keep(call.result):
+                    self._results[key] = call.result
+                    if len(self._results) > self.max_results:
+                        self._results.popitem(last=False)
+            call.done.set()
+
+        return call.result
@@ -1,14 +1,90 @@
-from django.test import TestCase
-from management_app.models import NewHotel, HotelSummary, HotelRatingReview
-from unittest.mock import patch
+from django.conf import settings
+from django.test import TestCase, override_settings
+from management_app.models import (
+    DeadLetter,
+    GenerationRun,
+    GenerationTask,
+    NewHotel,
+    HotelSummary,
+    HotelRatingReview,
+    LLMResponseCache,
+    hotel_fingerprint,
+)
+from management_app.cache import ResponseCache
+from management_app.runs import RunTracker
+from management_app.singleflight import SingleFlight
+from management_app.write_buffer import WriteBuffer
+from management_app.prompts import SUMMARY_PROMPT_VERSION
+from unittest import skipUnless
+from unittest.mock import MagicMock, patch
 from management_app.utils import (
+    parse_batch,
+    parse_enrichment,
+    parse_rating_review,
+    parse_summary,
     query_gemini_api,
     query_gemini_summary,
     query_gemini_ratings_reviews,
 )
-from django.core.management import call_command
-from django.db import connection
+from management_app.gemini import GeminiClient, get_gemini_client
+from management_app.context_cache import ContextCache
+from management_app.endpoints import Endpoint, EndpointPool
+from management_app.hedging import HedgePolicy
+from management_app.instrumentation import (
+    Reservoir,
+    get_run_stats,
+    latency_summary,
+    percentile,
+)
+from management_app.profiling import Profiler, phase
+from management_app.metrics import (
+    CONTENT_TYPE,
+    LLM_CALLS,
+    LLM_TOKENS,
+    Counter,
+    Histogram,
+    Registry,
+    exporting_metrics,
+    serve,
+)
+from management_app.retry import CircuitBreaker, RetryPolicy
+from management_app.schemas import SUMMARY_SCHEMA, MalformedResponse, validate
+from management_app.rate_limit import (
+    AdaptiveRateLimiter,
+    get_rate_limiter,
+    parse_retry_after,
+)
+from django.core.management import call_command, get_commands, load_command_class
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import CommandError
+from django.db import DatabaseError, IntegrityError, connection
+from django.utils import timezone
+from datetime import timedelta
 from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+import json
+import os
+import pstats
+import random
+import requests
+import shutil
+import signal
+import tempfile
+import threading
+import time
+
+
+def gemini_response(status_code=200, text="hello", headers=None, usage=None):
+    """Mock of a generateContent response whose answer is ``text``."""
+    response = MagicMock(status_code=status_code, text=text, headers=headers or {})
+    response.json.return_value = {
+        "candidates": [{"content": {"parts": [{"text": text}]}}]
+    }
+    if usage is not None:
+        response.json.return_value["usageMetadata"] = usage
+    return response
 
 
 class ModelsTestCase(TestCase):
@@ -64,6 +140,23 @@ class ModelsTestCase(TestCase):
             rating_review.review, "An amazing experience with excellent amenities."
         )
 
+    def test_one_summary_per_property(self):
+        HotelSummary.objects.create(property_id=214, summary="First.")
+
+        with self.assertRaises(IntegrityError):
+            HotelSummary.objects.create(property_id=214, summary="Duplicate.")
+
+    def test_upsert_rating_review(self):
+        HotelRatingReview.objects.create(property_id=214, rating=3.0, review="Old.")
+
+        HotelRatingReview.objects.upsert(
+            [HotelRatingReview(property_id=214, rating=4.5, review="New.")]
+        )
+
+        rating_review = HotelRatingReview.objects.get(property_id=214)
+        self.assertEqual(rating_review.rating, Decimal("4.50"))
+        self.assertEqual(rating_review.review, "New.")
+
     def test_manual_cascade_deletion(self):
         # Create a HotelSummary and HotelRatingReview for the NewHotel
         HotelSummary.objects.create(
@@ -93,8 +186,11 @@ class ModelsTestCase(TestCase):
         self.assertFalse(HotelRatingReview.objects.filter(property_id=214).exists())
 
 
+@override_settings(
+    GEMINI_API_KEY="test-key", GEMINI_REQUESTS_PER_MINUTE=6000, GEMINI_MAX_ATTEMPTS=1
+)
 class TestGeminiUtils(TestCase):
-    @patch("management_app.utils.requests.post")
+    @patch("management_app.gemini.requests.Session.post")
     def test_query_gemini_api_success(self, mock_post):
         # Mock a successful API response
         mock_response = {
@@ -103,7 +199,7 @@ class TestGeminiUtils(TestCase):
                     "content": {
                         "parts": [
                             {
-                                "text": "**Name:** Azure Torrent Retreat\n\n**Description:** A tranquil retreat with ocean views."
+                                "text": '{"name": "Azure Torrent Retreat", "description": "A tranquil retreat with ocean views."}'
                             }
                         ],
                         "role": "model",
@@ -121,7 +217,7 @@ class TestGeminiUtils(TestCase):
         self.assertEqual(result["name"], "Azure Torrent Retreat")
         self.assertEqual(result["description"], "A tranquil retreat with ocean views.")
 
-    @patch("management_app.utils.requests.post")
+    @patch("management_app.gemini.requests.Session.post")
     def test_query_gemini_summary_success(self, mock_post):
         # Mock a successful API response for summary
         mock_response = {
@@ -130,7 +226,7 @@ class TestGeminiUtils(TestCase):
                     "content": {
                         "parts": [
                             {
-                                "text": "A beautiful retreat with stunning views and modern amenities."
+                                "text": '{"summary": "A beautiful retreat with stunning views and modern amenities."}'
                             }
                         ],
                         "role": "model",
@@ -150,7 +246,7 @@ class TestGeminiUtils(TestCase):
             "A beautiful retreat with stunning views and modern amenities.",
         )
 
-    @patch("management_app.utils.requests.post")
+    @patch("management_app.gemini.requests.Session.post")
     def test_query_gemini_ratings_reviews_success(self, mock_post):
         # Mock a successful API response for ratings and reviews
         mock_response = {
@@ -159,7 +255,7 @@ class TestGeminiUtils(TestCase):
                     "content": {
                         "parts": [
                             {
-                                "text": "Rating: 4.5/5\n\nA wonderful stay with excellent service and amenities."
+                                "text": '{"rating": 4.5, "review": "A wonderful stay with excellent service and amenities."}'
                             }
                         ],
                         "role": "model",
@@ -179,7 +275,7 @@ class TestGeminiUtils(TestCase):
             result["review"], "A wonderful stay with excellent service and amenities."
         )
 
-    @patch("management_app.utils.requests.post")
+    @patch("management_app.gemini.requests.Session.post")
     def test_query_gemini_api_failure(self, mock_post):
         # Mock a failed API response
         mock_post.return_value.status_code = 400
@@ -190,7 +286,7 @@ class TestGeminiUtils(TestCase):
 
         self.assertIsNone(result)
 
-    @patch("management_app.utils.requests.post")
+    @patch("management_app.gemini.requests.Session.post")
     def test_query_gemini_summary_failure(self, mock_post):
         # Mock a failed API response for summary
         mock_post.return_value.status_code = 500
@@ -201,7 +297,7 @@ class TestGeminiUtils(TestCase):
 
         self.assertIsNone(result)
 
-    @patch("management_app.utils.requests.post")
+    @patch("management_app.gemini.requests.Session.post")
     def test_query_gemini_ratings_reviews_failure(self, mock_post):
         # Mock a failed API response for ratings and reviews
         mock_post.return_value.status_code = 429
@@ -212,6 +308,887 @@ class TestGeminiUtils(TestCase):
 
         self.assertIsNone(result)
 
+    @patch("management_app.gemini.requests.Session.post")
+    def test_rate_limited_call_reports_throttling(self, mock_post):
+        mock_post.return_value.status_code = 429
+        mock_post.return_value.headers = {}
+        mock_post.return_value.text = "Rate Limit Exceeded"
+
+        limiter = get_rate_limiter()
+        scale = limiter.scale
+        query_gemini_summary("Generate a summary for the following hotel.")
+
+        # The shared limiter backs off after the 429
+        self.assertEqual(limiter.scale, scale * AdaptiveRateLimiter.BACKOFF_FACTOR)
+
+
+@override_settings(
+    GEMINI_REQUESTS_PER_MINUTE=6000,
+    GEMINI_API_KEY="test-key",
+    GEMINI_READ_TIMEOUT=30,
+)
+class GeminiClientTest(TestCase):
+    def test_commands_share_one_client(self):
+        self.assertIs(get_gemini_client(), get_gemini_client())
+
+    @patch("management_app.gemini.requests.Session.post")
+    def test_requests_reuse_session_with_timeouts(self, mock_post):
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {
+            "candidates": [
+                {"content": {"parts": [{"text": '{"summary": "S", "rating": 4, "review": "R"}'}]}}
+            ]
+        }
+
+        query_gemini_summary("First prompt")
+        query_gemini_ratings_reviews("Second prompt")
+
+        self.assertEqual(mock_post.call_count, 2)
+        url = mock_post.call_args.args[0]
+        self.assertTrue(url.endswith("/models/gemini-1.5-flash:generateContent"))
+        self.assertNotIn("key=", url)
+        self.assertEqual(mock_post.call_args.kwargs["timeout"], (5.0, 30))
+        self.assertEqual(mock_post.call_args.kwargs["headers"]["x-goog-api-key"], "test-key")
+
+    @override_settings(GEMINI_API_KEY="", GEMINI_ENDPOINTS=[])
+    @patch("management_app.gemini.requests.Session.post")
+    def test_missing_api_key_stops_the_run(self, mock_post):
+        NewHotel.objects.create(
+            property_id=101,
+            name="Hotel Alpha",
+            description="Details",
+            location="Location",
+            latitude=12.34,
+            longitude=56.78,
+            city_name="City",
+        )
+
+        with self.assertRaisesMessage(ImproperlyConfigured, "GEMINI_API_KEY"):
+            call_command("generate_summaries", no_cache=True, stdout=StringIO())
+
+        mock_post.assert_not_called()
+        # The hotel is left pending for --resume
+        self.assertEqual(GenerationTask.objects.get().status, GenerationTask.Status.PENDING)
+
+    @override_settings(GEMINI_ENDPOINTS=[{"api_key": "key-1"}, {"model": "model-b"}])
+    def test_endpoint_without_api_key(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, "needs an api_key"):
+            get_gemini_client()
+
+    def test_custom_parser(self):
+        client = GeminiClient(api_key="test-key", model="test-model")
+        with patch.object(client.session, "post") as mock_post:
+            mock_post.return_value = gemini_response()
+            result = client.generate("prompt", lambda text: text.upper())
+
+        self.assertEqual(result, "HELLO")
+
+
+class StructuredOutputTest(TestCase):
+    def test_validate(self):
+        validate({"summary": "Fine"}, SUMMARY_SCHEMA)
+        for value, error in [
+            ([], "must be a JSON object"),
+            ({}, 'missing "summary"'),
+            ({"summary": ""}, 'missing "summary"'),
+            ({"summary": 3}, "reply.summary must be a string"),
+        ]:
+            with self.assertRaisesMessage(MalformedResponse, error):
+                validate(value, SUMMARY_SCHEMA)
+
+    def test_rating_review_parser(self):
+        self.assertEqual(
+            parse_rating_review('{"rating": 4, "review": " Lovely. "}'),
+            {"rating": 4.0, "review": "Lovely."},
+        )
+        # The old silent fallback to rating 0.0 is gone
+        with self.assertRaisesMessage(MalformedResponse, "not valid JSON"):
+            parse_rating_review("Rating: 4.5/5\n\nLovely.")
+        with self.assertRaisesMessage(MalformedResponse, "reply.rating must be a number"):
+            parse_rating_review('{"rating": "four", "review": "Lovely."}')
+
+    @override_settings(
+        GEMINI_API_KEY="test-key", GEMINI_REQUESTS_PER_MINUTE=6000, GEMINI_MAX_ATTEMPTS=1
+    )
+    @patch("management_app.gemini.requests.Session.post")
+    def test_request_declares_schema(self, mock_post):
+        mock_post.return_value = gemini_response(text='{"summary": "Nice."}')
+
+        self.assertEqual(query_gemini_summary("prompt"), {"summary": "Nice."})
+
+        config = mock_post.call_args.kwargs["json"]["generationConfig"]
+        self.assertEqual(config["responseMimeType"], "application/json")
+        self.assertEqual(config["responseSchema"], SUMMARY_SCHEMA)
+
+    def test_malformed_reply_is_asked_again_once(self):
+        client = GeminiClient(api_key="test-key", model="test-model")
+        with patch.object(client.session, "post") as mock_post:
+            mock_post.side_effect = [
+                gemini_response(text='{"summary": ""}'),
+                gemini_response(text='{"summary": "Fixed."}'),
+            ]
+            with self.assertLogs("management_app.gemini", "WARNING") as logs:
+                result = client.generate("prompt", parse_summary)
+
+        self.assertEqual(result, {"summary": "Fixed."})
+        self.assertIn('Malformed response (reply is missing "summary")', logs.output[0])
+        contents = mock_post.call_args.kwargs["json"]["contents"]
+        self.assertEqual([content["role"] for content in contents], ["user", "model", "user"])
+        self.assertEqual(contents[1]["parts"][0]["text"], '{"summary": ""}')
+        self.assertIn('missing "summary"', contents[2]["parts"][0]["text"])
+
+    def test_gives_up_after_max_repairs(self):
+        client = GeminiClient(api_key="test-key", model="test-model", max_repairs=2)
+        with patch.object(client.session, "post") as mock_post:
+            mock_post.return_value = gemini_response(text="not json")
+            with self.assertRaisesMessage(MalformedResponse, "not valid JSON"):
+                client.generate("prompt", parse_summary)
+
+        self.assertEqual(mock_post.call_count, 3)
+
+
+class RetryTest(TestCase):
+    def setUp(self):
+        self.sleeps = []
+
+    def make_client(self, max_attempts=4, circuit_breaker=None):
+        return GeminiClient(
+            api_key="test-key",
+            model="test-model",
+            retry_policy=RetryPolicy(
+                max_attempts=max_attempts, base_delay=1.0, max_delay=8.0, random=lambda: 1.0
+            ),
+            circuit_breaker=circuit_breaker,
+            sleep=self.sleeps.append,
+        )
+
+    def test_retries_server_errors_with_backoff(self):
+        client = self.make_client()
+        with patch.object(client.session, "post") as mock_post:
+            mock_post.side_effect = [
+                gemini_response(503),
+                requests.exceptions.ReadTimeout("timed out"),
+                gemini_response(200),
+            ]
+            result = client.generate("prompt", str.upper)
+
+        self.assertEqual(result, "HELLO")
+        self.assertEqual(mock_post.call_count, 3)
+        self.assertEqual(self.sleeps, [1.0, 2.0])
+
+    def test_gives_up_after_max_attempts(self):
+        client = self.make_client(max_attempts=5)
+        with patch.object(client.session, "post") as mock_post:
+            mock_post.return_value = gemini_response(500)
+            result = client.generate("prompt", str.upper)
+
+        self.assertIsNone(result)
+        self.assertEqual(mock_post.call_count, 5)
+        # Capped at max_delay
+        self.assertEqual(self.sleeps, [1.0, 2.0, 4.0, 8.0])
+
+    def test_client_errors_are_not_retried(self):
+        client = self.make_client()
+        with patch.object(client.session, "post") as mock_post:
+            mock_post.return_value = gemini_response(400)
+            self.assertIsNone(client.generate("prompt", str.upper))
+
+        self.assertEqual(mock_post.call_count, 1)
+
+    def test_retry_after_is_respected(self):
+        client = self.make_client(max_attempts=2)
+        with patch.object(client.session, "post") as mock_post:
+            mock_post.side_effect = [
+                gemini_response(429, headers={"Retry-After": "20"}),
+                gemini_response(200),
+            ]
+            client.generate("prompt", str.upper)
+
+        self.assertEqual(self.sleeps, [20.0])
+
+    def test_jitter_spreads_delays(self):
+        policy = RetryPolicy(base_delay=1.0, max_delay=30.0, random=lambda: 0.25)
+        self.assertEqual(policy.delay(3), 2.0)
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        now = [0.0]
+        waits = []
+
+        def sleep(seconds):
+            waits.append(seconds)
+            now[0] += seconds
+
+        breaker = CircuitBreaker(
+            failure_threshold=2, reset_timeout=30, clock=lambda: now[0], sleep=sleep
+        )
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        # Callers wait until the probe is allowed
+        self.assertEqual(breaker.before_call(), 30)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+
+        # A failed probe opens the circuit again
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.before_call(), 0.0)
+
+    def test_open_circuit_pauses_client(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, sleep=self.sleeps.append)
+        client = self.make_client(max_attempts=1, circuit_breaker=breaker)
+        with patch.object(client.session, "post") as mock_post:
+            mock_post.return_value = gemini_response(500)
+            client.generate("first", str.upper)
+            client.generate("second", str.upper)
+            self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+            breaker._opened_until = 0.0  # Let the probe through without waiting
+            mock_post.return_value = gemini_response(200)
+            self.assertEqual(client.generate("third", str.upper), "HELLO")
+
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def make_clocked_breaker(self):
+        now = [0.0]
+
+        def sleep(seconds):
+            if len(self.sleeps) > 20:
+                raise AssertionError("The circuit breaker never settled")
+            self.sleeps.append(seconds)
+            now[0] += seconds
+
+        breaker = CircuitBreaker(
+            failure_threshold=1, reset_timeout=30, clock=lambda: now[0], sleep=sleep
+        )
+        return breaker, sleep
+
+    def test_throttled_probe_reopens_circuit(self):
+        breaker, sleep = self.make_clocked_breaker()
+        client = self.make_client(max_attempts=3, circuit_breaker=breaker)
+        client._sleep = sleep
+        with patch.object(client.session, "post") as mock_post:
+            mock_post.side_effect = [
+                gemini_response(500),
+                gemini_response(429),
+                gemini_response(200),
+            ]
+            self.assertEqual(client.generate("prompt", str.upper), "HELLO")
+
+        self.assertEqual(mock_post.call_count, 3)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertFalse(breaker._probing)
+
+    def test_probe_that_raises_is_released(self):
+        breaker, _ = self.make_clocked_breaker()
+        breaker.record_failure()
+        breaker._opened_until = 0.0  # The next call is the probe
+        client = self.make_client(max_attempts=1, circuit_breaker=breaker)
+        with patch.object(client.session, "post", side_effect=ValueError("bad payload")):
+            with self.assertRaises(ValueError):
+                client.generate("prompt", str.upper)
+
+        # Another caller can probe instead of waiting forever
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker._probing)
+        self.assertEqual(breaker.before_call(), 0.0)
+
+
+class HedgedRequestTest(TestCase):
+    def make_policy(self, latency=0.01, **kwargs):
+        policy = HedgePolicy(percentile=95, min_samples=20, **kwargs)
+        for _ in range(20):
+            policy.record_latency(latency)
+        return policy
+
+    def test_percentile_of_recent_latencies(self):
+        policy = HedgePolicy(percentile=95, min_samples=20)
+        for latency in range(1, 20):
+            policy.record_latency(latency)
+        self.assertIsNone(policy.delay())
+
+        policy.record_latency(20)
+        self.assertEqual(policy.delay(), 19)
+
+    def test_budget_limits_hedges(self):
+        policy = HedgePolicy(budget=0.1)
+        for _ in range(20):
+            policy.record_request()
+
+        self.assertTrue(policy.try_hedge())
+        self.assertTrue(policy.try_hedge())
+        self.assertFalse(policy.try_hedge())
+
+    def test_slow_request_is_hedged(self):
+        client = GeminiClient(
+            api_key="test-key", model="test-model", hedge_policy=self.make_policy(budget=1.0)
+        )
+        release = threading.Event()
+        replies = iter(["slow", "fast"])
+
+        def post(*args, **kwargs):
+            text = next(replies)
+            if text == "slow":
+                release.wait(5)
+            return gemini_response(text=text)
+
+        try:
+            with patch.object(client.session, "post", side_effect=post) as mock_post:
+                result = client.generate("prompt", str.upper)
+        finally:
+            release.set()
+
+        self.assertEqual(result, "FAST")
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(client.hedge_policy.hedges, 1)
+
+    def test_no_hedge_without_budget(self):
+        client = GeminiClient(
+            api_key="test-key", model="test-model", hedge_policy=self.make_policy(budget=0)
+        )
+        with patch.object(client.session, "post") as mock_post:
+            mock_post.side_effect = lambda *args, **kwargs: (
+                time.sleep(0.05) or gemini_response(text="slow")
+            )
+            result = client.generate("prompt", str.upper)
+
+        self.assertEqual(result, "SLOW")
+        self.assertEqual(mock_post.call_count, 1)
+
+
+class EndpointPoolTest(TestCase):
+    def setUp(self):
+        self.now = 0.0
+
+    def make_pool(self, *endpoints):
+        return EndpointPool(endpoints, failover_seconds=5, clock=lambda: self.now)
+
+    def test_routes_to_least_loaded_endpoint(self):
+        first = Endpoint("key-1", "model-a")
+        second = Endpoint("key-2", "model-b", weight=2)
+        pool = self.make_pool(first, second)
+
+        picked = [pool.acquire() for _ in range(3)]
+
+        # The endpoint with twice the weight takes twice the requests
+        self.assertEqual(picked.count(second), 2)
+        self.assertEqual(picked.count(first), 1)
+
+    def test_failing_endpoint_is_skipped_until_it_recovers(self):
+        first = Endpoint("key-1", "model-a")
+        second = Endpoint("key-2", "model-b")
+        pool = self.make_pool(first, second)
+
+        pool.release(pool.acquire(), failed=True)
+        self.assertIs(pool.acquire(), second)
+        pool.release(second)
+        self.assertIs(pool.acquire(), second)
+        pool.release(second)
+
+        self.now = 6.0
+        self.assertIs(pool.acquire(), first)
+
+    def test_failover_backs_off_on_repeated_failures(self):
+        endpoint = Endpoint("key-1", "model-a")
+        pool = self.make_pool(endpoint)
+
+        pool.release(pool.acquire(), failed=True)
+        pool.release(pool.acquire(), failed=True)
+        self.assertEqual(endpoint.unavailable_until, 10.0)
+
+        # The only endpoint is still used while it is failing
+        self.assertIs(pool.acquire(), endpoint)
+
+    def test_client_fails_over_to_next_endpoint(self):
+        client = GeminiClient(
+            endpoints=[Endpoint("key-1", "model-a"), Endpoint("key-2", "model-b")],
+            retry_policy=RetryPolicy(max_attempts=2, base_delay=0),
+        )
+        with patch.object(client.session, "post") as mock_post:
+            mock_post.side_effect = [gemini_response(429), gemini_response(200)]
+            result = client.generate("prompt", str.upper)
+
+        self.assertEqual(result, "HELLO")
+        urls = [call.args[0] for call in mock_post.call_args_list]
+        keys = [call.kwargs["headers"]["x-goog-api-key"] for call in mock_post.call_args_list]
+        self.assertTrue(urls[0].endswith("/models/model-a:generateContent"))
+        self.assertTrue(urls[1].endswith("/models/model-b:generateContent"))
+        self.assertEqual(keys, ["key-1", "key-2"])
+
+    @override_settings(
+        GEMINI_ENDPOINTS=[
+            {"api_key": "key-1", "requests_per_minute": 60},
+            {"api_key": "key-2", "model": "gemini-1.5-pro", "weight": 3},
+        ],
+        GEMINI_REQUESTS_PER_MINUTE=15,
+    )
+    def test_endpoints_from_settings(self):
+        first, second = get_gemini_client().endpoints.endpoints
+
+        self.assertEqual((first.api_key, first.model), ("key-1", "gemini-1.5-flash"))
+        self.assertEqual(first.rate_limiter.requests_per_minute, 60)
+        self.assertEqual((second.model, second.weight), ("gemini-1.5-pro", 3))
+        self.assertEqual(second.rate_limiter.requests_per_minute, 15)
+        # Each endpoint has its own quota
+        self.assertIsNot(first.rate_limiter, second.rate_limiter)
+
+
+class StandInGeminiServer(ThreadingHTTPServer):
+    """Local stand-in for the cachedContents and generateContent endpoints."""
+
+    def __init__(self, cache_status=200, cache_failures=0):
+        super().__init__(("127.0.0.1", 0), StandInGeminiHandler)
+        self.cache_status = cache_status
+        self.cache_failures = cache_failures  # 503s before registrations succeed
+        self.cached = {}
+        self.created = 0
+        self.requests = []
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StandInGeminiHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server.requests.append((self.path, body))
+
+        if self.path == "/cachedContents":
+            if server.cache_failures:
+                server.cache_failures -= 1
+                return self.reply(503, {"error": {"message": "Unavailable"}})
+            if server.cache_status != 200:
+                return self.reply(server.cache_status, {"error": {"message": "Too small"}})
+            server.created += 1
+            name = f"cachedContents/{server.created}"
+            server.cached[name] = body["systemInstruction"]
+            return self.reply(200, {"name": name})
+
+        if body["contents"][0]["parts"][0]["text"] == "bad":
+            return self.reply(400, {"error": {"message": "Invalid value at 'contents'"}})
+        if "cachedContent" in body:
+            instruction = server.cached.get(body["cachedContent"])
+            if instruction is None:
+                return self.reply(404, {"error": {"message": "CachedContent not found"}})
+        else:
+            instruction = body["systemInstruction"]
+        text = f"{instruction['parts'][0]['text']} / {body['contents'][0]['parts'][0]['text']}"
+        self.reply(200, {"candidates": [{"content": {"parts": [{"text": text}]}}]})
+
+    def reply(self, status, data):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class ContextCacheTest(TestCase):
+    def gemini_client(self, server, context_cache=None, **kwargs):
+        return GeminiClient(
+            api_key="test-key",
+            model="test-model",
+            base_url=server.base_url,
+            context_cache=context_cache,
+            **kwargs,
+        )
+
+    def start_server(self, **kwargs):
+        server = StandInGeminiServer(**kwargs)
+        self.addCleanup(server.stop)
+        return server
+
+    def test_instruction_is_sent_inline_by_default(self):
+        server = self.start_server()
+        client = self.gemini_client(server)
+
+        result = client.generate("hotel", str, system_instruction="Summarize")
+
+        self.assertEqual(result, "Summarize / hotel")
+        path, body = server.requests[0]
+        self.assertEqual(path, "/models/test-model:generateContent")
+        self.assertEqual(body["systemInstruction"], {"parts": [{"text": "Summarize"}]})
+
+    def test_instruction_is_cached_once(self):
+        server = self.start_server()
+        client = self.gemini_client(server, ContextCache(ttl=600))
+
+        results = [
+            client.generate(prompt, str, system_instruction="Summarize")
+            for prompt in ("first", "second", "third")
+        ]
+
+        self.assertEqual(results[2], "Summarize / third")
+        paths = [path for path, _ in server.requests]
+        self.assertEqual(paths.count("/cachedContents"), 1)
+        _, registration = server.requests[0]
+        self.assertEqual(registration["model"], "models/test-model")
+        self.assertEqual(registration["ttl"], "600s")
+        for _, body in server.requests[1:]:
+            self.assertEqual(body["cachedContent"], "cachedContents/1")
+            self.assertNotIn("systemInstruction", body)
+
+    def test_expired_cache_entry_is_created_again(self):
+        now = [0.0]
+        server = self.start_server()
+        client = self.gemini_client(server, ContextCache(ttl=600, clock=lambda: now[0]))
+
+        client.generate("first", str, system_instruction="Summarize")
+        now[0] = 590  # Within refresh_margin of the TTL
+        client.generate("second", str, system_instruction="Summarize")
+
+        self.assertEqual(server.requests[-1][1]["cachedContent"], "cachedContents/2")
+
+    def test_falls_back_to_inline_instruction(self):
+        # Registration refused (e.g. below the API's minimum size for caching)
+        server = self.start_server(cache_status=400)
+        client = self.gemini_client(server, ContextCache(ttl=600))
+
+        self.assertEqual(
+            client.generate("first", str, system_instruction="Summarize"), "Summarize / first"
+        )
+        client.generate("second", str, system_instruction="Summarize")
+
+        paths = [path for path, _ in server.requests]
+        self.assertEqual(paths.count("/cachedContents"), 1)
+        self.assertIn("systemInstruction", server.requests[-1][1])
+
+    def test_deleted_cache_entry_is_resent_inline(self):
+        server = self.start_server()
+        client = self.gemini_client(server, ContextCache(ttl=600))
+        client.generate("first", str, system_instruction="Summarize")
+        server.cached.clear()
+
+        result = client.generate("second", str, system_instruction="Summarize")
+
+        self.assertEqual(result, "Summarize / second")
+        self.assertIn("systemInstruction", server.requests[-1][1])
+        # The next call registers the instruction again
+        client.generate("third", str, system_instruction="Summarize")
+        self.assertEqual(server.requests[-1][1]["cachedContent"], "cachedContents/2")
+
+    def test_bad_request_keeps_cache_entry(self):
+        server = self.start_server()
+        client = self.gemini_client(server, ContextCache(ttl=600))
+        client.generate("first", str, system_instruction="Summarize")
+
+        self.assertIsNone(client.generate("bad", str, system_instruction="Summarize"))
+
+        # Sent once, with the cached content, which is still used afterwards
+        self.assertEqual(server.requests[-1][1]["cachedContent"], "cachedContents/1")
+        client.generate("second", str, system_instruction="Summarize")
+        paths = [path for path, _ in server.requests]
+        self.assertEqual(paths.count("/cachedContents"), 1)
+        self.assertEqual(len(paths), 4)
+
+    def test_registration_is_retried_and_recorded(self):
+        server = self.start_server(cache_failures=1)
+        sleeps = []
+        client = self.gemini_client(
+            server,
+            ContextCache(ttl=600),
+            retry_policy=RetryPolicy(max_attempts=2, random=lambda: 0.0),
+            sleep=sleeps.append,
+        )
+        stats = get_run_stats()
+        stats.reset()
+
+        result = client.generate("first", str, system_instruction="Summarize")
+
+        self.assertEqual(result, "Summarize / first")
+        self.assertEqual(server.requests[-1][1]["cachedContent"], "cachedContents/1")
+        self.assertEqual(stats.statuses, {"503": 1, "200": 2})
+        self.assertEqual(stats.retries, 1)
+
+    def test_hedged_probe_creates_cached_content(self):
+        server = self.start_server()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+        breaker._opened_until = 0.0  # The next call is the half-open probe
+        hedge_policy = HedgePolicy(percentile=95, budget=1.0, min_samples=1)
+        hedge_policy.record_latency(5)
+        client = self.gemini_client(
+            server,
+            ContextCache(ttl=600),
+            circuit_breaker=breaker,
+            hedge_policy=hedge_policy,
+        )
+
+        # The cached content is created on a hedge executor thread, not the probe's
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(
+                client.generate, "first", str, system_instruction="Summarize"
+            )
+            try:
+                result = future.result(timeout=5)
+            finally:
+                breaker.record_success()  # Unblock a deadlocked call before exiting
+
+        self.assertEqual(result, "Summarize / first")
+        self.assertEqual(server.requests[-1][1]["cachedContent"], "cachedContents/1")
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_creation_only_blocks_its_own_key(self):
+        cache = ContextCache(ttl=600)
+        started, release = threading.Event(), threading.Event()
+        created = []
+
+        def slow_create():
+            started.set()
+            release.wait(5)
+            created.append("a")
+            return "cachedContents/a"
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            first = executor.submit(cache.get, "a", slow_create)
+            started.wait(5)
+            same_key = executor.submit(cache.get, "a", lambda: created.append("dup"))
+            # Another key is created while "a" is still being created
+            self.assertEqual(cache.get("b", lambda: "cachedContents/b"), "cachedContents/b")
+            self.assertFalse(same_key.done())
+            release.set()
+
+            self.assertEqual(first.result(), "cachedContents/a")
+            self.assertEqual(same_key.result(), "cachedContents/a")
+        self.assertEqual(created, ["a"])
+
+
+class InstrumentationTest(TestCase):
+    def setUp(self):
+        self.stats = get_run_stats()
+        self.stats.reset()
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([3.0], 95), 3.0)
+        self.assertIsNone(percentile([], 50))
+
+    def test_latencies_are_sampled_in_bounded_memory(self):
+        reservoir = Reservoir(size=100, random=random.Random(0).random)
+        for latency in range(1, 10001):
+            reservoir.add(latency / 1000)
+
+        self.assertEqual(len(reservoir.values), 100)
+        summary = latency_summary(reservoir)
+        self.assertEqual(summary["count"], 10000)
+        # A uniform sample of 1..10s: its median is close to 5s
+        self.assertLess(abs(summary["p50"] - 5), 1.5)
+
+    def test_client_records_calls_retries_and_tokens(self):
+        client = GeminiClient(
+            api_key="test-key",
+            model="test-model",
+            retry_policy=RetryPolicy(max_attempts=3, random=lambda: 0.0),
+            sleep=lambda seconds: None,
+        )
+        with patch.object(client.session, "post") as mock_post:
+            mock_post.side_effect = [
+                gemini_response(503),
+                requests.exceptions.ConnectionError("refused"),
+                gemini_response(
+                    200, usage={"promptTokenCount": 12, "candidatesTokenCount": 30}
+                ),
+            ]
+            self.assertEqual(client.generate("prompt", str.upper), "HELLO")
+
+        data = self.stats.as_dict()
+        self.assertEqual(data["api_calls"]["count"], 3)
+        self.assertEqual(data["statuses"], {"200": 1, "503": 1, "error": 1})
+        self.assertEqual(data["retries"], 2)
+        self.assertEqual((data["prompt_tokens"], data["output_tokens"]), (12, 30))
+
+    def test_full_responses_are_only_logged_when_sampled(self):
+        client = GeminiClient(api_key="test-key", model="test-model", random=lambda: 0.5)
+        with patch.object(client.session, "post") as mock_post:
+            mock_post.return_value = gemini_response(200)
+            with self.assertNoLogs("management_app.gemini", "DEBUG"):
+                client.generate("prompt", str.upper)
+
+            client.debug_sample_rate = 0.6
+            with self.assertLogs("management_app.gemini", "DEBUG") as logs:
+                client.generate("prompt", str.upper)
+        self.assertIn("Gemini response 200", logs.output[0])
+
+    @patch("management_app.management.commands.generate_summaries.query_gemini_summary")
+    def test_command_reports_run_stats(self, mock_query_gemini_summary):
+        mock_query_gemini_summary.side_effect = [{"summary": "One"}, None]
+        for property_id in (101, 102):
+            NewHotel.objects.create(
+                property_id=property_id,
+                name=f"Hotel {property_id}",
+                description="Details",
+                location="Location",
+                latitude=12.34,
+                longitude=56.78,
+                city_name="City",
+            )
+        stdout = StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "stats.json")
+            call_command(
+                "generate_summaries", stats_json=path, stdout=stdout, stderr=StringIO()
+            )
+            with open(path) as f:
+                data = json.load(f)
+
+        self.assertIn("Performance: 2 hotels in", stdout.getvalue())
+        self.assertIn("DB writes:", stdout.getvalue())
+        self.assertEqual((data["hotels"], data["failures"]), (2, 1))
+        self.assertEqual((data["cache_hits"], data["cache_misses"]), (0, 2))
+        self.assertGreater(data["db_writes"]["count"], 0)
+        self.assertGreater(data["db_reads"]["count"], 0)
+
+
+class MetricsTest(TestCase):
+    def test_text_exposition_format(self):
+        registry = Registry()
+        calls = registry.register(Counter("calls_total", "Calls", ("status",)))
+        latency = registry.register(Histogram("latency_seconds", "Latency", buckets=(0.1, 1)))
+        calls.inc(status="200")
+        calls.inc(2, status='5"x')
+        latency.observe(0.05)
+        latency.observe(3)
+
+        self.assertEqual(
+            registry.render().splitlines(),
+            [
+                "# HELP calls_total Calls",
+                "# TYPE calls_total counter",
+                'calls_total{status="200"} 1',
+                'calls_total{status="5\\"x"} 2',
+                "# HELP latency_seconds Latency",
+                "# TYPE latency_seconds histogram",
+                'latency_seconds_bucket{le="0.1"} 1',
+                'latency_seconds_bucket{le="1.0"} 1',
+                'latency_seconds_bucket{le="+Inf"} 2',
+                "latency_seconds_sum 3.05",
+                "latency_seconds_count 2",
+            ],
+        )
+        with self.assertRaises(ValueError):
+            calls.inc(code="200")
+
+    def test_metrics_endpoint(self):
+        GenerationRun.objects.create(
+            command="generate_summaries", status=GenerationRun.Status.QUEUED
+        ).tasks.create(property_id=101)
+        self.client.get("/admin/login/")
+
+        response = self.client.get("/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], CONTENT_TYPE)
+        body = response.content.decode()
+        self.assertIn('generation_pending_tasks{command="generate_summaries"} 1', body)
+        self.assertIn(
+            'http_request_duration_seconds_count{method="GET",route="admin/login/",status="200"}',
+            body,
+        )
+        self.assertIn('db_query_duration_seconds_count{kind="read"}', body)
+
+    @override_settings(
+        GEMINI_API_KEY="test-key", GEMINI_REQUESTS_PER_MINUTE=6000, GEMINI_MAX_ATTEMPTS=1
+    )
+    @patch("management_app.gemini.requests.Session.post")
+    def test_client_counts_calls_by_task(self, mock_post):
+        mock_post.return_value = gemini_response(
+            text='{"summary": "Nice."}',
+            usage={"promptTokenCount": 7, "candidatesTokenCount": 3},
+        )
+        labels = {"task": "summary", "model": settings.GEMINI_MODEL}
+        calls = LLM_CALLS.value(status="200", **labels)
+        tokens = LLM_TOKENS.value(kind="output", **labels)
+
+        query_gemini_summary("prompt")
+
+        self.assertEqual(LLM_CALLS.value(status="200", **labels), calls + 1)
+        self.assertEqual(LLM_TOKENS.value(kind="output", **labels), tokens + 3)
+
+    def test_commands_serve_and_push_metrics(self):
+        server = serve(0, host="127.0.0.1")
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        response = requests.get(f"http://127.0.0.1:{server.server_address[1]}/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("# TYPE llm_calls_total counter", response.text)
+
+        with override_settings(METRICS_PUSHGATEWAY_URL="http://pushgateway:9091"):
+            with patch("management_app.metrics.requests.put") as mock_put:
+                with exporting_metrics("generate_summaries"):
+                    pass
+        self.assertEqual(
+            mock_put.call_args.args[0], "http://pushgateway:9091/metrics/job/generate_summaries"
+        )
+
+
+class AdaptiveRateLimiterTest(TestCase):
+    def setUp(self):
+        # Fake clock so the tests never really sleep
+        self.now = 0.0
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def make_limiter(self, requests_per_minute, tokens_per_minute=None):
+        return AdaptiveRateLimiter(
+            requests_per_minute, tokens_per_minute, clock=self.clock, sleep=self.sleep
+        )
+
+    def test_requests_are_paced_to_quota(self):
+        limiter = self.make_limiter(requests_per_minute=30)
+
+        waits = [limiter.acquire() for _ in range(4)]
+
+        # The first call is free, then one call every 2 seconds
+        self.assertEqual(waits, [0.0, 2.0, 2.0, 2.0])
+
+    def test_token_quota_slows_large_prompts(self):
+        limiter = self.make_limiter(requests_per_minute=6000, tokens_per_minute=6000)
+
+        self.assertEqual(limiter.acquire(tokens=100), 0.0)
+        # The bucket holds 100 tokens and refills 100 tokens/second
+        self.assertAlmostEqual(limiter.acquire(tokens=100), 1.0)
+
+    def test_throttling_respects_retry_after_and_recovers(self):
+        limiter = self.make_limiter(requests_per_minute=60)
+        limiter.acquire()
+
+        limiter.record_response(429, retry_after=10)
+        self.assertEqual(limiter.scale, 0.5)
+        self.assertAlmostEqual(limiter.acquire(), 10.0)
+
+        for _ in range(20):
+            limiter.record_response(200)
+        self.assertEqual(limiter.scale, 1.0)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after("12"), 12.0)
+        self.assertEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0.0)
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertIsNone(parse_retry_after(None))
+
 
 class CopyHotelDataCommandTest(TestCase):
     def setUp(self):
@@ -294,6 +1271,87 @@ class CopyHotelDataCommandTest(TestCase):
         self.assertEqual(new_hotel2.city_name, "City B")
         self.assertEqual(new_hotel2.rating, 3.8)
 
+    def test_sync_keeps_generated_fields(self):
+        # Hotel 101 was already copied and rewritten by the LLM
+        NewHotel.objects.create(
+            property_id=101,
+            name="Alpha Retreat",
+            description="A generated description.",
+            rating=3.0,
+            location="Location A",
+            latitude=12.34,
+            longitude=56.78,
+            room_type="Deluxe",
+            price=180.0,
+            image_path="/images/hotel_alpha.jpg",
+            city_id=1,
+            city_name="City A",
+        )
+        HotelSummary.objects.create(property_id=999, summary="Old summary.")
+
+        call_command("copy_hotel_data", sync=True)
+
+        # New hotels are inserted and vanished ones are kept by default
+        self.assertEqual(NewHotel.objects.count(), 3)
+        self.assertEqual(NewHotel.objects.get(property_id=102).name, "Hotel Beta")
+
+        # Changed source columns are updated, generated ones are kept
+        hotel = NewHotel.objects.get(property_id=101)
+        self.assertEqual(hotel.name, "Alpha Retreat")
+        self.assertEqual(hotel.description, "A generated description.")
+        self.assertEqual(hotel.rating, 4.2)
+        self.assertEqual(hotel.price, 200.0)
+
+        call_command("copy_hotel_data", sync=True, delete_missing=True)
+
+        self.assertEqual(NewHotel.objects.count(), 2)
+        self.assertFalse(NewHotel.objects.filter(property_id=999).exists())
+        self.assertFalse(HotelSummary.objects.filter(property_id=999).exists())
+
+    @skipUnless(connection.vendor == "postgresql", "--fast needs PostgreSQL")
+    def test_fast_replace(self):
+        call_command("copy_hotel_data", fast=True)
+
+        self.assertEqual(NewHotel.objects.count(), 2)
+        hotel = NewHotel.objects.get(property_id=101)
+        self.assertEqual(hotel.name, "Hotel Alpha")
+        self.assertEqual(hotel.description, "")
+        self.assertEqual(hotel.price, 200.0)
+        self.assertEqual(
+            hotel.content_fingerprint, hotel_fingerprint("Hotel Alpha", "City A", "")
+        )
+
+    def test_fast_and_sync_are_exclusive(self):
+        with self.assertRaises(CommandError):
+            call_command("copy_hotel_data", fast=True, sync=True)
+
+    def test_sync_updates_fingerprint_when_city_changes(self):
+        NewHotel.objects.create(
+            property_id=102,
+            name="Beta Haven",
+            description="A generated description.",
+            rating=3.8,
+            location="Location B",
+            latitude=21.43,
+            longitude=65.87,
+            room_type="Standard",
+            price=150.0,
+            image_path="/images/hotel_beta.jpg",
+            city_id=2,
+            city_name="Old City B",
+        )
+
+        out = StringIO()
+        call_command("copy_hotel_data", sync=True, batch_size=1, stdout=out)
+
+        hotel = NewHotel.objects.get(property_id=102)
+        self.assertEqual(hotel.city_name, "City B")
+        self.assertEqual(
+            hotel.content_fingerprint,
+            hotel_fingerprint("Beta Haven", "City B", "A generated description."),
+        )
+        self.assertIn("1 created, 1 updated, 0 deleted", out.getvalue())
+
 
 class RewriteHotelsCommandTest(TestCase):
     def setUp(self):
@@ -649,3 +1707,1185 @@ class GenerateSummariesCommandTest(TestCase):
             summary2.summary,
             "An urban oasis with cutting-edge facilities and top-notch service.",
         )
+
+
+class ConcurrentGenerationTest(TestCase):
+    def setUp(self):
+        # Create enough hotels to keep several workers busy
+        for property_id in range(101, 107):
+            NewHotel.objects.create(
+                property_id=property_id,
+                name=f"Hotel {property_id}",
+                description=f"Description {property_id}",
+                rating=4.0,
+                location="Location",
+                latitude=12.34,
+                longitude=56.78,
+                city_name="City",
+            )
+
+    def test_run_concurrently_preserves_order(self):
+        from management_app.generation import run_concurrently
+
+        results = list(run_concurrently(lambda x: x * 2, range(20), concurrency=4))
+
+        self.assertEqual(results, [(x, x * 2) for x in range(20)])
+
+    def test_hotels_load_only_prompt_columns(self):
+        from management_app.management.commands.generate_summaries import Command
+
+        command = Command()
+        command.options = {}
+        hotel = command.get_hotels().first()
+
+        self.assertIn("price", hotel.get_deferred_fields())
+        self.assertNotIn("description", hotel.get_deferred_fields())
+
+    @patch("management_app.generation.GenerationCommand.chunk_size", 2)
+    @patch("management_app.management.commands.rewrite_hotels.query_gemini_api")
+    def test_streams_hotels_in_chunks(self, mock_query_gemini_api):
+        mock_query_gemini_api.return_value = {
+            "name": "Renamed",
+            "description": "New description",
+        }
+
+        call_command("rewrite_hotels")
+
+        self.assertEqual(mock_query_gemini_api.call_count, 6)
+        hotel = NewHotel.objects.get(property_id=106)
+        self.assertEqual(hotel.name, "Renamed")
+        # Columns that were not loaded are left untouched by the save
+        self.assertEqual(hotel.latitude, 12.34)
+
+    @patch("management_app.management.commands.generate_summaries.query_gemini_summary")
+    def test_concurrent_summaries_match_serial_run(self, mock_query_gemini_summary):
+        # Answer each prompt based on its content, since calls run out of order
+        def fake_summary(prompt):
+            name = prompt.split("Name: ")[1].split("\n")[0]
+            return {"summary": f"Summary of {name}"}
+
+        mock_query_gemini_summary.side_effect = fake_summary
+
+        call_command("generate_summaries", concurrency=3)
+
+        self.assertEqual(HotelSummary.objects.count(), 6)
+        for property_id in range(101, 107):
+            summary = HotelSummary.objects.get(property_id=property_id)
+            self.assertEqual(summary.summary, f"Summary of Hotel {property_id}")
+
+    @patch("management_app.management.commands.rewrite_hotels.query_gemini_api")
+    def test_concurrent_rewrite_handles_failures(self, mock_query_gemini_api):
+        def fake_rewrite(prompt):
+            if "Hotel 103" in prompt:
+                return None
+            return {"name": "Renamed", "description": "New description"}
+
+        mock_query_gemini_api.side_effect = fake_rewrite
+
+        call_command("rewrite_hotels", concurrency=4)
+
+        self.assertEqual(NewHotel.objects.filter(name="Renamed").count(), 5)
+        self.assertEqual(NewHotel.objects.get(property_id=103).name, "Hotel 103")
+
+
+class WriteBufferTest(TestCase):
+    def setUp(self):
+        # Fake clock so the time-based flush can be tested without sleeping
+        self.now = 0.0
+
+    def make_buffer(self, **kwargs):
+        return WriteBuffer(HotelSummary, clock=lambda: self.now, **kwargs)
+
+    def test_flushes_every_n_rows(self):
+        buffer = self.make_buffer(max_rows=2, max_seconds=60)
+
+        buffer.add(HotelSummary(property_id=101, summary="One"))
+        self.assertEqual(HotelSummary.objects.count(), 0)
+        buffer.add(HotelSummary(property_id=102, summary="Two"))
+        self.assertEqual(HotelSummary.objects.count(), 2)
+
+    def test_flushes_after_interval(self):
+        buffer = self.make_buffer(max_rows=100, max_seconds=5)
+
+        buffer.add(HotelSummary(property_id=101, summary="One"))
+        self.assertEqual(HotelSummary.objects.count(), 0)
+        self.now = 6.0
+        buffer.add(HotelSummary(property_id=102, summary="Two"))
+        self.assertEqual(HotelSummary.objects.count(), 2)
+
+    def test_flush_upserts_by_property_id(self):
+        old = HotelSummary.objects.create(property_id=101, summary="Old one")
+
+        with self.make_buffer() as buffer:
+            buffer.add(HotelSummary(property_id=101, summary="Replaced"))
+            buffer.add(HotelSummary(property_id=101, summary="New one"))
+            buffer.add(HotelSummary(property_id=102, summary="Two"))
+
+        self.assertEqual(
+            dict(HotelSummary.objects.values_list("property_id", "summary")),
+            {101: "New one", 102: "Two"},
+        )
+        # The existing row is updated in place
+        self.assertEqual(HotelSummary.objects.get(property_id=101).id, old.id)
+
+    def test_interrupted_run_flushes_buffer(self):
+        with self.assertRaises(KeyboardInterrupt):
+            with self.make_buffer() as buffer:
+                buffer.add(HotelSummary(property_id=101, summary="One"))
+                raise KeyboardInterrupt
+
+        self.assertTrue(HotelSummary.objects.filter(property_id=101).exists())
+
+    def test_bad_row_does_not_lose_batch(self):
+        errors = []
+        buffer = self.make_buffer(on_error=lambda obj, label, e: errors.append(label))
+        buffer.add(HotelSummary(property_id=101, summary="One"), label="Alpha")
+        # NULL summary violates the NOT NULL constraint
+        buffer.add(HotelSummary(property_id=102, summary=None), label="Beta")
+
+        buffer.flush()
+
+        self.assertEqual(errors, ["Beta"])
+        self.assertTrue(HotelSummary.objects.filter(property_id=101).exists())
+
+    @patch("management_app.management.commands.generate_summaries.query_gemini_summary")
+    def test_command_writes_in_batches(self, mock_query_gemini_summary):
+        for property_id in range(101, 106):
+            NewHotel.objects.create(
+                property_id=property_id,
+                name=f"Hotel {property_id}",
+                description="Details",
+                location="Location",
+                latitude=12.34,
+                longitude=56.78,
+                city_name="City",
+            )
+        mock_query_gemini_summary.return_value = {"summary": "A summary."}
+
+        with patch.object(
+            HotelSummary.objects, "bulk_create", wraps=HotelSummary.objects.bulk_create
+        ) as mock_bulk_create:
+            call_command("generate_summaries", flush_rows=2, no_cache=True)
+
+        # Batches of 2, 2 and 1 hotels
+        self.assertEqual(mock_bulk_create.call_count, 3)
+        self.assertEqual(HotelSummary.objects.count(), 5)
+
+    @patch("management_app.management.commands.generate_summaries.query_gemini_summary")
+    def test_failed_write_stays_failed(self, mock_query_gemini_summary):
+        for property_id in (101, 102, 103):
+            NewHotel.objects.create(
+                property_id=property_id,
+                name=f"H{property_id - 100}",
+                description="Details",
+                location="Location",
+                latitude=12.34,
+                longitude=56.78,
+                city_name="City",
+            )
+        mock_query_gemini_summary.return_value = {"summary": "A summary."}
+        upsert = HotelSummary.objects.upsert
+
+        def failing_upsert(objs):
+            if any(obj.property_id == 102 for obj in objs):
+                raise DatabaseError("disk full")
+            return upsert(objs)
+
+        stderr = StringIO()
+        with patch.object(HotelSummary.objects, "upsert", side_effect=failing_upsert):
+            # The 2nd hotel's row is flushed as soon as it is added
+            call_command(
+                "generate_summaries",
+                flush_rows=2,
+                no_cache=True,
+                stdout=StringIO(),
+                stderr=stderr,
+            )
+
+        self.assertIn("Error saving summary for hotel: H2. Error: disk full", stderr.getvalue())
+        self.assertEqual(
+            sorted(HotelSummary.objects.values_list("property_id", flat=True)), [101, 103]
+        )
+        statuses = dict(GenerationTask.objects.values_list("property_id", "status"))
+        self.assertEqual(
+            statuses,
+            {
+                101: GenerationTask.Status.DONE,
+                102: GenerationTask.Status.FAILED,
+                103: GenerationTask.Status.DONE,
+            },
+        )
+        dead_letter = DeadLetter.objects.get()
+        self.assertEqual((dead_letter.property_id, dead_letter.error), (102, "disk full"))
+
+
+class ResponseCacheTest(TestCase):
+    def setUp(self):
+        self.hotel = NewHotel.objects.create(
+            property_id=101,
+            name="Hotel Alpha",
+            description="A tranquil retreat with ocean views.",
+            rating=4.5,
+            location="Location A",
+            latitude=12.34,
+            longitude=56.78,
+            city_name="City A",
+        )
+
+    @patch("management_app.management.commands.generate_summaries.query_gemini_summary")
+    def test_rerun_uses_cached_responses(self, mock_query_gemini_summary):
+        mock_query_gemini_summary.return_value = {"summary": "A calm seaside hotel."}
+
+        call_command("generate_summaries")
+        out = StringIO()
+        call_command("generate_summaries", stdout=out)
+
+        # The second run is served from the cache
+        self.assertEqual(mock_query_gemini_summary.call_count, 1)
+        self.assertIn("Response cache: 1 hits, 0 misses", out.getvalue())
+        self.assertEqual(
+            HotelSummary.objects.get(property_id=101).summary, "A calm seaside hotel."
+        )
+
+    @patch("management_app.management.commands.generate_summaries.query_gemini_summary")
+    def test_changed_hotel_misses_cache(self, mock_query_gemini_summary):
+        mock_query_gemini_summary.return_value = {"summary": "A calm seaside hotel."}
+
+        call_command("generate_summaries")
+        self.hotel.description = "Now with a rooftop pool."
+        self.hotel.save()
+        call_command("generate_summaries")
+
+        self.assertEqual(mock_query_gemini_summary.call_count, 2)
+
+    @patch("management_app.management.commands.generate_summaries.query_gemini_summary")
+    def test_other_models_miss_cache(self, mock_query_gemini_summary):
+        mock_query_gemini_summary.return_value = {"summary": "A calm seaside hotel."}
+        endpoints = [
+            {"api_key": "key-1", "model": "model-a"},
+            {"api_key": "key-2", "model": "model-b"},
+        ]
+
+        call_command("generate_summaries", stdout=StringIO())
+        with override_settings(GEMINI_ENDPOINTS=endpoints):
+            call_command("generate_summaries", stdout=StringIO())
+        with override_settings(GEMINI_ENDPOINTS=endpoints[::-1]):
+            call_command("generate_summaries", stdout=StringIO())
+
+        # The same set of models shares cached responses, in any order
+        self.assertEqual(mock_query_gemini_summary.call_count, 2)
+
+    @patch("management_app.management.commands.generate_summaries.query_gemini_summary")
+    def test_failed_responses_are_not_cached(self, mock_query_gemini_summary):
+        mock_query_gemini_summary.return_value = None
+
+        call_command("generate_summaries")
+
+        self.assertEqual(LLMResponseCache.objects.count(), 0)
+
+    @patch(
+        "management_app.management.commands.generate_ratings_reviews.query_gemini_ratings_reviews"
+    )
+    def test_no_cache_option(self, mock_query_gemini_ratings_reviews):
+        mock_query_gemini_ratings_reviews.return_value = {
+            "rating": 4.5,
+            "review": "Lovely.",
+        }
+
+        call_command("generate_ratings_reviews")
+        call_command("generate_ratings_reviews", no_cache=True)
+
+        self.assertEqual(mock_query_gemini_ratings_reviews.call_count, 2)
+
+    def test_ttl_expiry(self):
+        cache = ResponseCache(ttl=60)
+        cache.set("expired", {"summary": "Old"})
+        cache.flush()
+        LLMResponseCache.objects.filter(key="expired").update(
+            created_at=timezone.now() - timedelta(seconds=120)
+        )
+
+        self.assertIsNone(cache.get("expired"))
+        cache.prune()
+        self.assertFalse(LLMResponseCache.objects.filter(key="expired").exists())
+
+    def test_prune_evicts_least_recently_used(self):
+        cache = ResponseCache(max_entries=2)
+        for i, key in enumerate(["a", "b", "c"]):
+            cache.set(key, {"summary": key})
+            cache.flush()
+            LLMResponseCache.objects.filter(key=key).update(
+                last_used_at=timezone.now() - timedelta(minutes=10 - i)
+            )
+
+        # Using "a" makes "b" the least recently used entry
+        cache.get("a")
+        cache.prune()
+
+        self.assertEqual(
+            set(LLMResponseCache.objects.values_list("key", flat=True)), {"a", "c"}
+        )
+
+
+class BatchedGenerationTest(TestCase):
+    def setUp(self):
+        for property_id in range(101, 106):
+            NewHotel.objects.create(
+                property_id=property_id,
+                name=f"Hotel {property_id}",
+                description=f"Description {property_id}",
+                rating=4.0,
+                location="Location",
+                latitude=12.34,
+                longitude=56.78,
+                city_name="City",
+            )
+
+    def test_parse_batch(self):
+        text = (
+            '[{"property_id": 101, "summary": "One"}, '
+            '{"property_id": "102", "summary": "Two"}, {"summary": "No id"}]'
+        )
+
+        self.assertEqual(
+            parse_batch(text),
+            {
+                101: {"property_id": 101, "summary": "One"},
+                102: {"property_id": "102", "summary": "Two"},
+            },
+        )
+        self.assertEqual(parse_batch("not json"), {})
+
+    @patch("management_app.management.commands.generate_summaries.query_gemini_summary")
+    @patch("management_app.management.commands.generate_summaries.query_gemini_batch")
+    def test_batched_summaries(self, mock_query_gemini_batch, mock_query_gemini_summary):
+        def fake_batch(prompt, item_schema):
+            ids = [
+                int(line.split(": ")[1])
+                for line in prompt.splitlines()
+                if line.startswith("property_id: ")
+            ]
+            # Leave the last hotel of every batch out of the reply
+            return {
+                property_id: {"property_id": property_id, "summary": f"Batch {property_id}"}
+                for property_id in ids[:-1]
+            }
+
+        mock_query_gemini_batch.side_effect = fake_batch
+        mock_query_gemini_summary.return_value = {"summary": "Single"}
+
+        call_command("generate_summaries", batch_size=3)
+
+        # Batches of 3 and 2 hotels, plus one fallback call per batch
+        self.assertEqual(mock_query_gemini_batch.call_count, 2)
+        self.assertEqual(mock_query_gemini_summary.call_count, 2)
+        summaries = dict(HotelSummary.objects.values_list("property_id", "summary"))
+        self.assertEqual(
+            summaries,
+            {
+                101: "Batch 101",
+                102: "Batch 102",
+                103: "Single",
+                104: "Batch 104",
+                105: "Single",
+            },
+        )
+
+    @patch(
+        "management_app.management.commands.generate_ratings_reviews.query_gemini_ratings_reviews"
+    )
+    @patch("management_app.management.commands.generate_ratings_reviews.query_gemini_batch")
+    def test_batched_reviews_retry_invalid_items(
+        self, mock_query_gemini_batch, mock_query_gemini_ratings_reviews
+    ):
+        mock_query_gemini_batch.return_value = {
+            property_id: {
+                "property_id": property_id,
+                "rating": "n/a" if property_id == 102 else 4.2,
+                "review": "Nice.",
+            }
+            for property_id in range(101, 106)
+        }
+        mock_query_gemini_ratings_reviews.return_value = {"rating": 3.9, "review": "Ok."}
+
+        call_command("generate_ratings_reviews", batch_size=5, concurrency=2)
+
+        self.assertEqual(mock_query_gemini_batch.call_count, 1)
+        self.assertEqual(mock_query_gemini_ratings_reviews.call_count, 1)
+        self.assertEqual(HotelRatingReview.objects.count(), 5)
+        self.assertEqual(
+            HotelRatingReview.objects.get(property_id=102).rating, Decimal("3.90")
+        )
+        self.assertEqual(
+            HotelRatingReview.objects.get(property_id=101).rating, Decimal("4.20")
+        )
+
+
+class EnrichHotelsCommandTest(TestCase):
+    def setUp(self):
+        self.hotel = NewHotel.objects.create(
+            property_id=101,
+            name="Hotel Alpha",
+            description="A basic hotel description.",
+            rating=4.5,
+            location="Location A",
+            latitude=12.34,
+            longitude=56.78,
+            city_name="City A",
+        )
+        HotelSummary.objects.create(property_id=101, summary="An outdated summary.")
+
+    def test_parse_enrichment(self):
+        result = parse_enrichment(
+            '{"name": " Alpha Retreat ", "description": "Calm.", "summary": "Nice.", '
+            '"rating": 4.5, "review": "Great."}'
+        )
+
+        self.assertEqual(
+            result,
+            {
+                "name": "Alpha Retreat",
+                "description": "Calm.",
+                "summary": "Nice.",
+                "rating": 4.5,
+                "review": "Great.",
+            },
+        )
+        with self.assertRaises(MalformedResponse):
+            parse_enrichment("[]")
+        with self.assertRaises(MalformedResponse):
+            parse_enrichment('{"name": "Alpha", "rating": "4.5"}')
+
+    @patch("management_app.management.commands.enrich_hotels.query_gemini_enrichment")
+    def test_enrich_writes_all_outputs(self, mock_query_gemini_enrichment):
+        mock_query_gemini_enrichment.return_value = {
+            "name": "Alpha Retreat",
+            "description": "A luxurious hotel with breathtaking views.",
+            "summary": "A luxurious retreat.",
+            "rating": 4.5,
+            "review": "An amazing experience.",
+        }
+
+        call_command("enrich_hotels")
+
+        self.assertEqual(mock_query_gemini_enrichment.call_count, 1)
+        hotel = NewHotel.objects.get(property_id=101)
+        self.assertEqual(hotel.name, "Alpha Retreat")
+        self.assertEqual(hotel.description, "A luxurious hotel with breathtaking views.")
+        self.assertEqual(HotelSummary.objects.get(property_id=101).summary, "A luxurious retreat.")
+        rating_review = HotelRatingReview.objects.get(property_id=101)
+        self.assertEqual(rating_review.rating, Decimal("4.50"))
+        self.assertEqual(rating_review.review, "An amazing experience.")
+
+    @patch("management_app.management.commands.enrich_hotels.query_gemini_enrichment")
+    def test_incomplete_response_changes_nothing(self, mock_query_gemini_enrichment):
+        mock_query_gemini_enrichment.return_value = {
+            "name": "Alpha Retreat",
+            "description": "A luxurious hotel with breathtaking views.",
+            "summary": "",
+            "rating": None,
+            "review": "",
+        }
+
+        call_command("enrich_hotels")
+
+        self.assertEqual(NewHotel.objects.get(property_id=101).name, "Hotel Alpha")
+        self.assertEqual(
+            HotelSummary.objects.get(property_id=101).summary, "An outdated summary."
+        )
+
+    @patch(
+        "management_app.management.commands.enrich_hotels.HotelRatingReview.objects.upsert",
+        side_effect=Exception("Write failed"),
+    )
+    @patch("management_app.management.commands.enrich_hotels.query_gemini_enrichment")
+    def test_failed_write_rolls_back(self, mock_query_gemini_enrichment, mock_create):
+        mock_query_gemini_enrichment.return_value = {
+            "name": "Alpha Retreat",
+            "description": "A luxurious hotel with breathtaking views.",
+            "summary": "A luxurious retreat.",
+            "rating": 4.5,
+            "review": "An amazing experience.",
+        }
+
+        call_command("enrich_hotels")
+
+        # The name, description and summary updates are rolled back together
+        self.assertEqual(NewHotel.objects.get(property_id=101).name, "Hotel Alpha")
+        self.assertEqual(
+            HotelSummary.objects.get(property_id=101).summary, "An outdated summary."
+        )
+
+
+class OnlyStaleGenerationTest(TestCase):
+    def setUp(self):
+        self.hotel1 = NewHotel.objects.create(
+            property_id=101,
+            name="Hotel Alpha",
+            description="A tranquil retreat with ocean views.",
+            rating=4.5,
+            location="Location A",
+            latitude=12.34,
+            longitude=56.78,
+            city_name="City A",
+        )
+        self.hotel2 = NewHotel.objects.create(
+            property_id=102,
+            name="Hotel Beta",
+            description="An urban escape with modern amenities.",
+            rating=3.8,
+            location="Location B",
+            latitude=21.43,
+            longitude=65.87,
+            city_name="City B",
+        )
+
+    def test_fingerprint_follows_prompt_fields(self):
+        fingerprint = self.hotel1.content_fingerprint
+        self.assertEqual(len(fingerprint), 64)
+
+        self.hotel1.price = 99.0
+        self.hotel1.save()
+        self.assertEqual(self.hotel1.content_fingerprint, fingerprint)
+
+        self.hotel1.description = "Now with a rooftop pool."
+        self.hotel1.save(update_fields=["description"])
+        self.hotel1.refresh_from_db()
+        self.assertNotEqual(self.hotel1.content_fingerprint, fingerprint)
+
+    @patch("management_app.management.commands.generate_summaries.query_gemini_summary")
+    def test_only_stale_skips_current_summaries(self, mock_query_gemini_summary):
+        mock_query_gemini_summary.return_value = {"summary": "A summary."}
+        call_command("generate_summaries", no_cache=True)
+        self.assertEqual(mock_query_gemini_summary.call_count, 2)
+
+        # Nothing changed: nothing to do
+        call_command("generate_summaries", only_stale=True, no_cache=True)
+        self.assertEqual(mock_query_gemini_summary.call_count, 2)
+
+        # Only the changed hotel is regenerated
+        self.hotel2.description = "Now with a rooftop pool."
+        self.hotel2.save()
+        call_command("generate_summaries", only_stale=True, no_cache=True)
+        self.assertEqual(mock_query_gemini_summary.call_count, 3)
+        self.assertIn("rooftop pool", mock_query_gemini_summary.call_args.args[0])
+
+    @patch("management_app.management.commands.generate_summaries.query_gemini_summary")
+    def test_only_stale_regenerates_old_prompt_versions(self, mock_query_gemini_summary):
+        mock_query_gemini_summary.return_value = {"summary": "A summary."}
+        HotelSummary.objects.create(
+            property_id=101,
+            summary="Made with an older prompt.",
+            source_fingerprint=self.hotel1.content_fingerprint,
+            prompt_version="summary-v0",
+        )
+        HotelSummary.objects.create(
+            property_id=102,
+            summary="Current.",
+            source_fingerprint=self.hotel2.content_fingerprint,
+            prompt_version=SUMMARY_PROMPT_VERSION,
+        )
+
+        call_command("generate_summaries", only_stale=True)
+
+        self.assertEqual(mock_query_gemini_summary.call_count, 1)
+        summary = HotelSummary.objects.get(property_id=101)
+        self.assertEqual(summary.summary, "A summary.")
+        self.assertEqual(summary.prompt_version, SUMMARY_PROMPT_VERSION)
+        self.assertEqual(summary.source_fingerprint, self.hotel1.content_fingerprint)
+
+
+class ResumableRunTest(TestCase):
+    def setUp(self):
+        for property_id in range(101, 104):
+            NewHotel.objects.create(
+                property_id=property_id,
+                name=f"Hotel {property_id}",
+                description="Details",
+                location="Location",
+                latitude=12.34,
+                longitude=56.78,
+                city_name="City",
+            )
+
+    def task_statuses(self, run):
+        return dict(run.tasks.values_list("property_id", "status"))
+
+    @patch("management_app.management.commands.generate_summaries.query_gemini_summary")
+    def test_run_records_each_hotel(self, mock_query_gemini_summary):
+        mock_query_gemini_summary.side_effect = [
+            {"summary": "One"},
+            None,
+            {"summary": "Three"},
+        ]
+
+        call_command("generate_summaries", no_cache=True, stdout=StringIO(), stderr=StringIO())
+
+        run = GenerationRun.objects.get()
+        self.assertEqual(run.command, "generate_summaries")
+        self.assertEqual(run.status, GenerationRun.Status.COMPLETED)
+        self.assertIsNotNone(run.finished_at)
+        self.assertEqual(
+            self.task_statuses(run),
+            {101: "done", 102: "failed", 103: "done"},
+        )
+        failed = run.tasks.get(property_id=102)
+        self.assertEqual(failed.attempts, 1)
+        self.assertIn("Failed to generate summary", failed.last_error)
+
+    @patch("management_app.management.commands.rewrite_hotels.query_gemini_api")
+    def test_resume_skips_finished_hotels(self, mock_query_gemini_api):
+        mock_query_gemini_api.side_effect = [
+            {"name": "Renamed", "description": "New"},
+            None,
+            {"name": "Renamed", "description": "New"},
+        ]
+        call_command("rewrite_hotels", stdout=StringIO(), stderr=StringIO())
+        run = GenerationRun.objects.get()
+
+        mock_query_gemini_api.side_effect = None
+        mock_query_gemini_api.return_value = {"name": "Renamed", "description": "New"}
+        call_command("rewrite_hotels", resume=run.pk, stdout=StringIO())
+
+        # Only the failed hotel is sent again
+        self.assertEqual(mock_query_gemini_api.call_count, 4)
+        self.assertIn("Hotel 102", mock_query_gemini_api.call_args.args[0])
+        run.refresh_from_db()
+        self.assertEqual(run.status, GenerationRun.Status.COMPLETED)
+        self.assertEqual(set(self.task_statuses(run).values()), {"done"})
+        self.assertEqual(run.tasks.get(property_id=102).attempts, 2)
+
+    @patch("management_app.management.commands.generate_summaries.query_gemini_summary")
+    def test_interrupted_run_keeps_finished_hotels(self, mock_query_gemini_summary):
+        mock_query_gemini_summary.side_effect = [{"summary": "One"}, KeyboardInterrupt]
+
+        with self.assertRaises(KeyboardInterrupt):
+            call_command("generate_summaries", no_cache=True, stdout=StringIO())
+
+        run = GenerationRun.objects.get()
+        self.assertEqual(run.status, GenerationRun.Status.INTERRUPTED)
+        self.assertEqual(
+            self.task_statuses(run),
+            {101: "done", 102: "pending", 103: "pending"},
+        )
+        self.assertTrue(HotelSummary.objects.filter(property_id=101).exists())
+
+        mock_query_gemini_summary.side_effect = None
+        mock_query_gemini_summary.return_value = {"summary": "Later"}
+        call_command("generate_summaries", resume=run.pk, no_cache=True, stdout=StringIO())
+
+        self.assertEqual(mock_query_gemini_summary.call_count, 4)
+        self.assertEqual(HotelSummary.objects.get(property_id=101).summary, "One")
+        self.assertEqual(HotelSummary.objects.get(property_id=103).summary, "Later")
+
+    @patch("management_app.management.commands.rewrite_hotels.query_gemini_api")
+    def test_rewrite_checkpoints_each_hotel(self, mock_query_gemini_api):
+        statuses = []
+
+        def rewrite(prompt):
+            # What a restart at this point would find
+            statuses.append(sorted(GenerationTask.objects.values_list("status", flat=True)))
+            return {"name": "Renamed", "description": "New"}
+
+        mock_query_gemini_api.side_effect = rewrite
+
+        call_command("rewrite_hotels", stdout=StringIO())
+
+        self.assertEqual(
+            statuses,
+            [
+                ["pending", "pending", "pending"],
+                ["done", "pending", "pending"],
+                ["done", "done", "pending"],
+            ],
+        )
+
+    @patch("management_app.management.commands.generate_summaries.query_gemini_summary")
+    def test_sigterm_flushes_and_interrupts_run(self, mock_query_gemini_summary):
+        def summarize(prompt):
+            if "Hotel 102" in prompt:
+                os.kill(os.getpid(), signal.SIGTERM)
+            return {"summary": "A summary."}
+
+        mock_query_gemini_summary.side_effect = summarize
+        previous = signal.getsignal(signal.SIGTERM)
+
+        with self.assertRaises(KeyboardInterrupt):
+            call_command("generate_summaries", no_cache=True, stdout=StringIO())
+
+        run = GenerationRun.objects.get()
+        self.assertEqual(run.status, GenerationRun.Status.INTERRUPTED)
+        # The buffered summary and its outcome were written before exiting
+        self.assertEqual(self.task_statuses(run), {101: "done", 102: "pending", 103: "pending"})
+        self.assertTrue(HotelSummary.objects.filter(property_id=101).exists())
+        self.assertIs(signal.getsignal(signal.SIGTERM), previous)
+
+    def test_resume_rejects_other_commands_runs(self):
+        run = GenerationRun.objects.create(command="rewrite_hotels")
+
+        with self.assertRaises(CommandError):
+            call_command("generate_summaries", resume=run.pk)
+        with self.assertRaises(CommandError):
+            call_command("generate_summaries", resume=run.pk + 1)
+
+    def test_task_is_unique_per_run_and_hotel(self):
+        run = GenerationRun.objects.create(command="rewrite_hotels")
+        GenerationTask.objects.create(run=run, property_id=101)
+
+        with self.assertRaises(IntegrityError):
+            GenerationTask.objects.create(run=run, property_id=101)
+
+
+class GenerationQueueTest(TestCase):
+    def setUp(self):
+        for property_id in range(101, 106):
+            NewHotel.objects.create(
+                property_id=property_id,
+                name=f"Hotel {property_id}",
+                description="Details",
+                location="Location",
+                latitude=12.34,
+                longitude=56.78,
+                city_name="City",
+            )
+
+    def enqueue(self, command="generate_summaries", **options):
+        call_command(command, enqueue=True, stdout=StringIO(), **options)
+        return GenerationRun.objects.latest("id")
+
+    @patch("management_app.management.commands.generate_summaries.query_gemini_summary")
+    def test_enqueue_only_records_tasks(self, mock_query_gemini_summary):
+        run = self.enqueue(batch_size=3, no_cache=True)
+
+        mock_query_gemini_summary.assert_not_called()
+        self.assertEqual(run.status, GenerationRun.Status.QUEUED)
+        self.assertEqual(run.tasks.filter(status="pending").count(), 5)
+        self.assertEqual(run.options["batch_size"], 3)
+        self.assertTrue(run.options["no_cache"])
+
+    @patch("management_app.management.commands.generate_summaries.query_gemini_summary")
+    def test_worker_processes_queued_run(self, mock_query_gemini_summary):
+        mock_query_gemini_summary.return_value = {"summary": "A summary."}
+        run = self.enqueue(no_cache=True)
+
+        call_command(
+            "generation_worker", claim_size=2, exit_when_empty=True, stdout=StringIO()
+        )
+
+        self.assertEqual(mock_query_gemini_summary.call_count, 5)
+        self.assertEqual(HotelSummary.objects.count(), 5)
+        run.refresh_from_db()
+        self.assertEqual(run.status, GenerationRun.Status.COMPLETED)
+        self.assertFalse(run.tasks.exclude(status="done").exists())
+        self.assertFalse(run.tasks.exclude(lease_owner="").exists())
+
+    def test_claims_do_not_overlap(self):
+        tracker = RunTracker(self.enqueue())
+
+        first = tracker.claim("worker-1", 3, lease_seconds=60)
+        second = tracker.claim("worker-2", 3, lease_seconds=60)
+
+        self.assertEqual(first, [101, 102, 103])
+        self.assertEqual(second, [104, 105])
+        self.assertEqual(tracker.claim("worker-3", 3, lease_seconds=60), [])
+
+    def test_expired_lease_is_claimed_again(self):
+        run = self.enqueue()
+        tracker = RunTracker(run)
+        tracker.claim("dead-worker", 5, lease_seconds=60)
+
+        run.tasks.update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(len(tracker.claim("worker-2", 5, lease_seconds=60)), 5)
+        self.assertEqual(set(run.tasks.values_list("lease_owner", flat=True)), {"worker-2"})
+
+    @patch("management_app.management.commands.generate_summaries.query_gemini_summary")
+    def test_worker_skips_tasks_leased_elsewhere(self, mock_query_gemini_summary):
+        mock_query_gemini_summary.return_value = {"summary": "A summary."}
+        run = self.enqueue(no_cache=True)
+        RunTracker(run).claim("other-worker", 2, lease_seconds=60)
+
+        call_command("generation_worker", exit_when_empty=True, stdout=StringIO())
+
+        self.assertEqual(mock_query_gemini_summary.call_count, 3)
+        run.refresh_from_db()
+        # The other worker's hotels are still pending
+        self.assertEqual(run.status, GenerationRun.Status.QUEUED)
+        self.assertEqual(run.tasks.filter(status="pending").count(), 2)
+
+    @patch("management_app.management.commands.generate_summaries.query_gemini_summary")
+    def test_worker_ends_each_run_when_drained(self, mock_query_gemini_summary):
+        mock_query_gemini_summary.return_value = {"summary": "A summary."}
+        first, second = self.enqueue(), self.enqueue()
+        worker = load_command_class("management_app", "generation_worker")
+        stdout = StringIO()
+
+        call_command(worker, claim_size=5, exit_when_empty=True, stdout=stdout)
+
+        # Each run's command is ended (cache reported) as soon as it completes
+        lines = [
+            line
+            for line in stdout.getvalue().splitlines()
+            if line.startswith(("Generation run", "Response cache"))
+        ]
+        self.assertEqual(
+            lines,
+            [
+                f"Generation run {first.pk} completed",
+                "Response cache: 0 hits, 5 misses (0.0% hit rate)",
+                f"Generation run {second.pk} completed",
+                "Response cache: 5 hits, 0 misses (100.0% hit rate)",
+            ],
+        )
+        self.assertIsNone(worker.command)
+        self.assertEqual((worker.cache_totals.hits, worker.cache_totals.misses), (5, 5))
+
+    def test_enqueue_and_resume_cannot_be_combined(self):
+        with self.assertRaises(CommandError):
+            call_command("generate_summaries", enqueue=True, resume=1)
+
+
+class OutputValidationTest(TestCase):
+    def setUp(self):
+        for property_id in (101, 102):
+            NewHotel.objects.create(
+                property_id=property_id,
+                name=f"Hotel {property_id}",
+                description="Details",
+                location="Location",
+                latitude=12.34,
+                longitude=56.78,
+                city_name="City",
+            )
+
+    def test_word_limits(self):
+        long_text = " ".join(["word"] * 101)
+        with self.assertRaisesMessage(MalformedResponse, "review has 101 words, the limit is 100"):
+            parse_rating_review(json.dumps({"rating": 4, "review": long_text}))
+        with self.assertRaisesMessage(MalformedResponse, "description has 101 words"):
+            parse_enrichment(
+                json.dumps(
+                    {
+                        "name": "Alpha",
+                        "description": long_text,
+                        "summary": "Nice.",
+                        "rating": 4,
+                        "review": "Great.",
+                    }
+                )
+            )
+
+    def test_rating_range_and_precision(self):
+        with self.assertRaisesMessage(MalformedResponse, "outside the range 0-5"):
+            parse_rating_review('{"rating": 7, "review": "Great."}')
+        with self.assertRaisesMessage(MalformedResponse, "outside the range 0-5"):
+            parse_rating_review('{"rating": -1, "review": "Great."}')
+        # Extra decimals are rounded so the rating fits DecimalField(3, 2)
+        self.assertEqual(
+            parse_rating_review('{"rating": 4.456, "review": "Great."}')["rating"], 4.46
+        )
+
+    @patch("management_app.management.commands.generate_ratings_reviews.query_gemini_ratings_reviews")
+    def test_rejected_hotels_go_to_dead_letters(self, mock_query):
+        mock_query.side_effect = [
+            {"rating": 4.5, "review": "Great."},
+            MalformedResponse("rating 9 is outside the range 0-5"),
+        ]
+        stderr = StringIO()
+
+        call_command(
+            "generate_ratings_reviews", no_cache=True, stdout=StringIO(), stderr=stderr
+        )
+
+        self.assertIn("Invalid output for hotel: Hotel 102", stderr.getvalue())
+        self.assertEqual(
+            list(HotelRatingReview.objects.values_list("property_id", flat=True)), [101]
+        )
+        dead_letter = DeadLetter.objects.get()
+        self.assertEqual(
+            (dead_letter.command, dead_letter.property_id),
+            ("generate_ratings_reviews", 102),
+        )
+        self.assertIn("outside the range", dead_letter.error)
+
+    @patch("management_app.management.commands.generate_summaries.query_gemini_summary")
+    def test_replay_failed_processes_only_dead_letters(self, mock_query_gemini_summary):
+        mock_query_gemini_summary.side_effect = [{"summary": "One"}, None]
+        call_command("generate_summaries", no_cache=True, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(
+            list(DeadLetter.objects.values_list("property_id", flat=True)), [102]
+        )
+
+        mock_query_gemini_summary.side_effect = None
+        mock_query_gemini_summary.return_value = {"summary": "Two"}
+        stdout = StringIO()
+        call_command("replay_failed", stdout=stdout)
+
+        self.assertEqual(mock_query_gemini_summary.call_count, 3)
+        self.assertIn("Hotel 102", mock_query_gemini_summary.call_args.args[0])
+        self.assertEqual(HotelSummary.objects.get(property_id=102).summary, "Two")
+        # Hotels that succeed leave the dead-letter table
+        self.assertFalse(DeadLetter.objects.exists())
+        self.assertIn("0 hotels still failing", stdout.getvalue())
+
+    def test_replay_with_nothing_failed(self):
+        stdout = StringIO()
+        call_command("replay_failed", stdout=stdout)
+        self.assertIn("No failed hotels to replay", stdout.getvalue())
+
+
+class SingleFlightTest(TestCase):
+    def setUp(self):
+        for property_id, name in [(101, "Chain Hotel"), (102, "Chain Hotel"), (103, "Other"), (104, "Chain Hotel")]:
+            NewHotel.objects.create(
+                property_id=property_id,
+                name=name,
+                description="Same details",
+                location="Location",
+                latitude=12.34,
+                longitude=56.78,
+                city_name="City",
+            )
+
+    def test_concurrent_callers_share_one_call(self):
+        flights = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def slow(value):
+            calls.append(value)
+            release.wait(5)
+            return value * 2
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(flights.do, "key", slow, 21) for _ in range(4)]
+            while flights.coalesced < 3:
+                time.sleep(0.001)
+            release.set()
+            results = [future.result() for future in futures]
+
+        self.assertEqual(results, [42] * 4)
+        self.assertEqual(calls, [21])
+
+    def test_failed_results_are_not_reused(self):
+        flights = SingleFlight()
+        self.assertIsNone(flights.do("key", lambda: None))
+        self.assertEqual(flights.do("key", lambda: "answer"), "answer")
+        self.assertEqual(flights.do("key", lambda: "other"), "answer")
+        self.assertEqual(flights.coalesced, 1)
+
+    def test_remembers_most_recent_results(self):
+        flights = SingleFlight(max_results=2)
+        for key in ("a", "b", "c"):
+            flights.do(key, str.upper, key)
+
+        self.assertEqual(flights.do("a", lambda: "again"), "again")
+        self.assertEqual(flights.do("c", lambda: "again"), "C")
+
+    @patch("management_app.management.commands.generate_summaries.query_gemini_summary")
+    def test_duplicate_hotels_share_one_request(self, mock_query_gemini_summary):
+        mock_query_gemini_summary.side_effect = lambda prompt: {
+            "summary": "Summary of " + prompt.split("Name: ")[1].split("\n")[0]
+        }
+        stdout = StringIO()
+
+        call_command("generate_summaries", no_cache=True, concurrency=3, stdout=stdout)
+
+        self.assertEqual(mock_query_gemini_summary.call_count, 2)
+        self.assertEqual(
+            dict(HotelSummary.objects.values_list("property_id", "summary")),
+            {
+                101: "Summary of Chain Hotel",
+                102: "Summary of Chain Hotel",
+                103: "Summary of Other",
+                104: "Summary of Chain Hotel",
+            },
+        )
+        self.assertIn("Duplicate prompts: 2 hotels", stdout.getvalue())
+
+    @patch("management_app.management.commands.generate_summaries.query_gemini_summary")
+    def test_no_coalesce(self, mock_query_gemini_summary):
+        mock_query_gemini_summary.return_value = {"summary": "A summary."}
+
+        call_command("generate_summaries", no_cache=True, no_coalesce=True, stdout=StringIO())
+
+        self.assertEqual(mock_query_gemini_summary.call_count, 4)
+
+    @patch("management_app.management.commands.generate_summaries.query_gemini_summary")
+    @patch("management_app.management.commands.generate_summaries.query_gemini_batch")
+    def test_batch_sends_duplicates_once(self, mock_query_gemini_batch, mock_query_gemini_summary):
+        mock_query_gemini_batch.return_value = {
+            101: {"property_id": 101, "summary": "Chain"},
+            103: {"property_id": 103, "summary": "Other"},
+        }
+
+        call_command("generate_summaries", no_cache=True, batch_size=4, stdout=StringIO())
+
+        prompt = mock_query_gemini_batch.call_args.args[0]
+        self.assertEqual(prompt.count("property_id: "), 2)
+        mock_query_gemini_summary.assert_not_called()
+        self.assertEqual(HotelSummary.objects.get(property_id=104).summary, "Chain")
+
+
+class PipelineTest(TestCase):
+    def setUp(self):
+        for property_id in range(101, 105):
+            NewHotel.objects.create(
+                property_id=property_id,
+                name=f"Hotel {property_id}",
+                description="Details",
+                location="Location",
+                latitude=12.34,
+                longitude=56.78,
+                city_name="City",
+            )
+
+    def rewrite(self, prompt):
+        for property_id in range(101, 105):
+            if f"Hotel {property_id}" in prompt:
+                break
+        if property_id == 102:
+            return None
+        return {"name": f"Renamed {property_id}", "description": "Rewritten details"}
+
+    @patch("management_app.management.commands.generate_ratings_reviews.query_gemini_ratings_reviews")
+    @patch("management_app.management.commands.generate_summaries.query_gemini_summary")
+    @patch("management_app.management.commands.rewrite_hotels.query_gemini_api")
+    def test_hotels_flow_through_every_stage(self, mock_rewrite, mock_summary, mock_review):
+        mock_rewrite.side_effect = self.rewrite
+        mock_summary.return_value = {"summary": "A summary."}
+        mock_review.return_value = {"rating": 4.5, "review": "Great."}
+
+        call_command(
+            "run_pipeline",
+            rewrite_concurrency=2,
+            summary_concurrency=2,
+            review_concurrency=2,
+            queue_size=1,
+            no_cache=True,
+            stdout=StringIO(),
+            stderr=StringIO(),
+        )
+
+        # Later stages only see hotels after their rewrite was saved
+        self.assertEqual(mock_summary.call_count, 3)
+        for call in mock_summary.call_args_list + mock_review.call_args_list:
+            self.assertIn("Rewritten details", call.args[0])
+        self.assertEqual(
+            sorted(HotelSummary.objects.values_list("property_id", flat=True)),
+            [101, 103, 104],
+        )
+        self.assertEqual(
+            sorted(HotelRatingReview.objects.values_list("property_id", flat=True)),
+            [101, 103, 104],
+        )
+        summary = HotelSummary.objects.get(property_id=101)
+        self.assertEqual(
+            summary.source_fingerprint,
+            NewHotel.objects.get(property_id=101).content_fingerprint,
+        )
+
+    @patch("management_app.management.commands.generate_ratings_reviews.query_gemini_ratings_reviews")
+    @patch("management_app.management.commands.generate_summaries.query_gemini_summary")
+    @patch("management_app.management.commands.rewrite_hotels.query_gemini_api")
+    def test_each_stage_records_its_own_run(self, mock_rewrite, mock_summary, mock_review):
+        mock_rewrite.side_effect = self.rewrite
+        mock_summary.return_value = {"summary": "A summary."}
+        mock_review.return_value = {"rating": 4.5, "review": "Great."}
+
+        call_command("run_pipeline", no_cache=True, stdout=StringIO(), stderr=StringIO())
+
+        runs = {run.command: run for run in GenerationRun.objects.all()}
+        self.assertEqual(
+            set(runs), {"rewrite_hotels", "generate_summaries", "generate_ratings_reviews"}
+        )
+        self.assertEqual(
+            runs["rewrite_hotels"].tasks.get(property_id=102).status, "failed"
+        )
+        # The hotel that failed its rewrite is left pending in the later runs
+        for command in ("generate_summaries", "generate_ratings_reviews"):
+            self.assertEqual(
+                list(runs[command].tasks.filter(status="pending").values_list("property_id", flat=True)),
+                [102],
+            )
+        self.assertEqual(
+            list(DeadLetter.objects.values_list("command", "property_id")),
+            [("rewrite_hotels", 102)],
+        )
+
+    def test_queue_size_must_be_positive(self):
+        with self.assertRaises(CommandError):
+            call_command("run_pipeline", queue_size=0)
+
+
+class ProfilingTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_every_command_accepts_profile(self):
+        for name in get_commands():
+            if get_commands()[name] != "management_app":
+                continue
+            command = load_command_class("management_app", name)
+            options = command.create_parser("manage.py", name).parse_args(["--profile"])
+            self.assertTrue(options.profile, name)
+
+    @patch("management_app.management.commands.generate_summaries.query_gemini_summary")
+    def test_profile_option_writes_report_and_files(self, mock_query_gemini_summary):
+        mock_query_gemini_summary.return_value = {"summary": "A summary."}
+        for property_id in (101, 102):
+            NewHotel.objects.create(
+                property_id=property_id,
+                name=f"Hotel {property_id}",
+                description="Details",
+                location="Location",
+                latitude=12.34,
+                longitude=56.78,
+                city_name="City",
+            )
+        stdout = StringIO()
+
+        call_command(
+            "generate_summaries",
+            profile=True,
+            profile_dir=self.directory,
+            no_cache=True,
+            stdout=stdout,
+        )
+
+        output = stdout.getvalue()
+        self.assertIn("Profile written to", output)
+        self.assertRegex(output, r"Prompt build +[0-9.]+s +[0-9.]+%  \(2 calls\)")
+        self.assertRegex(output, r"DB write +[0-9.]+s +[0-9.]+%  \([1-9][0-9]* calls\)")
+        self.assertIn("Top 20 functions by cumulative time", output)
+
+        files = sorted(os.listdir(self.directory))
+        self.assertEqual(len(files), 2)
+        collapsed, stats = (os.path.join(self.directory, name) for name in files)
+        self.assertTrue(stats.startswith(os.path.join(self.directory, "generate_summaries-")))
+        self.assertTrue(stats.endswith(".pstats"))
+        self.assertGreater(pstats.Stats(stats).total_calls, 0)
+        with open(collapsed) as f:
+            for line in f:
+                self.assertRegex(line, r"^\S+ \d+$")
+
+    def test_sampler_collapses_every_thread(self):
+        def busy():
+            time.sleep(0.05)
+
+        with Profiler(os.path.join(self.directory, "run"), interval=0.001) as profiler:
+            worker = threading.Thread(target=busy, name="hotel worker")
+            worker.start()
+            with phase("http"):
+                worker.join()
+
+        self.assertTrue(
+            any(
+                stack.startswith("hotel_worker;") and stack.endswith("tests.py:busy")
+                for stack in profiler.stacks
+            )
+        )
+        self.assertEqual(profiler.phases["http"][1], 1)
+        self.assertGreaterEqual(profiler.phases["http"][0], 0.04)
+
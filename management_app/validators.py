@@ -0,0 +1,47 @@
+# Content rules each task's answer must follow before it is written. They run
+# in the parsers (utils.py), so a broken answer is sent back to the model with
+# the reason (see GeminiClient.generate) instead of reaching the database.
+
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from management_app.models import HotelRatingReview
+from management_app.schemas import MalformedResponse
+
+MAX_WORDS = 100  # Length limit the prompts ask for
+MIN_RATING = 0
+MAX_RATING = 5
+
+
+def check_word_limit(result, field, limit=MAX_WORDS):
+    words = len(result[field].split())
+    if words > limit:
+        raise MalformedResponse(f"{field} has {words} words, the limit is {limit}")
+
+
+def check_rating(result):
+    rating = result["rating"]
+    if not MIN_RATING <= rating <= MAX_RATING:
+        raise MalformedResponse(
+            f"rating {rating} is outside the range {MIN_RATING}-{MAX_RATING}"
+        )
+    # Must also fit hotel_ratings_reviews.rating (max_digits=3, decimal_places=2)
+    try:
+        HotelRatingReview._meta.get_field("rating").clean(Decimal(str(rating)), None)
+    except ValidationError as e:
+        raise MalformedResponse(f"rating {rating} is invalid: {' '.join(e.messages)}")
+
+
+def validate_name_description(result):
+    check_word_limit(result, "description")
+
+
+def validate_rating_review(result):
+    check_rating(result)
+    check_word_limit(result, "review")
+
+
+def validate_enrichment(result):
+    check_word_limit(result, "description")
+    check_rating(result)
+    check_word_limit(result, "review")
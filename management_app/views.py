@@ -1,3 +1,9 @@
-from django.shortcuts import render
+from django.http import HttpResponse
+from management_app.metrics import CONTENT_TYPE, REGISTRY
+from management_app.runs import record_pending_tasks
 
-# Create your views here.
+
+def metrics(request):
+    """Prometheus metrics of this process, with the pending hotels of every run."""
+    record_pending_tasks()
+    return HttpResponse(REGISTRY.render(), content_type=CONTENT_TYPE)
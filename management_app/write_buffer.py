@@ -0,0 +1,78 @@
+import time
+
+from django.db import DatabaseError, transaction
+
+
+class WriteBuffer:
+    """
+    Write-behind buffer for rows keyed by ``property_id``.
+
+    Each ``add`` queues a row that replaces the hotel's existing one. Rows
+    are written every ``max_rows`` hotels or ``max_seconds`` seconds with one
+    ``INSERT ... ON CONFLICT (property_id) DO UPDATE`` (``objects.upsert``).
+    Use it as a context manager so whatever is still buffered is written
+    when the run ends or is interrupted.
+
+    ``on_error(obj, label, error)`` is called for a row that could not be
+    written, and ``on_flush()`` after every flush.
+    """
+
+    def __init__(
+        self,
+        model,
+        max_rows=500,
+        max_seconds=5.0,
+        on_error=None,
+        on_flush=None,
+        clock=time.monotonic,
+    ):
+        self.model = model
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self.on_error = on_error
+        self.on_flush = on_flush
+        self._clock = clock
+        self._entries = []
+        self._last_flush = clock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+    def add(self, obj, label=None):
+        self._entries.append((obj, label))
+        if (
+            len(self._entries) >= self.max_rows
+            or self._clock() - self._last_flush >= self.max_seconds
+        ):
+            self.flush()
+
+    def flush(self):
+        # A later hotel with the same property_id replaces the earlier row
+        entries = list({obj.property_id: (obj, label) for obj, label in self._entries}.values())
+        self._entries = []
+        self._last_flush = self._clock()
+        if not entries:
+            return
+
+        try:
+            with transaction.atomic():
+                self.model.objects.upsert([obj for obj, _ in entries])
+        except DatabaseError:
+            # One bad row fails the whole batch: write row by row to isolate it
+            for entry in entries:
+                self._write_one(*entry)
+
+        if self.on_flush is not None:
+            self.on_flush()
+
+    def _write_one(self, obj, label):
+        try:
+            with transaction.atomic():
+                self.model.objects.upsert([obj])
+        except DatabaseError as e:
+            if self.on_error is None:
+                raise
+            self.on_error(obj, label, e)
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import json
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "management_app.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -132,3 +135,80 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# Gemini API
+# All Gemini calls in a process share one pooled client (management_app/gemini.py).
+# Each endpoint (API key and model) has a rate limiter (management_app/rate_limit.py)
+# that paces requests to stay within the quota of the API key.
+
+GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "")
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-1.5-flash")
+
+# Optional pool of endpoints to spread requests over, as a JSON list such as
+# [{"api_key": "...", "model": "gemini-1.5-flash", "requests_per_minute": 15,
+#   "tokens_per_minute": 1000000, "weight": 1}, ...]. Each endpoint has its own
+# quota; missing keys fall back to the settings below. When empty, the single
+# GEMINI_API_KEY / GEMINI_MODEL endpoint is used.
+GEMINI_ENDPOINTS = json.loads(os.environ.get("GEMINI_ENDPOINTS", "[]"))
+
+# Seconds to wait for a connection and for the response, and the number of
+# keep-alive connections kept open (should be >= the --concurrency in use)
+GEMINI_CONNECT_TIMEOUT = float(os.environ.get("GEMINI_CONNECT_TIMEOUT", 5))
+GEMINI_READ_TIMEOUT = float(os.environ.get("GEMINI_READ_TIMEOUT", 60))
+GEMINI_POOL_SIZE = int(os.environ.get("GEMINI_POOL_SIZE", 32))
+
+GEMINI_REQUESTS_PER_MINUTE = int(os.environ.get("GEMINI_REQUESTS_PER_MINUTE", 15))
+GEMINI_TOKENS_PER_MINUTE = int(os.environ.get("GEMINI_TOKENS_PER_MINUTE", 1000000))
+
+# Failed calls (timeouts, 429 and 5xx) are tried up to GEMINI_MAX_ATTEMPTS times,
+# waiting a random time up to GEMINI_RETRY_BASE_DELAY * 2^attempt seconds (capped
+# at GEMINI_RETRY_MAX_DELAY). After GEMINI_CIRCUIT_FAILURE_THRESHOLD server errors
+# in a row, all calls pause for GEMINI_CIRCUIT_RESET_TIMEOUT seconds.
+GEMINI_MAX_ATTEMPTS = int(os.environ.get("GEMINI_MAX_ATTEMPTS", 4))
+GEMINI_RETRY_BASE_DELAY = float(os.environ.get("GEMINI_RETRY_BASE_DELAY", 1))
+GEMINI_RETRY_MAX_DELAY = float(os.environ.get("GEMINI_RETRY_MAX_DELAY", 30))
+GEMINI_CIRCUIT_FAILURE_THRESHOLD = int(
+    os.environ.get("GEMINI_CIRCUIT_FAILURE_THRESHOLD", 5)
+)
+GEMINI_CIRCUIT_RESET_TIMEOUT = float(os.environ.get("GEMINI_CIRCUIT_RESET_TIMEOUT", 30))
+
+# Hedged requests: a call still unanswered after the GEMINI_HEDGE_PERCENTILE
+# latency of recent calls is sent again, for at most GEMINI_HEDGE_BUDGET of all
+# requests (0.05 = 5%). Set the percentile to 0 to disable hedging.
+GEMINI_HEDGE_PERCENTILE = float(os.environ.get("GEMINI_HEDGE_PERCENTILE", 0))
+GEMINI_HEDGE_BUDGET = float(os.environ.get("GEMINI_HEDGE_BUDGET", 0.05))
+
+# Number of times a reply that fails validation (schema, word limits, rating
+# range) is sent back to the model with the reason before the hotel fails.
+GEMINI_MAX_REPAIRS = int(os.environ.get("GEMINI_MAX_REPAIRS", 2))
+
+# Context caching: each task's system instruction is registered once as Gemini
+# cached content, kept for GEMINI_CONTEXT_CACHE_TTL seconds, and referenced by
+# every request instead of being resent. Set to 0 to send it inline every time.
+GEMINI_CONTEXT_CACHE_TTL = int(os.environ.get("GEMINI_CONTEXT_CACHE_TTL", 0))
+
+# Fraction of full Gemini responses logged for debugging (0 = none, 1 = all)
+GEMINI_DEBUG_SAMPLE_RATE = float(os.environ.get("GEMINI_DEBUG_SAMPLE_RATE", 0))
+
+# Management commands push their metrics to this Prometheus Pushgateway when
+# they end (e.g. http://pushgateway:9091). Empty to not push.
+METRICS_PUSHGATEWAY_URL = os.environ.get("METRICS_PUSHGATEWAY_URL", "")
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "management_app.gemini": {"handlers": ["console"], "level": "DEBUG"},
+    },
+}
+
+# Cache of Gemini responses for generate_summaries / generate_ratings_reviews.
+# Entries expire after LLM_CACHE_TTL seconds; the least recently used entries
+# beyond LLM_CACHE_MAX_ENTRIES are evicted at the end of each command.
+
+LLM_CACHE_TTL = int(os.environ.get("LLM_CACHE_TTL", 30 * 24 * 60 * 60))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 100000))